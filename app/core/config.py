@@ -26,6 +26,65 @@ class Settings(BaseSettings):
     LOKI_URL: Optional[str] = None
     REDIS_URL: str = ""
 
+    # sql — self-join purchase_units на каждый вызов,
+    # aggregate — предагрегированные item_counts / item_pair_counts,
+    # sparse — CSR-массивы NumPy в памяти процесса,
+    # neighbors — предрассчитанные top-K соседей товара (item_neighbors),
+    # lsh — sparse-движок, но точный Lift только для кандидатов MinHash/LSH,
+    # decayed — aggregate по счетчикам с экспоненциальным затуханием,
+    # matview — материализованное представление lift_knowledge_base (PostgreSQL)
+    RECOMMENDATION_ENGINE: Literal[
+        "sql", "aggregate", "sparse", "neighbors", "lsh", "decayed", "matview"
+    ] = "aggregate"
+    # Период полураспада веса покупки для движка decayed
+    DECAY_HALF_LIFE_DAYS: float = 90
+    # MinHash/LSH: больше полос и меньше строк в полосе — выше полнота,
+    # но больше кандидатов и медленнее
+    LSH_BANDS: int = 32
+    LSH_ROWS_PER_BAND: int = 4
+    LSH_MAX_BUCKET_SIZE: int = 1000
+    # Сколько соседей по Lift хранить на товар и с какого pair_cnt
+    NEIGHBORS_TOP_K: int = 50
+    NEIGHBORS_MIN_PAIR_COUNT: int = 1
+    # Через сколько секунд API перечитывает индекс соседей в память
+    NEIGHBOR_INDEX_TTL_SECONDS: int = 300
+    # Каталог mmap-снимков индекса соседей, общий для API и воркеров
+    # (None — индекс читается из БД в память каждого процесса)
+    MODEL_SNAPSHOT_DIR: str | None = None
+    # Бюджет времени GET /recommendations/live, после него — сохраненные рекомендации
+    LIVE_RECOMMENDATIONS_TIMEOUT_MS: int = 50
+    # Сколько последних купленных товаров сливает live-расчет (объем работы
+    # на запрос не растет с длиной истории)
+    LIVE_RECOMMENDATIONS_MAX_HISTORY: int = 200
+    # Через сколько секунд sparse-движок перечитывает purchase_units
+    SPARSE_ENGINE_TTL_SECONDS: int = 300
+    # Водяной знак генерации — последняя покупка, оформленная раньше чем
+    # столько секунд назад: id выдаются до коммита, и более свежая покупка
+    # с меньшим id еще может быть не закоммичена
+    PURCHASE_WATERMARK_LAG_SECONDS: int = 60
+    # Сколько рекомендаций хранить на пользователя
+    RECOMMENDATIONS_TOP_N: int = 10
+    # На сколько строк разбит общий счетчик покупок (меньше блокировок при checkout)
+    PURCHASE_COUNTER_SHARDS: int = 16
+    # Сколько популярных товаров хранить в целом и на категорию
+    POPULAR_ITEMS_TOP_N: int = 50
+    # Кеш GET /recommendations/: LRU в процессе + Redis (если задан REDIS_URL)
+    RECOMMENDATIONS_CACHE_SIZE: int = 10_000
+    RECOMMENDATIONS_CACHE_LOCAL_TTL_SECONDS: int = 10
+    RECOMMENDATIONS_CACHE_TTL_SECONDS: int = 600
+    # Один долгоживущий event loop и пул соединений на процесс Celery-воркера
+    CELERY_PERSISTENT_LOOP: bool = True
+    # Дедупликация POST /recommendations/generate: сколько держать блокировку
+    # поставленной задачи и сколько считать готовый результат свежим
+    GENERATION_LOCK_TTL_SECONDS: int = 600
+    GENERATION_FRESHNESS_SECONDS: int = 300
+    # min_pair_count для ночного пересчета рекомендаций всех пользователей
+    NIGHTLY_MIN_PAIR_COUNT: int = 5
+    # Процессов для построения матрицы Lift при bulk-пересчете (0 — по числу ядер)
+    RECOMMENDATIONS_BUILD_WORKERS: int = 1
+    # Сколько map-задач делят диапазон purchase_id при пересчете совместных покупок
+    COOCCURRENCE_MAP_PARTITIONS: int = 8
+
     model_config = SettingsConfigDict(
         env_file=(BASE_DIR / ".env", BASE_DIR / ".docker.env"),
         env_file_encoding="utf-8",
@@ -1,7 +1,13 @@
 import os
+import threading
 from typing import Any
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.pool import NullPool
 
@@ -12,17 +18,65 @@ IS_WORKER = os.getenv("IS_CELERY_WORKER") == "True"
 DATABASE_URL = settings.DATABASE_URL
 DATABASE_PARAMS: dict[str, Any] = {"pool_size": 10, "max_overflow": 20}
 
-if IS_WORKER or settings.MODE == "TEST":
+if IS_WORKER:
+    # Поток воркера выполняет одну задачу за раз в своем постоянном event loop
+    # со своим движком (app.utils.worker_loop), поэтому пул небольшой,
+    # но переиспользуемый.
+    DATABASE_PARAMS = {"pool_size": 2, "max_overflow": 2, "pool_pre_ping": True}
+    if not settings.CELERY_PERSISTENT_LOOP:
+        # asyncio.run на каждую задачу — соединения нельзя держать между циклами
+        DATABASE_PARAMS = {"poolclass": NullPool}
+
+if settings.MODE == "TEST":
     DATABASE_PARAMS = {"poolclass": NullPool}
 
 
-engine = create_async_engine(DATABASE_URL, **DATABASE_PARAMS)
+def create_engine() -> AsyncEngine:
+    return create_async_engine(DATABASE_URL, **DATABASE_PARAMS)
+
+
+engine = create_engine()
 
 async_session_maker = async_sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
 )
 
 
+# Движок и фабрика сессий потока с постоянным event loop воркера
+_thread = threading.local()
+
+
+def get_session_maker() -> async_sessionmaker[AsyncSession]:
+    """
+    Фабрика сессий текущего потока: своя у потока воркера с постоянным
+    event loop (bind_thread_engine), иначе общая async_session_maker.
+    :return:
+    """
+    return getattr(_thread, "session_maker", async_session_maker)
+
+
+def bind_thread_engine() -> AsyncEngine:
+    """
+    Создать движок для текущего потока и переключить на него его фабрику
+    сессий. Соединения пула привязаны к event loop, а у каждого потока
+    воркера (после fork или в пуле threads) свой цикл.
+    :return:
+    """
+    thread_engine = create_engine()
+    _thread.session_maker = async_sessionmaker(
+        thread_engine, expire_on_commit=False, class_=AsyncSession
+    )
+    return thread_engine
+
+
+def unbind_thread_engine() -> None:
+    """
+    Вернуть текущему потоку общую фабрику сессий.
+    :return:
+    """
+    _thread.__dict__.pop("session_maker", None)
+
+
 class Base(DeclarativeBase):
     def __repr__(self) -> str:
         cols = []
@@ -0,0 +1,58 @@
+"""Decayed cooccurrence counts
+
+Revision ID: 9e2d5a7c4f18
+Revises: 4b8e1f6a2c53
+Create Date: 2026-10-18 17:41:09.582114
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9e2d5a7c4f18"
+down_revision: Union[str, Sequence[str], None] = "4b8e1f6a2c53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "item_counts",
+        sa.Column("decayed_cnt", sa.Float(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "item_pair_counts",
+        sa.Column("decayed_pair_cnt", sa.Float(), server_default="0", nullable=False),
+    )
+    op.create_table(
+        "cooccurrence_decay",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("total_transactions", sa.Float(), nullable=False),
+        sa.Column(
+            "decayed_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # Без затухания до первого rebuild_cooccurrence_task: вес всех покупок — 1
+    op.execute("UPDATE item_counts SET decayed_cnt = total_cnt")
+    op.execute("UPDATE item_pair_counts SET decayed_pair_cnt = pair_cnt")
+    op.execute(
+        """
+        INSERT INTO cooccurrence_decay (id, total_transactions)
+        SELECT 1, count(*) FROM purchases
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("cooccurrence_decay")
+    op.drop_column("item_pair_counts", "decayed_pair_cnt")
+    op.drop_column("item_counts", "decayed_cnt")
@@ -0,0 +1,46 @@
+"""Dirty items
+
+Revision ID: 6a1c3e5f7b29
+Revises: 2c7f0b9e8d41
+Create Date: 2026-10-18 19:04:12.660318
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6a1c3e5f7b29"
+down_revision: Union[str, Sequence[str], None] = "2c7f0b9e8d41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "dirty_items",
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "marked_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["item_id"],
+            ["items.id"],
+        ),
+        sa.PrimaryKeyConstraint("item_id"),
+    )
+    op.create_index(
+        op.f("ix_purchase_units_item_id"), "purchase_units", ["item_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_purchase_units_item_id"), table_name="purchase_units")
+    op.drop_table("dirty_items")
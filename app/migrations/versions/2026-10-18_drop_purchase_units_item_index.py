@@ -0,0 +1,30 @@
+"""Drop purchase_units item_id index
+
+Revision ID: 2e8a5c7f4b90
+Revises: 9d3f6b2a8c15
+Create Date: 2026-10-18 22:41:19.204655
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2e8a5c7f4b90"
+down_revision: Union[str, Sequence[str], None] = "9d3f6b2a8c15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Покупатели товаров ищутся по user_item_history, индекс не используется
+    op.drop_index(op.f("ix_purchase_units_item_id"), table_name="purchase_units")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(
+        op.f("ix_purchase_units_item_id"), "purchase_units", ["item_id"], unique=False
+    )
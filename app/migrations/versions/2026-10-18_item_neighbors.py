@@ -0,0 +1,44 @@
+"""Item neighbors
+
+Revision ID: 4b8e1f6a2c53
+Revises: 7d3c6b1e0f92
+Create Date: 2026-10-18 16:02:47.318205
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4b8e1f6a2c53"
+down_revision: Union[str, Sequence[str], None] = "7d3c6b1e0f92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "item_neighbors",
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("neighbor_id", sa.Integer(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=False),
+        sa.Column("lift", sa.Float(), nullable=False),
+        sa.Column("pair_cnt", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["item_id"],
+            ["items.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["neighbor_id"],
+            ["items.id"],
+        ),
+        sa.PrimaryKeyConstraint("item_id", "neighbor_id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("item_neighbors")
@@ -0,0 +1,70 @@
+"""Item pair counts
+
+Revision ID: 5c1d8e2a7f40
+Revises: bf15718c0e32
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5c1d8e2a7f40"
+down_revision: Union[str, Sequence[str], None] = "bf15718c0e32"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "item_counts",
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("total_cnt", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["item_id"],
+            ["items.id"],
+        ),
+        sa.PrimaryKeyConstraint("item_id"),
+    )
+    op.create_table(
+        "item_pair_counts",
+        sa.Column("id_a", sa.Integer(), nullable=False),
+        sa.Column("id_b", sa.Integer(), nullable=False),
+        sa.Column("pair_cnt", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["id_a"],
+            ["items.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["id_b"],
+            ["items.id"],
+        ),
+        sa.PrimaryKeyConstraint("id_a", "id_b"),
+    )
+    # Заполняем агрегаты по уже существующим покупкам
+    op.execute(
+        """
+        INSERT INTO item_counts (item_id, total_cnt)
+        SELECT item_id, count(id) FROM purchase_units GROUP BY item_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO item_pair_counts (id_a, id_b, pair_cnt)
+        SELECT pu1.item_id, pu2.item_id, count(pu1.id)
+        FROM purchase_units pu1
+        JOIN purchase_units pu2 ON pu1.purchase_id = pu2.purchase_id
+        WHERE pu1.item_id != pu2.item_id
+        GROUP BY pu1.item_id, pu2.item_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("item_pair_counts")
+    op.drop_table("item_counts")
@@ -0,0 +1,64 @@
+"""Lift knowledge base materialized view
+
+Revision ID: 5b9e7c3d1a64
+Revises: 8d4a2f6c1e93
+Create Date: 2026-10-18 20:48:16.392570
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5b9e7c3d1a64"
+down_revision: Union[str, Sequence[str], None] = "8d4a2f6c1e93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Тот же расчет, что CTE knowledge_base в PurchaseUnitRepository
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW lift_knowledge_base AS
+        WITH item_counts AS (
+            SELECT item_id, count(id) AS total_cnt
+            FROM purchase_units
+            GROUP BY item_id
+        ),
+        totals AS (
+            SELECT count(id) AS total_transactions FROM purchases
+        )
+        SELECT
+            pu1.item_id AS id_a,
+            pu2.item_id AS id_b,
+            count(pu1.id) AS pair_cnt,
+            CAST(count(pu1.id) * totals.total_transactions AS DOUBLE PRECISION)
+                / (ic1.total_cnt * ic2.total_cnt) AS lift
+        FROM purchase_units AS pu1
+        JOIN purchase_units AS pu2 ON pu1.purchase_id = pu2.purchase_id
+        JOIN item_counts AS ic1 ON ic1.item_id = pu1.item_id
+        JOIN item_counts AS ic2 ON ic2.item_id = pu2.item_id
+        CROSS JOIN totals
+        WHERE pu1.item_id != pu2.item_id
+        GROUP BY
+            pu1.item_id,
+            pu2.item_id,
+            ic1.total_cnt,
+            ic2.total_cnt,
+            totals.total_transactions
+        WITH DATA
+        """
+    )
+    # Уникальный индекс обязателен для REFRESH ... CONCURRENTLY
+    op.execute(
+        "CREATE UNIQUE INDEX ux_lift_knowledge_base_pair "
+        "ON lift_knowledge_base (id_a, id_b)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS lift_knowledge_base")
@@ -0,0 +1,39 @@
+"""Model watermarks
+
+Revision ID: 7c2e4a9f1b36
+Revises: 5b9e7c3d1a64
+Create Date: 2026-10-18 21:37:52.118402
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7c2e4a9f1b36"
+down_revision: Union[str, Sequence[str], None] = "5b9e7c3d1a64"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "model_watermarks",
+        sa.Column("engine", sa.String(length=16), nullable=False),
+        sa.Column("purchase_watermark", sa.Integer(), nullable=False),
+        sa.Column(
+            "built_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("engine"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("model_watermarks")
@@ -0,0 +1,64 @@
+"""Popular items
+
+Revision ID: 2c7f0b9e8d41
+Revises: 9e2d5a7c4f18
+Create Date: 2026-10-18 18:26:53.104732
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2c7f0b9e8d41"
+down_revision: Union[str, Sequence[str], None] = "9e2d5a7c4f18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "popular_items",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("category_id", sa.Integer(), nullable=True),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("rank", sa.Integer(), nullable=False),
+        sa.Column("purchase_cnt", sa.Integer(), nullable=False),
+        sa.Column(
+            "refreshed_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["category_id"],
+            ["categories.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["item_id"],
+            ["items.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_popular_items_category_rank",
+        "popular_items",
+        ["category_id", "rank"],
+        unique=False,
+    )
+    op.add_column(
+        "recommendations",
+        sa.Column(
+            "source", sa.String(length=16), server_default="lift", nullable=False
+        ),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("recommendations", "source")
+    op.drop_index("ix_popular_items_category_rank", table_name="popular_items")
+    op.drop_table("popular_items")
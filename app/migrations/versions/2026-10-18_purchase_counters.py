@@ -0,0 +1,57 @@
+"""Purchase counters
+
+Revision ID: 8d4a2f6c1e93
+Revises: 3f8b6d2a9c75
+Create Date: 2026-10-18 20:11:30.847205
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d4a2f6c1e93"
+down_revision: Union[str, Sequence[str], None] = "3f8b6d2a9c75"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "purchase_counters",
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("purchase_cnt", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("shard"),
+    )
+    op.create_table(
+        "user_purchase_counts",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("purchase_cnt", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    # Начальные значения — весь итог в нулевом шарде, как после сверки
+    op.execute(
+        """
+        INSERT INTO purchase_counters (shard, purchase_cnt)
+        SELECT 0, count(*) FROM purchases
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO user_purchase_counts (user_id, purchase_cnt)
+        SELECT user_id, count(*) FROM purchases GROUP BY user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("user_purchase_counts")
+    op.drop_table("purchase_counters")
@@ -0,0 +1,60 @@
+"""Ranked recommendations
+
+Revision ID: 2a7f5d90c8e1
+Revises: 9e4b27c1d3a6
+Create Date: 2026-10-18 14:05:52.104377
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2a7f5d90c8e1"
+down_revision: Union[str, Sequence[str], None] = "9e4b27c1d3a6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint("uq_recommendations_user", "recommendations", type_="unique")
+    # Существующие рекомендации становятся первой позицией списка
+    op.add_column(
+        "recommendations",
+        sa.Column("rank", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "recommendations",
+        sa.Column("score", sa.Float(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "recommendations",
+        sa.Column(
+            "generated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    op.alter_column("recommendations", "rank", server_default=None)
+    op.alter_column("recommendations", "score", server_default=None)
+    op.create_unique_constraint(
+        "uq_recommendations_user_rank", "recommendations", ["user_id", "rank"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(
+        "uq_recommendations_user_rank", "recommendations", type_="unique"
+    )
+    op.execute("DELETE FROM recommendations WHERE rank > 1")
+    op.drop_column("recommendations", "generated_at")
+    op.drop_column("recommendations", "score")
+    op.drop_column("recommendations", "rank")
+    op.create_unique_constraint(
+        "uq_recommendations_user", "recommendations", ["user_id"]
+    )
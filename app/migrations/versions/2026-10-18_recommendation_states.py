@@ -0,0 +1,68 @@
+"""Recommendation states
+
+Revision ID: 7d3c6b1e0f92
+Revises: 2a7f5d90c8e1
+Create Date: 2026-10-18 15:31:18.660214
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7d3c6b1e0f92"
+down_revision: Union[str, Sequence[str], None] = "2a7f5d90c8e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "recommendation_states",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("min_pair_count", sa.Integer(), nullable=False),
+        sa.Column("purchase_watermark", sa.Integer(), nullable=False),
+        sa.Column(
+            "generated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.add_column(
+        "item_pair_counts",
+        sa.Column("last_purchase_id", sa.Integer(), nullable=True),
+    )
+    op.execute(
+        """
+        UPDATE item_pair_counts AS p
+        SET last_purchase_id = src.last_purchase_id
+        FROM (
+            SELECT pu1.item_id AS id_a, pu2.item_id AS id_b,
+                   max(pu1.purchase_id) AS last_purchase_id
+            FROM purchase_units pu1
+            JOIN purchase_units pu2 ON pu1.purchase_id = pu2.purchase_id
+            WHERE pu1.item_id != pu2.item_id
+            GROUP BY pu1.item_id, pu2.item_id
+        ) AS src
+        WHERE p.id_a = src.id_a AND p.id_b = src.id_b
+        """
+    )
+    op.create_index(
+        op.f("ix_purchases_user_id"), "purchases", ["user_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_purchases_user_id"), table_name="purchases")
+    op.drop_column("item_pair_counts", "last_purchase_id")
+    op.drop_table("recommendation_states")
@@ -0,0 +1,36 @@
+"""Recommendations unique user
+
+Revision ID: 9e4b27c1d3a6
+Revises: 5c1d8e2a7f40
+Create Date: 2026-10-18 12:40:03.571922
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4b27c1d3a6"
+down_revision: Union[str, Sequence[str], None] = "5c1d8e2a7f40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Оставляем по одной (последней) рекомендации на пользователя
+    op.execute(
+        """
+        DELETE FROM recommendations
+        WHERE id NOT IN (SELECT max(id) FROM recommendations GROUP BY user_id)
+        """
+    )
+    op.create_unique_constraint(
+        "uq_recommendations_user", "recommendations", ["user_id"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint("uq_recommendations_user", "recommendations", type_="unique")
@@ -0,0 +1,53 @@
+"""Sharded decayed total
+
+Revision ID: 9d3f6b2a8c15
+Revises: 7c2e4a9f1b36
+Create Date: 2026-10-18 22:14:06.530917
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9d3f6b2a8c15"
+down_revision: Union[str, Sequence[str], None] = "7c2e4a9f1b36"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "purchase_counters",
+        sa.Column("decayed_cnt", sa.Float(), server_default="0", nullable=False),
+    )
+    # Затухающий итог переносится в нулевой шард
+    op.execute(
+        """
+        INSERT INTO purchase_counters (shard, purchase_cnt, decayed_cnt)
+        SELECT 0, 0, total_transactions FROM cooccurrence_decay WHERE id = 1
+        ON CONFLICT (shard) DO UPDATE SET decayed_cnt = EXCLUDED.decayed_cnt
+        """
+    )
+    op.drop_column("cooccurrence_decay", "total_transactions")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column(
+        "cooccurrence_decay",
+        sa.Column("total_transactions", sa.Float(), server_default="0", nullable=False),
+    )
+    op.execute(
+        """
+        UPDATE cooccurrence_decay
+        SET total_transactions = (
+            SELECT coalesce(sum(decayed_cnt), 0) FROM purchase_counters
+        )
+        WHERE id = 1
+        """
+    )
+    op.drop_column("purchase_counters", "decayed_cnt")
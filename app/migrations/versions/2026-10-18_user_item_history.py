@@ -0,0 +1,60 @@
+"""User item history
+
+Revision ID: 3f8b6d2a9c75
+Revises: 6a1c3e5f7b29
+Create Date: 2026-10-18 19:37:45.218964
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f8b6d2a9c75"
+down_revision: Union[str, Sequence[str], None] = "6a1c3e5f7b29"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_item_history",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("purchase_cnt", sa.Integer(), nullable=False),
+        sa.Column("last_purchased_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["item_id"],
+            ["items.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["users.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id", "item_id"),
+    )
+    op.create_index(
+        op.f("ix_user_item_history_item_id"),
+        "user_item_history",
+        ["item_id"],
+        unique=False,
+    )
+    op.execute(
+        """
+        INSERT INTO user_item_history
+            (user_id, item_id, purchase_cnt, last_purchased_at)
+        SELECT p.user_id, pu.item_id, count(DISTINCT p.id), max(p.created_at)
+        FROM purchase_units pu
+        JOIN purchases p ON p.id = pu.purchase_id
+        GROUP BY p.user_id, pu.item_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_user_item_history_item_id"), table_name="user_item_history")
+    op.drop_table("user_item_history")
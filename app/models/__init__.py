@@ -1,6 +1,25 @@
 from .carts import CartUnit  # noqa: F401
 from .categories import Category  # noqa: F401
+from .cooccurrence import (  # noqa: F401
+    CooccurrenceDecay,
+    DirtyItem,
+    ItemCount,
+    ItemNeighbor,
+    ItemPairCount,
+    LiftKnowledgeBase,
+    ModelWatermark,
+)
 from .items import Item  # noqa: F401
-from .purchases import Purchase, PurchaseUnit  # noqa: F401
-from .recommendations import Recommendation  # noqa: F401
+from .purchases import (  # noqa: F401
+    Purchase,
+    PurchaseCounter,
+    PurchaseUnit,
+    UserItemHistory,
+    UserPurchaseCount,
+)
+from .recommendations import (  # noqa: F401
+    PopularItem,
+    Recommendation,
+    RecommendationState,
+)
 from .users import User  # noqa: F401
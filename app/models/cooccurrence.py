@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, ForeignKey, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.database import Base
+
+
+class ItemCount(Base):
+    """
+    Сколько раз товар встречался в покупках (агрегат для расчета Lift).
+    """
+
+    __tablename__ = "item_counts"
+
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    total_cnt: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Счетчик с экспоненциальным затуханием (на момент CooccurrenceDecay.decayed_at)
+    decayed_cnt: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0.0, server_default="0"
+    )
+
+
+class ItemPairCount(Base):
+    """
+    Сколько раз пара товаров (id_a, id_b) встречалась в одной покупке.
+    Хранятся оба направления (A->B и B->A).
+    """
+
+    __tablename__ = "item_pair_counts"
+
+    id_a: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    id_b: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    pair_cnt: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    decayed_pair_cnt: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0.0, server_default="0"
+    )
+    # id последней покупки, изменившей счетчик (водяной знак свежести)
+    last_purchase_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+class CooccurrenceDecay(Base):
+    """
+    Общее состояние затухающих счетчиков (единственная строка id=1): момент,
+    к которому приведены все decayed-счетчики. Затухающее число покупок
+    шардировано вместе с обычным (PurchaseCounter.decayed_cnt).
+    """
+
+    __tablename__ = "cooccurrence_decay"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    decayed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class DirtyItem(Base):
+    """
+    Товар, чьи совместные покупки или соседи изменились с последней
+    точечной перегенерации рекомендаций.
+    """
+
+    __tablename__ = "dirty_items"
+
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    marked_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class LiftKnowledgeBase(Base):
+    """
+    База знаний Lift по всем парам товаров: в PostgreSQL — материализованное
+    представление (создается миграцией, обновляется REFRESH ... CONCURRENTLY),
+    поэтому autogenerate его пропускает (info["is_view"]). В тестах на SQLite
+    create_all делает из него обычную таблицу.
+    """
+
+    __tablename__ = "lift_knowledge_base"
+    __table_args__ = {"info": {"is_view": True}}
+
+    id_a: Mapped[int] = mapped_column(Integer, primary_key=True)
+    id_b: Mapped[int] = mapped_column(Integer, primary_key=True)
+    pair_cnt: Mapped[int] = mapped_column(Integer, nullable=False)
+    lift: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class ItemNeighbor(Base):
+    """
+    Top-K партнеров товара по Lift (индекс соседей): на товар хранится
+    не больше NEIGHBORS_TOP_K строк, rank — позиция партнера от 1.
+    """
+
+    __tablename__ = "item_neighbors"
+
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    neighbor_id: Mapped[int] = mapped_column(ForeignKey("items.id"), primary_key=True)
+    rank: Mapped[int] = mapped_column(Integer, nullable=False)
+    lift: Mapped[float] = mapped_column(Float, nullable=False)
+    pair_cnt: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class ModelWatermark(Base):
+    """
+    До какой покупки учтены данные предрассчитанной модели движка
+    (индекс соседей, база знаний Lift) на момент ее последней сборки.
+    """
+
+    __tablename__ = "model_watermarks"
+
+    engine: Mapped[str] = mapped_column(String(16), primary_key=True)
+    purchase_watermark: Mapped[int] = mapped_column(Integer, nullable=False)
+    built_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
@@ -4,7 +4,7 @@ from datetime import datetime
 from decimal import Decimal
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Numeric, func
+from sqlalchemy import DateTime, Float, ForeignKey, Integer, Numeric, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.database import Base
@@ -19,7 +19,9 @@ class Purchase(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     status: Mapped[str]
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"), nullable=False, index=True
+    )
     total_amount: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(
@@ -56,3 +58,51 @@ class PurchaseUnit(Base):
     item: Mapped["Item"] = relationship(  # noqa: F821
         "Item", back_populates="purchase_unit", lazy="selectin"
     )
+
+
+class UserItemHistory(Base):
+    """
+    Какие товары покупал пользователь: строка на пару (user_id, item_id),
+    обновляется при оформлении заказа. Индекс по item_id — обратный
+    индекс товар -> покупатели.
+    """
+
+    __tablename__ = "user_item_history"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    item_id: Mapped[int] = mapped_column(
+        ForeignKey("items.id"), primary_key=True, index=True
+    )
+    # В скольких заказах пользователя встречался товар
+    purchase_cnt: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_purchased_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+
+
+class PurchaseCounter(Base):
+    """
+    Общее число покупок, разбитое на шарды по purchase_id: параллельные
+    checkout обновляют разные строки. Итог — сумма по шардам.
+    decayed_cnt — то же число с экспоненциальным затуханием
+    (на момент CooccurrenceDecay.decayed_at).
+    """
+
+    __tablename__ = "purchase_counters"
+
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    purchase_cnt: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    decayed_cnt: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0.0, server_default="0"
+    )
+
+
+class UserPurchaseCount(Base):
+    """
+    Число покупок пользователя, обновляется при оформлении заказа.
+    """
+
+    __tablename__ = "user_purchase_counts"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    purchase_cnt: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
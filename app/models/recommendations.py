@@ -1,4 +1,15 @@
-from sqlalchemy import ForeignKey, Integer
+from datetime import datetime
+
+from sqlalchemy import (
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+    func,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.database import Base
@@ -7,6 +18,59 @@ from app.db.database import Base
 class Recommendation(Base):
     __tablename__ = "recommendations"
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "rank", name="uq_recommendations_user_rank"),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), nullable=True)
+    rank: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    score: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    # lift — по совместным покупкам, popular — запасной список популярных товаров
+    source: Mapped[str] = mapped_column(
+        String(16), nullable=False, default="lift", server_default="lift"
+    )
+    generated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class PopularItem(Base):
+    """
+    Самые покупаемые товары: в целом (category_id IS NULL) и по категориям,
+    с учетом товаров всех дочерних категорий. Запасной список рекомендаций
+    для пользователей без истории или без значимых пар.
+    """
+
+    __tablename__ = "popular_items"
+
+    __table_args__ = (Index("ix_popular_items_category_rank", "category_id", "rank"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    category_id: Mapped[int | None] = mapped_column(
+        ForeignKey("categories.id"), nullable=True
+    )
+    item_id: Mapped[int] = mapped_column(ForeignKey("items.id"), nullable=False)
+    rank: Mapped[int] = mapped_column(Integer, nullable=False)
+    purchase_cnt: Mapped[int] = mapped_column(Integer, nullable=False)
+    refreshed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
+class RecommendationState(Base):
+    """
+    С какими входными данными последний раз считались рекомендации пользователя.
+    """
+
+    __tablename__ = "recommendation_states"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    min_pair_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Последняя покупка, оформленная за PURCHASE_WATERMARK_LAG_SECONDS
+    # до генерации (все покупки с меньшим id к тому моменту закоммичены)
+    purchase_watermark: Mapped[int] = mapped_column(Integer, nullable=False)
+    generated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
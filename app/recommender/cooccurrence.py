@@ -0,0 +1,132 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from itertools import permutations
+from typing import Iterable, Mapping
+
+
+def basket_pair_counts(item_counts: Mapping[int, int]) -> Counter[tuple[int, int]]:
+    """
+    Пары товаров одной покупки (оба направления) с числом совместных позиций.
+    :param item_counts: {item_id: сколько раз товар встретился в покупке}
+    :return:
+    """
+    pair_counts: Counter[tuple[int, int]] = Counter()
+    for id_a, id_b in permutations(item_counts, 2):
+        pair_counts[(id_a, id_b)] += item_counts[id_a] * item_counts[id_b]
+    return pair_counts
+
+
+def decay_factor(elapsed_seconds: float, half_life_seconds: float) -> float:
+    """
+    Во сколько раз затухает вес за elapsed_seconds: 0.5 ** (elapsed / half_life).
+    :param elapsed_seconds:
+    :param half_life_seconds:
+    :return:
+    """
+    return 0.5 ** (elapsed_seconds / half_life_seconds)
+
+
+def purchase_weights(
+    created_at: Mapping[int, datetime], reference: datetime, half_life_seconds: float
+) -> dict[int, float]:
+    """
+    Затухающие веса покупок на момент reference.
+    :param created_at: {purchase_id: момент покупки}
+    :param reference:
+    :param half_life_seconds:
+    :return: {purchase_id: вес}
+    """
+    weights = {}
+    for purchase_id, moment in created_at.items():
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        elapsed = (reference - moment).total_seconds()
+        weights[purchase_id] = decay_factor(elapsed, half_life_seconds)
+    return weights
+
+
+def count_baskets(
+    baskets: Iterable[tuple[int, int]], weights: Mapping[int, float] | None = None
+) -> dict:
+    """
+    Частичные счетчики (map-шаг) по позициям покупок. Результат сериализуется
+    в JSON, чтобы его можно было вернуть из Celery-задачи.
+    :param baskets: пары (purchase_id, item_id)
+    :param weights: затухающие веса покупок (по умолчанию 1)
+    :return: {"items": [[item_id, cnt, decayed]],
+        "pairs": [[id_a, id_b, cnt, last_purchase_id, decayed]],
+        "transactions": сумма весов покупок}
+    """
+    purchases: defaultdict[int, Counter[int]] = defaultdict(Counter)
+    for purchase_id, item_id in baskets:
+        purchases[purchase_id][item_id] += 1
+
+    item_counts: Counter[int] = Counter()
+    item_decayed: defaultdict[int, float] = defaultdict(float)
+    pair_counts: Counter[tuple[int, int]] = Counter()
+    pair_decayed: defaultdict[tuple[int, int], float] = defaultdict(float)
+    last_purchase: dict[tuple[int, int], int] = {}
+    transactions = 0.0
+    for purchase_id, basket in purchases.items():
+        weight = weights.get(purchase_id, 1.0) if weights is not None else 1.0
+        transactions += weight
+        item_counts.update(basket)
+        for item_id, cnt in basket.items():
+            item_decayed[item_id] += cnt * weight
+        for pair, cnt in basket_pair_counts(basket).items():
+            pair_counts[pair] += cnt
+            pair_decayed[pair] += cnt * weight
+            last_purchase[pair] = max(last_purchase.get(pair, 0), purchase_id)
+
+    return {
+        "items": [
+            [item_id, cnt, item_decayed[item_id]]
+            for item_id, cnt in item_counts.items()
+        ],
+        "pairs": [
+            [id_a, id_b, cnt, last_purchase[(id_a, id_b)], pair_decayed[(id_a, id_b)]]
+            for (id_a, id_b), cnt in pair_counts.items()
+        ],
+        "transactions": transactions,
+    }
+
+
+def merge_counts(partials: Iterable[dict]) -> tuple[list[dict], list[dict], float]:
+    """
+    Слить частичные счетчики (reduce-шаг) в строки item_counts и item_pair_counts.
+    :param partials: результаты count_baskets
+    :return: (строки item_counts, строки item_pair_counts, сумма весов покупок)
+    """
+    item_counts: Counter[int] = Counter()
+    item_decayed: defaultdict[int, float] = defaultdict(float)
+    pair_counts: Counter[tuple[int, int]] = Counter()
+    pair_decayed: defaultdict[tuple[int, int], float] = defaultdict(float)
+    last_purchase: dict[tuple[int, int], int] = {}
+    transactions = 0.0
+    for partial in partials:
+        transactions += partial["transactions"]
+        for item_id, cnt, decayed in partial["items"]:
+            item_counts[item_id] += cnt
+            item_decayed[item_id] += decayed
+        for id_a, id_b, cnt, purchase_id, decayed in partial["pairs"]:
+            pair_counts[(id_a, id_b)] += cnt
+            pair_decayed[(id_a, id_b)] += decayed
+            last_purchase[(id_a, id_b)] = max(
+                last_purchase.get((id_a, id_b), 0), purchase_id
+            )
+
+    item_rows = [
+        {"item_id": item_id, "total_cnt": cnt, "decayed_cnt": item_decayed[item_id]}
+        for item_id, cnt in sorted(item_counts.items())
+    ]
+    pair_rows = [
+        {
+            "id_a": id_a,
+            "id_b": id_b,
+            "pair_cnt": cnt,
+            "decayed_pair_cnt": pair_decayed[(id_a, id_b)],
+            "last_purchase_id": last_purchase[(id_a, id_b)],
+        }
+        for (id_a, id_b), cnt in sorted(pair_counts.items())
+    ]
+    return item_rows, pair_rows, transactions
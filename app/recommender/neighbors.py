@@ -0,0 +1,68 @@
+import heapq
+from collections import defaultdict
+from typing import Iterable
+
+
+def changed_items(
+    old_rows: Iterable[tuple[int, int, float, int]],
+    new_rows: Iterable[tuple[int, int, float, int]],
+) -> set[int]:
+    """
+    Товары, у которых при пересборке индекса изменился список соседей:
+    появились или пропали соседи либо поменялся их порядок по Lift.
+    Одинаковый сдвиг всех Lift (рост числа покупок) порядок не меняет.
+    :param old_rows: (item_id, neighbor_id, lift, pair_cnt) в порядке item_id, rank
+    :param new_rows: то же после пересборки
+    :return:
+    """
+    old: defaultdict[int, list[int]] = defaultdict(list)
+    for item_id, neighbor_id, _, _ in old_rows:
+        old[item_id].append(neighbor_id)
+    new: defaultdict[int, list[int]] = defaultdict(list)
+    for item_id, neighbor_id, _, _ in new_rows:
+        new[item_id].append(neighbor_id)
+    return {
+        item_id for item_id in old.keys() | new.keys() if old[item_id] != new[item_id]
+    }
+
+
+class NeighborIndex:
+    """
+    In-process индекс top-K соседей товаров (копия item_neighbors в памяти):
+    рекомендации считаются слиянием K-списков товаров истории без запросов к БД.
+    """
+
+    def __init__(self, rows: Iterable[tuple[int, int, float, int]]):
+        """
+        :param rows: (item_id, neighbor_id, lift, pair_cnt), по возрастанию rank
+        """
+        self.neighbors: defaultdict[int, list[tuple[int, float, int]]] = defaultdict(
+            list
+        )
+        for item_id, neighbor_id, lift, pair_cnt in rows:
+            self.neighbors[item_id].append((neighbor_id, lift, pair_cnt))
+
+    def __len__(self) -> int:
+        return len(self.neighbors)
+
+    def recommend(
+        self, user_item_ids: Iterable[int], min_pair_count: int, limit: int = 10
+    ) -> list[dict]:
+        """
+        Лучшие по Lift соседи товаров истории: max(lift) по каждому кандидату.
+        :param user_item_ids: id купленных пользователем товаров
+        :param min_pair_count:
+        :param limit:
+        :return:
+        """
+        history = set(user_item_ids)
+        best: dict[int, float] = {}
+        for item_id in history:
+            for neighbor_id, lift, pair_cnt in self.neighbors.get(item_id, ()):
+                if pair_cnt < min_pair_count or neighbor_id in history:
+                    continue
+                if lift > best.get(neighbor_id, float("-inf")):
+                    best[neighbor_id] = lift
+
+        top = heapq.nlargest(limit, best.items(), key=lambda kv: kv[1])
+        return [{"recommended_item_id": item_id, "lift": lift} for item_id, lift in top]
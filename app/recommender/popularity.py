@@ -0,0 +1,79 @@
+from collections import Counter, defaultdict
+from typing import Iterable, Mapping
+
+
+def category_ancestors(
+    category_id: int | None, parents: Mapping[int, int | None]
+) -> list[int]:
+    """
+    Категория и все ее родители, от самой категории к корню.
+    :param category_id:
+    :param parents: {category_id: parent_id}
+    :return:
+    """
+    chain: list[int] = []
+    while category_id is not None and category_id not in chain:
+        chain.append(category_id)
+        category_id = parents.get(category_id)
+    return chain
+
+
+def popularity_rows(
+    item_stats: Iterable[tuple[int, int | None, int]],
+    parents: Mapping[int, int | None],
+    top_n: int,
+) -> list[dict]:
+    """
+    Top-N товаров по числу покупок в целом (category_id=None) и по каждой
+    категории; товар учитывается в своей категории и во всех ее родителях.
+    :param item_stats: тройки (item_id, category_id, сколько раз куплен)
+    :param parents: {category_id: parent_id}
+    :param top_n:
+    :return: строки popular_items
+    """
+    scopes: defaultdict[int | None, Counter[int]] = defaultdict(Counter)
+    for item_id, category_id, cnt in item_stats:
+        scopes[None][item_id] += cnt
+        for scope in category_ancestors(category_id, parents):
+            scopes[scope][item_id] += cnt
+
+    rows: list[dict] = []
+    for category_id, counts in scopes.items():
+        ranked = sorted(counts.items(), key=lambda pair: (-pair[1], pair[0]))
+        rows.extend(
+            {
+                "category_id": category_id,
+                "item_id": item_id,
+                "rank": rank,
+                "purchase_cnt": cnt,
+            }
+            for rank, (item_id, cnt) in enumerate(ranked[:top_n], start=1)
+        )
+    return rows
+
+
+def fallback_levels(
+    category_ids: Iterable[int], parents: Mapping[int, int | None]
+) -> list[list[int]]:
+    """
+    Уровни поиска популярных товаров для пользователя: категории его покупок,
+    затем их родители и так далее до корней.
+    :param category_ids: категории купленных товаров
+    :param parents: {category_id: parent_id}
+    :return:
+    """
+    levels: list[list[int]] = []
+    seen: set[int] = set()
+    level = sorted(set(category_ids))
+    while level:
+        levels.append(level)
+        seen.update(level)
+        level = sorted(
+            {
+                parent
+                for category_id in level
+                if (parent := parents.get(category_id)) is not None
+                and parent not in seen
+            }
+        )
+    return levels
@@ -0,0 +1,157 @@
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Iterable, Sequence
+
+import numpy as np
+
+from app.recommender.sparse import gather_rows
+
+# Символическая ссылка на актуальный снимок внутри каталога снимков
+CURRENT_LINK = "current"
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_ARRAYS = ("item_ids", "indptr", "neighbor_ids", "lifts", "pair_counts")
+WATERMARK_FILE = "purchase_watermark.npy"
+
+
+@dataclass(frozen=True)
+class NeighborSnapshot:
+    """
+    Снимок индекса соседей в виде плоских массивов NumPy: соседи товара
+    item_ids[i] — это neighbor_ids[indptr[i]:indptr[i + 1]] (по убыванию Lift).
+    Открытый через open() снимок отображается в память (mmap) только на чтение,
+    поэтому все процессы API и воркеров делят одну копию в page cache.
+    purchase_watermark — водяной знак сборки индекса, из которого сделан снимок.
+    """
+
+    item_ids: np.ndarray
+    indptr: np.ndarray
+    neighbor_ids: np.ndarray
+    lifts: np.ndarray
+    pair_counts: np.ndarray
+    path: str = ""
+    purchase_watermark: int = 0
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: Sequence[tuple[int, int, float, int]],
+        path: str = "",
+        purchase_watermark: int = 0,
+    ) -> "NeighborSnapshot":
+        """
+        Собрать снимок из строк item_neighbors.
+        :param rows: (item_id, neighbor_id, lift, pair_cnt) в порядке item_id, rank
+        :param path:
+        :param purchase_watermark:
+        :return:
+        """
+        items = np.array([row[0] for row in rows], dtype=np.int64)
+        item_ids, starts = np.unique(items, return_index=True)
+        return cls(
+            item_ids=item_ids,
+            indptr=np.append(starts, len(items)).astype(np.int64),
+            neighbor_ids=np.array([row[1] for row in rows], dtype=np.int64),
+            lifts=np.array([row[2] for row in rows], dtype=np.float64),
+            pair_counts=np.array([row[3] for row in rows], dtype=np.int64),
+            path=path,
+            purchase_watermark=purchase_watermark,
+        )
+
+    @classmethod
+    def open(cls, directory: str) -> "NeighborSnapshot | None":
+        """
+        Открыть актуальный снимок каталога только на чтение через mmap.
+        :param directory: каталог снимков
+        :return: None, если снимков еще нет
+        """
+        path = current_snapshot_path(directory)
+        if path is None:
+            return None
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in SNAPSHOT_ARRAYS
+        }
+        watermark = np.load(os.path.join(path, WATERMARK_FILE))
+        return cls(**arrays, path=path, purchase_watermark=int(watermark))
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def recommend(
+        self, user_item_ids: Iterable[int], min_pair_count: int, limit: int = 10
+    ) -> list[dict]:
+        """
+        Лучшие по Lift соседи товаров истории: max(lift) по каждому кандидату.
+        :param user_item_ids: id купленных пользователем товаров
+        :param min_pair_count:
+        :param limit:
+        :return:
+        """
+        history = np.unique(np.fromiter(user_item_ids, dtype=np.int64))
+        rows = np.searchsorted(self.item_ids, history)
+        rows = rows[rows < len(self.item_ids)]
+        rows = rows[np.isin(self.item_ids[rows], history)]
+        if not len(rows):
+            return []
+
+        pos, _ = gather_rows(self.indptr, rows)
+        partners, lifts = self.neighbor_ids[pos], self.lifts[pos]
+        keep = (self.pair_counts[pos] >= min_pair_count) & ~np.isin(partners, history)
+        partners, lifts = partners[keep], lifts[keep]
+        if not len(partners):
+            return []
+
+        unique, inverse = np.unique(partners, return_inverse=True)
+        best = np.full(len(unique), -np.inf)
+        np.maximum.at(best, inverse, lifts)
+        top = np.argsort(-best, kind="stable")[:limit]
+        return [
+            {"recommended_item_id": int(unique[i]), "lift": float(best[i])} for i in top
+        ]
+
+
+def current_snapshot_path(directory: str) -> str | None:
+    """
+    Путь к актуальному снимку (цель ссылки current) или None.
+    :param directory:
+    :return:
+    """
+    link = os.path.join(directory, CURRENT_LINK)
+    if not os.path.lexists(link):
+        return None
+    return os.path.join(directory, os.readlink(link))
+
+
+def write_snapshot(directory: str, snapshot: NeighborSnapshot, keep: int = 2) -> str:
+    """
+    Атомарно опубликовать снимок: массивы пишутся во временный каталог,
+    он переименовывается, а затем ссылка current подменяется через os.replace.
+    Читатели видят либо старый, либо новый снимок целиком.
+    :param directory: каталог снимков
+    :param snapshot:
+    :param keep: сколько последних снимков хранить (старые могут быть еще открыты)
+    :return: путь к опубликованному снимку
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{SNAPSHOT_PREFIX}{time.time_ns()}"
+    tmp_path = os.path.join(directory, f".tmp-{name}")
+    os.makedirs(tmp_path)
+    for array in SNAPSHOT_ARRAYS:
+        np.save(os.path.join(tmp_path, f"{array}.npy"), getattr(snapshot, array))
+    np.save(os.path.join(tmp_path, WATERMARK_FILE), snapshot.purchase_watermark)
+    path = os.path.join(directory, name)
+    os.rename(tmp_path, path)
+
+    tmp_link = os.path.join(directory, f".tmp-{CURRENT_LINK}-{name}")
+    os.symlink(name, tmp_link)
+    os.replace(tmp_link, os.path.join(directory, CURRENT_LINK))
+
+    # Удаленные файлы остаются доступны процессам, которые их уже отобразили
+    snapshots = sorted(
+        entry for entry in os.listdir(directory) if entry.startswith(SNAPSHOT_PREFIX)
+    )
+    for old in snapshots[: -max(keep, 1)]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return path
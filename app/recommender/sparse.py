@@ -0,0 +1,420 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Iterator, cast
+
+import numpy as np
+
+
+def gather_rows(indptr: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Позиции элементов строк rows в массивах CSR с указателями indptr
+    (строка i — позиции indptr[i]:indptr[i + 1]).
+    :param indptr:
+    :param rows: номера строк
+    :return: (позиции элементов, номер строки в rows для каждой)
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    # Смещение каждой позиции от начала своей строки
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts[owners] + within, owners
+
+
+@dataclass(frozen=True)
+class CsrMatrix:
+    """
+    Разреженная матрица в формате CSR: строка i — это
+    indices[indptr[i]:indptr[i + 1]] (и data в тех же позициях, если задана).
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    shape: tuple[int, int]
+    data: np.ndarray | None = None
+
+    @classmethod
+    def from_coo(
+        cls,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        shape: tuple[int, int],
+        data: np.ndarray | None = None,
+    ) -> "CsrMatrix":
+        """
+        Собрать CSR из координатного представления (rows[k], cols[k]).
+        :param rows:
+        :param cols:
+        :param shape:
+        :param data:
+        :return:
+        """
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(
+            indptr=indptr,
+            indices=cols[order],
+            shape=shape,
+            data=data[order] if data is not None else None,
+        )
+
+    def transpose(self) -> "CsrMatrix":
+        """
+        Транспонированная матрица (basket->items превращается в item->baskets).
+        :return:
+        """
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        return CsrMatrix.from_coo(
+            self.indices, rows, (self.shape[1], self.shape[0]), self.data
+        )
+
+    def gather(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Векторно достать содержимое нескольких строк сразу.
+        :param rows: номера строк
+        :return: (позиции ненулевых элементов, номер строки в rows для каждой)
+        """
+        return gather_rows(self.indptr, rows)
+
+    def row_slice(self, start: int, stop: int) -> "CsrMatrix":
+        """
+        Подматрица из строк [start, stop).
+        :param start:
+        :param stop:
+        :return:
+        """
+        stop = min(stop, self.shape[0])
+        lo, hi = self.indptr[start], self.indptr[stop]
+        return CsrMatrix(
+            indptr=self.indptr[start : stop + 1] - lo,
+            indices=self.indices[lo:hi],
+            shape=(stop - start, self.shape[1]),
+            data=self.data[lo:hi] if self.data is not None else None,
+        )
+
+
+def csr_matmul(a: CsrMatrix, b: CsrMatrix, reduce: np.ufunc = np.add) -> CsrMatrix:
+    """
+    Произведение разреженных матриц a @ b. reduce задает свертку
+    произведений по общему индексу: np.add — обычное умножение матриц,
+    np.maximum — полукольцо (max, *).
+    :param a:
+    :param b:
+    :param reduce:
+    :return:
+    """
+    a_rows = np.repeat(np.arange(a.shape[0]), np.diff(a.indptr))
+    pos, owner = b.gather(a.indices)
+    rows = a_rows[owner]
+    cols = b.indices[pos]
+    values = b.data[pos] if b.data is not None else np.ones(len(pos))
+    if a.data is not None:
+        values = values * a.data[owner]
+
+    shape = (a.shape[0], b.shape[1])
+    keys = rows.astype(np.int64) * b.shape[1] + cols
+    if not len(keys):
+        return CsrMatrix.from_coo(keys, keys, shape, values)
+
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    out_rows, out_cols = np.divmod(keys[starts], b.shape[1])
+    return CsrMatrix.from_coo(
+        out_rows, out_cols, shape, reduce.reduceat(values, starts)
+    )
+
+
+class SparseCooccurrenceEngine:
+    """
+    In-memory движок Lift: purchase_units загружаются один раз в CSR-массивы
+    basket->items и item->baskets, а совместные покупки для истории
+    пользователя считаются векторными операциями NumPy вместо self-join в БД.
+    """
+
+    def __init__(
+        self,
+        purchase_ids: np.ndarray,
+        item_ids: np.ndarray,
+        total_transactions: int,
+        purchase_watermark: int = 0,
+    ):
+        self.total_transactions = total_transactions
+        # Водяной знак генерации на момент загрузки данных (get_settled_purchase_id)
+        self.purchase_watermark = purchase_watermark
+        self.item_ids, item_idx = np.unique(item_ids, return_inverse=True)
+        basket_ids, basket_idx = np.unique(purchase_ids, return_inverse=True)
+        self.basket_items = CsrMatrix.from_coo(
+            basket_idx, item_idx, (len(basket_ids), len(self.item_ids))
+        )
+        self.item_baskets = self.basket_items.transpose()
+        self.item_counts = np.diff(self.item_baskets.indptr)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    def to_index(self, item_ids) -> np.ndarray:
+        """
+        Перевести id товаров в номера строк; неизвестные товары отбрасываются.
+        :param item_ids:
+        :return:
+        """
+        ids = np.unique(np.asarray(item_ids, dtype=np.int64))
+        ids = ids[np.isin(ids, self.item_ids)]
+        return np.searchsorted(self.item_ids, ids)
+
+    def frequent(self, items: np.ndarray, min_pair_count: int) -> np.ndarray:
+        """
+        Apriori-отсечение: товар, купленный реже min_pair_count раз,
+        не может войти ни в одну пару с pair_cnt >= min_pair_count.
+        :param items: номера строк товаров
+        :param min_pair_count:
+        :return: только частые товары из items
+        """
+        return items[self.item_counts[items] >= min_pair_count]
+
+    def pair_counts(
+        self, history: np.ndarray, min_pair_count: int = 1
+    ) -> tuple[np.ndarray, ...]:
+        """
+        Совместные покупки товаров history со всеми остальными товарами.
+        Партнеры, которые реже min_pair_count, отбрасываются до подсчета пар.
+        :param history: номера строк товаров
+        :param min_pair_count:
+        :return: (номер в history, товар-партнер, количество совместных покупок)
+        """
+        basket_pos, owner = self.item_baskets.gather(history)
+        baskets = self.item_baskets.indices[basket_pos]
+        item_pos, basket_owner = self.basket_items.gather(baskets)
+        partners = self.basket_items.indices[item_pos]
+        sources = owner[basket_owner]
+        if min_pair_count > 1:
+            keep = self.item_counts[partners] >= min_pair_count
+            partners, sources = partners[keep], sources[keep]
+
+        keys = sources.astype(np.int64) * self.n_items + partners
+        keys, counts = np.unique(keys, return_counts=True)
+        sources, partners = np.divmod(keys, self.n_items)
+        not_self = history[sources] != partners
+        return sources[not_self], partners[not_self], counts[not_self]
+
+    def candidate_pair_counts(
+        self, seeds: np.ndarray, candidates: CsrMatrix
+    ) -> tuple[np.ndarray, ...]:
+        """
+        Точное число совместных покупок только для заранее отобранных пар
+        (seed, кандидат) — пересечение множеств покупок двух товаров.
+        :param seeds: номера строк товаров
+        :param candidates: CSR item -> кандидаты в пару (например, из MinHashLSH)
+        :return: (номер в seeds, товар-партнер, количество совместных покупок)
+        """
+        pos, sources = candidates.gather(seeds)
+        partners = candidates.indices[pos]
+        n_baskets = self.basket_items.shape[0]
+
+        pos_a, pair_a = self.item_baskets.gather(seeds[sources])
+        pos_b, pair_b = self.item_baskets.gather(partners)
+        keys_a = pair_a.astype(np.int64) * n_baskets + self.item_baskets.indices[pos_a]
+        keys_b = pair_b.astype(np.int64) * n_baskets + self.item_baskets.indices[pos_b]
+        common = np.isin(keys_a, keys_b)
+        counts = np.bincount(pair_a[common], minlength=len(partners))
+        return sources, partners, counts
+
+    def lift(
+        self, items_a: np.ndarray, items_b: np.ndarray, pair_counts: np.ndarray
+    ) -> np.ndarray:
+        """
+        Lift = P(A и B) / (P(A) * P(B)) = pair_cnt * N / (cnt_a * cnt_b).
+        :param items_a: номера строк товаров A
+        :param items_b: номера строк товаров B
+        :param pair_counts: количество совместных покупок
+        :return:
+        """
+        denominator = self.item_counts[items_a] * self.item_counts[items_b]
+        return (pair_counts * self.total_transactions) / denominator.astype(np.float64)
+
+    def recommend(
+        self,
+        user_item_ids,
+        min_pair_count: int,
+        limit: int = 10,
+        candidates: CsrMatrix | None = None,
+    ) -> list[dict]:
+        """
+        Лучшие по Lift товары для истории покупок пользователя.
+        Семантика совпадает с SQL-путем: max(lift) по товарам истории.
+        :param user_item_ids: id купленных пользователем товаров
+        :param min_pair_count:
+        :param limit:
+        :param candidates: если задано — Lift считается только для этих пар
+        :return:
+        """
+        history = self.to_index(user_item_ids)
+        seeds = self.frequent(history, min_pair_count)
+        if not len(seeds):
+            return []
+
+        if candidates is None:
+            sources, partners, counts = self.pair_counts(seeds, min_pair_count)
+        else:
+            sources, partners, counts = self.candidate_pair_counts(seeds, candidates)
+        keep = (counts >= min_pair_count) & ~np.isin(partners, history)
+        sources, partners, counts = sources[keep], partners[keep], counts[keep]
+        if not len(partners):
+            return []
+
+        lift = self.lift(seeds[sources], partners, counts)
+        best = np.full(self.n_items, -np.inf)
+        np.maximum.at(best, partners, lift)
+
+        scored = np.flatnonzero(np.isfinite(best))
+        top = scored[np.argsort(-best[scored], kind="stable")[:limit]]
+        return [
+            {
+                "recommended_item_id": int(self.item_ids[i]),
+                "lift": float(best[i]),
+            }
+            for i in top
+        ]
+
+    def lift_block(
+        self, block: np.ndarray, min_pair_count: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Строки матрицы Lift для блока товаров.
+        :param block: номера строк товаров
+        :param min_pair_count:
+        :return: (товар, товар-партнер, Lift)
+        """
+        sources, partners, counts = self.pair_counts(block, min_pair_count)
+        keep = counts >= min_pair_count
+        sources, partners, counts = sources[keep], partners[keep], counts[keep]
+        return (
+            block[sources],
+            partners,
+            self.lift(block[sources], partners, counts),
+        )
+
+    def lift_matrix(
+        self, min_pair_count: int, chunk_size: int = 1024, workers: int = 1
+    ) -> CsrMatrix:
+        """
+        Матрица Lift item x item: только пары с pair_cnt >= min_pair_count.
+        Товары делятся на диапазоны по chunk_size, чтобы ограничить память;
+        при workers > 1 диапазоны считаются параллельно в пуле процессов.
+        :param min_pair_count:
+        :param chunk_size:
+        :param workers: число процессов (0 — по числу ядер)
+        :return:
+        """
+        items = self.frequent(np.arange(self.n_items), min_pair_count)
+        blocks = [
+            items[start : start + chunk_size]
+            for start in range(0, len(items), chunk_size)
+        ]
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and multiprocessing.current_process().daemon:
+            # Дочерние процессы prefork-пула Celery не могут порождать свои
+            workers = 1
+        if workers > 1 and len(blocks) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(blocks)),
+                initializer=_init_lift_worker,
+                initargs=(self,),
+            ) as pool:
+                parts = list(pool.map(_lift_block, blocks, repeat(min_pair_count)))
+        else:
+            parts = [self.lift_block(block, min_pair_count) for block in blocks]
+
+        empty_ids = np.array([], dtype=np.int64)
+        return CsrMatrix.from_coo(
+            np.concatenate([p[0] for p in parts]) if parts else empty_ids,
+            np.concatenate([p[1] for p in parts]) if parts else empty_ids,
+            (self.n_items, self.n_items),
+            np.concatenate([p[2] for p in parts])
+            if parts
+            else np.array([], dtype=np.float64),
+        )
+
+    def recommend_all(
+        self,
+        user_ids: np.ndarray,
+        item_ids: np.ndarray,
+        min_pair_count: int,
+        limit: int = 10,
+        chunk_size: int = 1000,
+        workers: int = 1,
+    ) -> Iterator[tuple[int, list[dict]]]:
+        """
+        Рекомендации для всех пользователей сразу: матрица Lift строится один
+        раз, а история user x item умножается на нее блоками пользователей
+        в полукольце (max, *) — то же max(lift), что и в recommend().
+        :param user_ids: user_id для каждой пары (пользователь, купленный товар)
+        :param item_ids: item_id для каждой пары
+        :param min_pair_count:
+        :param limit:
+        :param chunk_size: сколько пользователей обрабатывать за один блок
+        :param workers: число процессов для построения матрицы Lift
+        :return: пары (user_id, рекомендации) для пользователей с результатом
+        """
+        known = np.isin(item_ids, self.item_ids)
+        users, user_idx = np.unique(user_ids[known], return_inverse=True)
+        item_idx = np.searchsorted(self.item_ids, item_ids[known])
+        history = CsrMatrix.from_coo(user_idx, item_idx, (len(users), self.n_items))
+        lift = self.lift_matrix(min_pair_count, workers=workers)
+
+        for start in range(0, len(users), chunk_size):
+            block = history.row_slice(start, start + chunk_size)
+            scores = csr_matmul(block, lift, reduce=np.maximum)
+            rows = np.repeat(np.arange(scores.shape[0]), np.diff(scores.indptr))
+            cols = scores.indices
+            values = cast(np.ndarray, scores.data)
+
+            # Уже купленные товары не рекомендуем
+            block_rows = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+            bought = block_rows.astype(np.int64) * self.n_items + block.indices
+            fresh = ~np.isin(rows.astype(np.int64) * self.n_items + cols, bought)
+            rows, cols, values = rows[fresh], cols[fresh], values[fresh]
+
+            order = np.lexsort((-values, rows))
+            rows, cols, values = rows[order], cols[order], values[order]
+            row_starts = np.searchsorted(rows, rows, side="left")
+            rank = np.arange(len(rows)) - row_starts
+            top = rank < limit
+            rows, cols, values = rows[top], cols[top], values[top]
+            if not len(rows):
+                continue
+
+            bounds = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1], True])
+            for lo, hi in zip(bounds[:-1], bounds[1:], strict=True):
+                yield (
+                    int(users[start + rows[lo]]),
+                    [
+                        {
+                            "recommended_item_id": int(self.item_ids[c]),
+                            "lift": float(v),
+                        }
+                        for c, v in zip(cols[lo:hi], values[lo:hi], strict=True)
+                    ],
+                )
+
+
+# Движок, переданный в процесс пула при его запуске (см. lift_matrix)
+_worker_engine: SparseCooccurrenceEngine | None = None
+
+
+def _init_lift_worker(engine: SparseCooccurrenceEngine) -> None:
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _lift_block(
+    block: np.ndarray, min_pair_count: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    assert _worker_engine is not None
+    return _worker_engine.lift_block(block, min_pair_count)
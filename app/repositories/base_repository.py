@@ -1,13 +1,17 @@
 from abc import ABC, abstractmethod
 from typing import Any, Generic, Sequence, Type, TypeVar
 
-from sqlalchemy import delete, insert, select, update
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.database import Base
 
 T = TypeVar("T", bound=Base)
 
+# Сколько строк отправлять в одном многострочном INSERT ... ON CONFLICT
+UPSERT_CHUNK_SIZE = 1000
+
 
 class AbstractRepository(ABC, Generic[T]):
     @abstractmethod
@@ -37,6 +41,40 @@ class Repository(AbstractRepository[T]):
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    def upsert_stmt(self):
+        """
+        INSERT с поддержкой ON CONFLICT для диалекта текущей сессии
+        (PostgreSQL в проде, SQLite в тестах).
+        :return:
+        """
+        if self.session.get_bind().dialect.name == "postgresql":
+            return postgresql.insert(self.model)
+        return sqlite.insert(self.model)
+
+    async def lock_exclusive(self) -> None:
+        """
+        Заблокировать таблицу от записи до конца транзакции (чтения
+        не блокируются). В PostgreSQL — LOCK TABLE ... IN EXCLUSIVE MODE;
+        SQLite и так допускает только одну пишущую транзакцию.
+        :return:
+        """
+        if self.session.get_bind().dialect.name == "postgresql":
+            await self.session.execute(
+                text(f"LOCK TABLE {self.model.__tablename__} IN EXCLUSIVE MODE")
+            )
+
+    async def replace_all(self, rows: Sequence[dict]) -> None:
+        """
+        Заменить содержимое таблицы строками rows (пачками по UPSERT_CHUNK_SIZE).
+        :param rows:
+        :return:
+        """
+        await self.session.execute(delete(self.model))
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            await self.session.execute(
+                insert(self.model), rows[start : start + UPSERT_CHUNK_SIZE]
+            )
+
     async def add_one(self, data: dict) -> T:
         """
         Добавить одну запись в БД.
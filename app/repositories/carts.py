@@ -25,6 +25,16 @@ class CartRepository(Repository[CartUnit]):
         items = await self.session.execute(stmt)
         return items.scalars().all()
 
+    async def get_cart_item_ids(self, user_id: int) -> list[int]:
+        """
+        Получить id товаров в корзине пользователя (без загрузки самих товаров).
+        :param user_id:
+        :return:
+        """
+        stmt = select(self.model.item_id).where(self.model.user_id == user_id)
+        result = await self.session.execute(stmt)
+        return list(result.scalars().all())
+
     async def get_cart_unit(self, **filter_by):
         """
         Получить запись единицы товара из БД.
@@ -1,6 +1,16 @@
+from sqlalchemy import select
+
 from app.models.categories import Category
 from app.repositories.base_repository import Repository
 
 
 class CategoryRepository(Repository[Category]):
     model = Category
+
+    async def get_parents(self) -> dict[int, int | None]:
+        """
+        Получить дерево категорий словарем {category_id: parent_id}.
+        :return:
+        """
+        result = await self.session.execute(select(self.model.id, self.model.parent_id))
+        return {category_id: parent_id for category_id, parent_id in result.all()}
@@ -0,0 +1,580 @@
+from datetime import datetime
+from typing import Mapping, Sequence
+
+from sqlalchemy import Float, case, cast, delete, func, insert, select, text, update
+from sqlalchemy.orm import aliased
+
+from app.models import Item
+from app.models.cooccurrence import (
+    CooccurrenceDecay,
+    DirtyItem,
+    ItemCount,
+    ItemNeighbor,
+    ItemPairCount,
+    LiftKnowledgeBase,
+    ModelWatermark,
+)
+from app.models.purchases import Purchase, PurchaseUnit
+from app.recommender.cooccurrence import basket_pair_counts
+from app.repositories.base_repository import UPSERT_CHUNK_SIZE, Repository
+from app.repositories.purchases import history_item_ids, user_history_cte
+
+
+class ItemCountRepository(Repository[ItemCount]):
+    model = ItemCount
+
+    async def increment(
+        self, item_counts: Mapping[int, int], weight: float = 1.0
+    ) -> None:
+        """
+        Увеличить счетчики товаров одним bulk upsert.
+        :param item_counts: {item_id: сколько раз товар встретился в покупке}
+        :param weight: вес покупки для затухающих счетчиков
+        :return:
+        """
+        # Сортировка по ключу — одинаковый порядок блокировок строк
+        # у параллельных оформлений заказа, без взаимных блокировок.
+        rows = [
+            {"item_id": item_id, "total_cnt": cnt, "decayed_cnt": cnt * weight}
+            for item_id, cnt in sorted(item_counts.items())
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = self.upsert_stmt().values(rows[start : start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.item_id],
+                set_={
+                    "total_cnt": self.model.total_cnt + stmt.excluded.total_cnt,
+                    "decayed_cnt": self.model.decayed_cnt + stmt.excluded.decayed_cnt,
+                },
+            )
+            await self.session.execute(stmt)
+
+    async def rebuild(self) -> None:
+        """
+        Пересчитать счетчики товаров с нуля по purchase_units.
+        Затухающие счетчики приравниваются к обычным (все покупки с весом 1),
+        с учетом Purchase.created_at их пересчитывает rebuild_cooccurrence_task.
+        :return:
+        """
+        await self.session.execute(delete(self.model))
+        total_cnt = func.count(PurchaseUnit.id)
+        stmt = insert(self.model).from_select(
+            ["item_id", "total_cnt", "decayed_cnt"],
+            select(PurchaseUnit.item_id, total_cnt, total_cnt).group_by(
+                PurchaseUnit.item_id
+            ),
+        )
+        await self.session.execute(stmt)
+
+    async def decay(self, factor: float) -> None:
+        """
+        Умножить все затухающие счетчики товаров на factor.
+        :param factor:
+        :return:
+        """
+        await self.session.execute(
+            update(self.model).values(decayed_cnt=self.model.decayed_cnt * factor)
+        )
+
+
+class ItemPairCountRepository(Repository[ItemPairCount]):
+    model = ItemPairCount
+
+    async def increment(
+        self,
+        item_counts: Mapping[int, int],
+        purchase_id: int | None = None,
+        weight: float = 1.0,
+        min_pair_count: int = 1,
+    ) -> list[int]:
+        """
+        Увеличить счетчики пар товаров одной покупки одним bulk upsert.
+        :param item_counts: {item_id: сколько раз товар встретился в покупке}
+        :param purchase_id: покупка, изменившая счетчики
+        :param weight: вес покупки для затухающих счетчиков
+        :param min_pair_count: порог значимости пары
+        :return: товары пар, которые этой покупкой достигли min_pair_count
+        """
+        pair_counts = basket_pair_counts(item_counts)
+        crossed: set[int] = set()
+        rows = [
+            {
+                "id_a": id_a,
+                "id_b": id_b,
+                "pair_cnt": cnt,
+                "decayed_pair_cnt": cnt * weight,
+                "last_purchase_id": purchase_id,
+            }
+            for (id_a, id_b), cnt in sorted(pair_counts.items())
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = self.upsert_stmt().values(rows[start : start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.id_a, self.model.id_b],
+                set_={
+                    "pair_cnt": self.model.pair_cnt + stmt.excluded.pair_cnt,
+                    "decayed_pair_cnt": self.model.decayed_pair_cnt
+                    + stmt.excluded.decayed_pair_cnt,
+                    # Покупки коммитятся не по порядку id — берем наибольший
+                    "last_purchase_id": case(
+                        (
+                            self.model.last_purchase_id.is_(None)
+                            | (
+                                stmt.excluded.last_purchase_id
+                                > self.model.last_purchase_id
+                            ),
+                            stmt.excluded.last_purchase_id,
+                        ),
+                        else_=self.model.last_purchase_id,
+                    ),
+                },
+            ).returning(self.model.id_a, self.model.id_b, self.model.pair_cnt)
+            for id_a, id_b, pair_cnt in await self.session.execute(stmt):
+                if pair_cnt - pair_counts[(id_a, id_b)] < min_pair_count <= pair_cnt:
+                    crossed.update((id_a, id_b))
+        return sorted(crossed)
+
+    async def rebuild(self) -> None:
+        """
+        Пересчитать счетчики пар с нуля по purchase_units.
+        Затухающие счетчики приравниваются к обычным, как в ItemCountRepository.
+        :return:
+        """
+        await self.session.execute(delete(self.model))
+        pu1, pu2 = aliased(PurchaseUnit), aliased(PurchaseUnit)
+        pair_cnt = func.count(pu1.id)
+        stmt = insert(self.model).from_select(
+            ["id_a", "id_b", "pair_cnt", "decayed_pair_cnt", "last_purchase_id"],
+            select(
+                pu1.item_id,
+                pu2.item_id,
+                pair_cnt,
+                pair_cnt,
+                func.max(pu1.purchase_id),
+            )
+            .join(pu2, pu1.purchase_id == pu2.purchase_id)
+            .where(pu1.item_id != pu2.item_id)
+            .group_by(pu1.item_id, pu2.item_id),
+        )
+        await self.session.execute(stmt)
+
+    async def decay(self, factor: float) -> None:
+        """
+        Умножить все затухающие счетчики пар на factor.
+        :param factor:
+        :return:
+        """
+        await self.session.execute(
+            update(self.model).values(
+                decayed_pair_cnt=self.model.decayed_pair_cnt * factor
+            )
+        )
+
+    async def get_last_purchase_id(self, user_id: int, min_pair_count: int) -> int:
+        """
+        Последняя покупка, изменившая значимые (pair_cnt >= min_pair_count)
+        пары, которые начинаются с товаров истории пользователя.
+        :param user_id:
+        :param min_pair_count:
+        :return:
+        """
+        history = user_history_cte(user_id)
+        stmt = select(func.max(self.model.last_purchase_id)).where(
+            self.model.id_a.in_(select(history.c.item_id)),
+            self.model.pair_cnt >= min_pair_count,
+        )
+        return (await self.session.execute(stmt)).scalar() or 0
+
+    async def generate_recommendations(self, filter_by):
+        """
+        Рекомендации по предагрегированным счетчикам: вместо self-join
+        purchase_units — чтение item_pair_counts по первичному ключу (id_a, id_b).
+        При decayed=True Lift считается по затухающим счетчикам, total_transactions
+        тогда — затухающее число покупок. Порог min_pair_count всегда применяется
+        к обычному pair_cnt. История — подзапрос по user_id или user_bought_ids.
+        :param filter_by:
+        :return:
+        """
+        user_bought_ids = history_item_ids(filter_by)
+        total_transactions = filter_by["total_transactions"]
+        min_pair_count = filter_by["min_pair_count"]
+        limit = filter_by.get("limit", 10)
+        decayed = filter_by.get("decayed", False)
+
+        if user_bought_ids is None:
+            return []
+
+        ic1, ic2 = aliased(ItemCount), aliased(ItemCount)
+        item_info = aliased(Item)
+        if decayed:
+            lift_value = (self.model.decayed_pair_cnt * total_transactions) / (
+                ic1.decayed_cnt * ic2.decayed_cnt
+            )
+        else:
+            lift_value = cast(self.model.pair_cnt * total_transactions, Float) / (
+                ic1.total_cnt * ic2.total_cnt
+            )
+
+        stmt = (
+            select(
+                item_info.id.label("recommended_item_id"),
+                item_info.name.label("recommended_item_name"),
+                func.max(lift_value).label("lift"),
+            )
+            .select_from(self.model)
+            .join(ic1, ic1.item_id == self.model.id_a)
+            .join(ic2, ic2.item_id == self.model.id_b)
+            .join(item_info, item_info.id == self.model.id_b)
+            .where(self.model.id_a.in_(user_bought_ids))
+            .where(self.model.id_b.not_in(user_bought_ids))
+            .where(self.model.pair_cnt >= min_pair_count)
+            .group_by(item_info.id, item_info.name)
+            .order_by(func.max(lift_value).desc())
+            .limit(limit)
+        )
+        result = await self.session.execute(stmt)
+        return result.mappings().all()
+
+
+class CooccurrenceDecayRepository(Repository[CooccurrenceDecay]):
+    model = CooccurrenceDecay
+
+    STATE_ID = 1
+
+    async def get_state(self, exclusive: bool = False) -> CooccurrenceDecay | None:
+        """
+        Получить состояние затухающих счетчиков с блокировкой строки до конца
+        транзакции: checkout берет ее FOR SHARE (параллельные checkout
+        не мешают друг другу), затухание — FOR UPDATE, чтобы вес покупки
+        и decayed_at, к которому он приведен, не разошлись.
+        :param exclusive: FOR UPDATE вместо FOR SHARE
+        :return:
+        """
+        stmt = (
+            select(self.model)
+            .where(self.model.id == self.STATE_ID)
+            .with_for_update(read=not exclusive)
+            .execution_options(populate_existing=True)
+        )
+        return (await self.session.execute(stmt)).scalar_one_or_none()
+
+    async def reset(self, decayed_at: datetime) -> None:
+        """
+        Записать момент, к которому приведены счетчики после полного пересчета.
+        :param decayed_at:
+        :return:
+        """
+        stmt = self.upsert_stmt().values(id=self.STATE_ID, decayed_at=decayed_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.id],
+            set_={"decayed_at": stmt.excluded.decayed_at},
+        )
+        await self.session.execute(stmt)
+
+    async def decay(self, decayed_at: datetime) -> None:
+        """
+        Сдвинуть момент, к которому приведены затухающие счетчики.
+        :param decayed_at:
+        :return:
+        """
+        await self.session.execute(
+            update(self.model)
+            .where(self.model.id == self.STATE_ID)
+            .values(decayed_at=decayed_at)
+        )
+
+
+class DirtyItemRepository(Repository[DirtyItem]):
+    model = DirtyItem
+
+    async def mark(self, item_ids: Sequence[int], marked_at: datetime) -> None:
+        """
+        Отметить товары измененными (повторная отметка сдвигает marked_at).
+        :param item_ids:
+        :param marked_at:
+        :return:
+        """
+        rows = [
+            {"item_id": item_id, "marked_at": marked_at}
+            for item_id in sorted(set(item_ids))
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = self.upsert_stmt().values(rows[start : start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.item_id],
+                set_={"marked_at": stmt.excluded.marked_at},
+            )
+            await self.session.execute(stmt)
+
+    async def pop(self, marked_before: datetime) -> list[int]:
+        """
+        Забрать товары, отмеченные не позже marked_before. Отмеченные позже
+        (во время обработки) остаются до следующего раза.
+        :param marked_before:
+        :return:
+        """
+        stmt = (
+            delete(self.model)
+            .where(self.model.marked_at <= marked_before)
+            .returning(self.model.item_id)
+        )
+        return list((await self.session.execute(stmt)).scalars().all())
+
+
+class ModelWatermarkRepository(Repository[ModelWatermark]):
+    model = ModelWatermark
+
+    async def get_watermark(self, engine: str) -> int:
+        """
+        Получить водяной знак последней сборки модели движка.
+        :param engine:
+        :return: 0, если модель еще не собиралась
+        """
+        stmt = select(self.model.purchase_watermark).where(self.model.engine == engine)
+        return (await self.session.execute(stmt)).scalar() or 0
+
+    async def set_watermark(
+        self, engine: str, purchase_watermark: int, built_at: datetime
+    ) -> None:
+        """
+        Записать водяной знак собранной модели движка.
+        :param engine:
+        :param purchase_watermark:
+        :param built_at:
+        :return:
+        """
+        stmt = self.upsert_stmt().values(
+            engine=engine, purchase_watermark=purchase_watermark, built_at=built_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.engine],
+            set_={
+                "purchase_watermark": stmt.excluded.purchase_watermark,
+                "built_at": stmt.excluded.built_at,
+            },
+        )
+        await self.session.execute(stmt)
+
+
+class LiftKnowledgeBaseRepository(Repository[LiftKnowledgeBase]):
+    model = LiftKnowledgeBase
+
+    async def refresh(self) -> None:
+        """
+        Обновить базу знаний Lift. В PostgreSQL — REFRESH MATERIALIZED VIEW
+        CONCURRENTLY: чтения не блокируются на время пересчета. На других
+        СУБД (SQLite в тестах) таблица заполняется тем же запросом, что
+        и представление в миграции.
+        :return:
+        """
+        if self.session.get_bind().dialect.name == "postgresql":
+            await self.session.execute(
+                text("REFRESH MATERIALIZED VIEW CONCURRENTLY lift_knowledge_base")
+            )
+            return
+
+        item_counts = (
+            select(
+                PurchaseUnit.item_id.label("item_id"),
+                func.count(PurchaseUnit.id).label("total_cnt"),
+            )
+            .group_by(PurchaseUnit.item_id)
+            .cte("item_counts")
+        )
+        total_transactions = select(func.count(Purchase.id)).scalar_subquery()
+        pu1, pu2 = aliased(PurchaseUnit), aliased(PurchaseUnit)
+        ic1, ic2 = aliased(item_counts), aliased(item_counts)
+        pair_cnt = func.count(pu1.id)
+        await self.session.execute(delete(self.model))
+        stmt = insert(self.model).from_select(
+            ["id_a", "id_b", "pair_cnt", "lift"],
+            select(
+                pu1.item_id,
+                pu2.item_id,
+                pair_cnt,
+                cast(pair_cnt * total_transactions, Float)
+                / (ic1.c.total_cnt * ic2.c.total_cnt),
+            )
+            .join(pu2, pu1.purchase_id == pu2.purchase_id)
+            .join(ic1, ic1.c.item_id == pu1.item_id)
+            .join(ic2, ic2.c.item_id == pu2.item_id)
+            .where(pu1.item_id != pu2.item_id)
+            .group_by(pu1.item_id, pu2.item_id, ic1.c.total_cnt, ic2.c.total_cnt),
+        )
+        await self.session.execute(stmt)
+
+    async def get_rankings(
+        self, min_pair_count: int, top_k: int
+    ) -> list[tuple[int, int, float, int]]:
+        """
+        Top-K партнеров каждого товара по Lift среди значимых пар
+        строками (item_id, partner_id, lift, pair_cnt) в порядке товара и ранга.
+        :param min_pair_count:
+        :param top_k:
+        :return:
+        """
+        ranked = (
+            select(
+                self.model.id_a,
+                self.model.id_b,
+                self.model.lift,
+                self.model.pair_cnt,
+                func.row_number()
+                .over(
+                    partition_by=self.model.id_a,
+                    order_by=(self.model.lift.desc(), self.model.id_b),
+                )
+                .label("rank"),
+            )
+            .where(self.model.pair_cnt >= min_pair_count)
+            .subquery()
+        )
+        stmt = (
+            select(ranked.c.id_a, ranked.c.id_b, ranked.c.lift, ranked.c.pair_cnt)
+            .where(ranked.c.rank <= top_k)
+            .order_by(ranked.c.id_a, ranked.c.rank)
+        )
+        result = await self.session.execute(stmt)
+        return [
+            (item_id, partner_id, lift, pair_cnt)
+            for item_id, partner_id, lift, pair_cnt in result.all()
+        ]
+
+    async def generate_recommendations(self, filter_by):
+        """
+        Рекомендации по базе знаний Lift: поиск по уникальному индексу
+        (id_a, id_b) для товаров истории и max(lift) по кандидатам.
+        :param filter_by:
+        :return:
+        """
+        history = user_history_cte(filter_by["user_id"])
+        user_bought_ids = select(history.c.item_id)
+        min_pair_count = filter_by["min_pair_count"]
+        limit = filter_by.get("limit", 10)
+
+        item_info = aliased(Item)
+        stmt = (
+            select(
+                item_info.id.label("recommended_item_id"),
+                item_info.name.label("recommended_item_name"),
+                func.max(self.model.lift).label("lift"),
+            )
+            .select_from(self.model)
+            .join(item_info, item_info.id == self.model.id_b)
+            .where(self.model.id_a.in_(user_bought_ids))
+            .where(self.model.id_b.not_in(user_bought_ids))
+            .where(self.model.pair_cnt >= min_pair_count)
+            .group_by(item_info.id, item_info.name)
+            .order_by(func.max(self.model.lift).desc())
+            .limit(limit)
+        )
+        result = await self.session.execute(stmt)
+        return result.mappings().all()
+
+
+class ItemNeighborRepository(Repository[ItemNeighbor]):
+    model = ItemNeighbor
+
+    async def rebuild(
+        self, total_transactions: int, min_pair_count: int, top_k: int
+    ) -> None:
+        """
+        Пересобрать индекс соседей: для каждого товара оставить top_k
+        партнеров с наибольшим Lift среди пар с pair_cnt >= min_pair_count.
+        :param total_transactions:
+        :param min_pair_count:
+        :param top_k:
+        :return:
+        """
+        await self.session.execute(delete(self.model))
+        if not total_transactions:
+            return
+
+        ic1, ic2 = aliased(ItemCount), aliased(ItemCount)
+        lift_value = cast(ItemPairCount.pair_cnt * total_transactions, Float) / (
+            ic1.total_cnt * ic2.total_cnt
+        )
+        ranked = (
+            select(
+                ItemPairCount.id_a.label("item_id"),
+                ItemPairCount.id_b.label("neighbor_id"),
+                func.row_number()
+                .over(
+                    partition_by=ItemPairCount.id_a,
+                    order_by=(lift_value.desc(), ItemPairCount.id_b),
+                )
+                .label("rank"),
+                lift_value.label("lift"),
+                ItemPairCount.pair_cnt.label("pair_cnt"),
+            )
+            .join(ic1, ic1.item_id == ItemPairCount.id_a)
+            .join(ic2, ic2.item_id == ItemPairCount.id_b)
+            .where(ItemPairCount.pair_cnt >= min_pair_count)
+            .subquery()
+        )
+        stmt = insert(self.model).from_select(
+            ["item_id", "neighbor_id", "rank", "lift", "pair_cnt"],
+            select(
+                ranked.c.item_id,
+                ranked.c.neighbor_id,
+                ranked.c.rank,
+                ranked.c.lift,
+                ranked.c.pair_cnt,
+            ).where(ranked.c.rank <= top_k),
+        )
+        await self.session.execute(stmt)
+
+    async def get_neighbors(self) -> list[tuple[int, int, float, int]]:
+        """
+        Получить весь индекс соседей строками (item_id, neighbor_id, lift, pair_cnt)
+        в порядке товара и ранга.
+        :return:
+        """
+        stmt = select(
+            self.model.item_id,
+            self.model.neighbor_id,
+            self.model.lift,
+            self.model.pair_cnt,
+        ).order_by(self.model.item_id, self.model.rank)
+        result = await self.session.execute(stmt)
+        return [
+            (item_id, neighbor_id, lift, pair_cnt)
+            for item_id, neighbor_id, lift, pair_cnt in result.all()
+        ]
+
+    async def generate_recommendations(self, filter_by):
+        """
+        Рекомендации по индексу соседей: слияние top-K списков товаров
+        истории пользователя, max(lift) по каждому кандидату.
+        История — подзапрос по user_id или явный список user_bought_ids.
+        :param filter_by:
+        :return:
+        """
+        user_bought_ids = history_item_ids(filter_by)
+        min_pair_count = filter_by["min_pair_count"]
+        limit = filter_by.get("limit", 10)
+        only_available = filter_by.get("only_available", False)
+
+        if user_bought_ids is None:
+            return []
+
+        item_info = aliased(Item)
+        stmt = (
+            select(
+                item_info.id.label("recommended_item_id"),
+                item_info.name.label("recommended_item_name"),
+                func.max(self.model.lift).label("lift"),
+            )
+            .select_from(self.model)
+            .join(item_info, item_info.id == self.model.neighbor_id)
+            .where(self.model.item_id.in_(user_bought_ids))
+            .where(self.model.neighbor_id.not_in(user_bought_ids))
+            .where(self.model.pair_cnt >= min_pair_count)
+            .group_by(item_info.id, item_info.name)
+            .order_by(func.max(self.model.lift).desc())
+            .limit(limit)
+        )
+        if only_available:
+            stmt = stmt.where(item_info.is_active, item_info.stock > 0)
+        result = await self.session.execute(stmt)
+        return result.mappings().all()
@@ -1,7 +1,10 @@
+from typing import Sequence
+
 from sqlalchemy import select
 
 from app.models.items import Item
 from app.repositories.base_repository import Repository
+from app.repositories.purchases import user_history_cte
 
 
 class ItemRepository(Repository[Item]):
@@ -19,3 +22,30 @@ class ItemRepository(Repository[Item]):
         )
         item = await self.session.execute(stmt)
         return item.scalar_one_or_none()
+
+    async def get_items_by_ids(self, item_ids: Sequence[int]) -> Sequence[Item]:
+        """
+        Получить товары по списку id одним запросом.
+        :param item_ids:
+        :return:
+        """
+        if not item_ids:
+            return []
+        stmt = select(self.model).where(self.model.id.in_(item_ids))
+        items = await self.session.execute(stmt)
+        return items.scalars().all()
+
+    async def get_user_category_ids(self, user_id: int) -> list[int]:
+        """
+        Категории товаров, которые покупал пользователь (по user_item_history).
+        :param user_id:
+        :return:
+        """
+        history = user_history_cte(user_id)
+        stmt = (
+            select(self.model.category_id)
+            .join(history, history.c.item_id == self.model.id)
+            .where(self.model.category_id.is_not(None))
+            .distinct()
+        )
+        return list((await self.session.execute(stmt)).scalars().all())
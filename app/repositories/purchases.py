@@ -1,9 +1,46 @@
-from sqlalchemy import Float, cast, func, select
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Mapping, Sequence
+
+from sqlalchemy import CTE, Float, cast, delete, func, insert, select, update
 from sqlalchemy.orm import aliased
 
+from app.core.config import settings
 from app.models import Item
-from app.models.purchases import Purchase, PurchaseUnit
-from app.repositories.base_repository import Repository
+from app.models.purchases import (
+    Purchase,
+    PurchaseCounter,
+    PurchaseUnit,
+    UserItemHistory,
+    UserPurchaseCount,
+)
+from app.repositories.base_repository import UPSERT_CHUNK_SIZE, Repository
+
+
+def user_history_cte(user_id: int) -> CTE:
+    """
+    История покупок пользователя на стороне БД (различные item_id)
+    по ключу user_item_history. Подставляется в запросы вместо списка id
+    из Python, поэтому размер запроса не зависит от длины истории.
+    :param user_id:
+    :return:
+    """
+    return (
+        select(UserItemHistory.item_id.label("item_id"))
+        .where(UserItemHistory.user_id == user_id)
+        .cte("user_history")
+    )
+
+
+def history_item_ids(filter_by: dict):
+    """
+    Товары истории для запроса рекомендаций: подзапрос по user_id
+    или явный список user_bought_ids (например, товары корзины).
+    :param filter_by:
+    :return: выражение для IN / NOT IN или None, если список пуст
+    """
+    if filter_by.get("user_id") is not None:
+        return select(user_history_cte(filter_by["user_id"]).c.item_id)
+    return filter_by["user_bought_ids"] or None
 
 
 class PurchaseRepository(Repository[Purchase]):
@@ -30,30 +67,82 @@ class PurchaseRepository(Repository[Purchase]):
         purchases = await self.session.execute(stmt)
         return purchases.scalars().all()
 
-    async def get_count_purchases(self):
+    async def get_last_purchase_id(self, user_id: int | None = None) -> int:
         """
-        Получить общее количество покупок.
+        Получить id последней покупки (всех или одного пользователя).
+        :param user_id:
         :return:
         """
-        total_tx_stmt = select(func.count(Purchase.id))
-        total_transactions = (await self.session.execute(total_tx_stmt)).scalar() or 1
-        return total_transactions
+        stmt = select(func.max(self.model.id))
+        if user_id is not None:
+            stmt = stmt.where(self.model.user_id == user_id)
+        return (await self.session.execute(stmt)).scalar() or 0
 
-    async def get_count_user_purchases(self, current_user_id: int):
+    async def get_settled_purchase_id(self) -> int:
         """
-        Получить все записи из таблицы в БД, списком
+        Получить id последней покупки, оформленной раньше
+        PURCHASE_WATERMARK_LAG_SECONDS назад. Покупки старше задержки уже
+        закоммичены, поэтому видны и все покупки с меньшим id — в отличие
+        от max(id), который может обогнать еще не закоммиченную покупку.
         :return:
         """
-        stmt = select(func.count(self.model.id)).where(
-            self.model.user_id == current_user_id
+        lag = timedelta(seconds=settings.PURCHASE_WATERMARK_LAG_SECONDS)
+        stmt = select(func.max(self.model.id)).where(
+            self.model.created_at < datetime.now(timezone.utc) - lag
+        )
+        return (await self.session.execute(stmt)).scalar() or 0
+
+    async def get_created_at(
+        self, start_id: int | None = None, stop_id: int | None = None
+    ) -> dict[int, datetime]:
+        """
+        Получить моменты оформления покупок с id из [start_id, stop_id).
+        :param start_id:
+        :param stop_id:
+        :return: {purchase_id: created_at}
+        """
+        stmt = select(self.model.id, self.model.created_at)
+        if start_id is not None:
+            stmt = stmt.where(self.model.id >= start_id)
+        if stop_id is not None:
+            stmt = stmt.where(self.model.id < stop_id)
+        result = await self.session.execute(stmt)
+        return {purchase_id: created_at for purchase_id, created_at in result.all()}
+
+    async def get_user_purchase_counts(self) -> dict[int, int]:
+        """
+        Посчитать покупки каждого пользователя полным проходом по таблице
+        (для сверки счетчиков).
+        :return: {user_id: количество покупок}
+        """
+        stmt = select(self.model.user_id, func.count(self.model.id)).group_by(
+            self.model.user_id
         )
-        count = await self.session.execute(stmt)
-        return count.first()
+        result = await self.session.execute(stmt)
+        return {user_id: cnt for user_id, cnt in result.all()}
 
 
 class PurchaseUnitRepository(Repository[PurchaseUnit]):
     model = PurchaseUnit
 
+    async def get_baskets(
+        self, start_id: int | None = None, stop_id: int | None = None
+    ) -> list[tuple[int, int]]:
+        """
+        Получить позиции покупок парами (purchase_id, item_id),
+        при необходимости только для purchase_id из [start_id, stop_id).
+        :param start_id:
+        :param stop_id:
+        :return:
+        """
+        stmt = select(self.model.purchase_id, self.model.item_id)
+        if start_id is not None:
+            stmt = stmt.where(self.model.purchase_id >= start_id)
+        if stop_id is not None:
+            stmt = stmt.where(self.model.purchase_id < stop_id)
+        result = await self.session.execute(stmt)
+        return [(purchase_id, item_id) for purchase_id, item_id in result.all()]
+
     async def generate_recommendations(self, filter_by):
         """
 
@@ -63,18 +152,10 @@ class PurchaseUnitRepository(Repository[PurchaseUnit]):
         user_id = filter_by["user_id"]
         total_transactions = filter_by["total_transactions"]
         min_pair_count = filter_by["min_pair_count"]
+        limit = filter_by.get("limit", 10)
 
-        # 1. Получаем историю покупок пользователя
-        user_history_stmt = (
-            select(self.model.item_id)
-            .join(Purchase, Purchase.id == self.model.purchase_id)
-            .where(Purchase.user_id == user_id)
-        )
-        history_res = await self.session.execute(user_history_stmt)
-        user_bought_ids = list(set(history_res.scalars().all()))
-
-        if not user_bought_ids:
-            return []
+        # 1. История покупок пользователя остается на стороне БД
+        user_bought_ids = select(user_history_cte(user_id).c.item_id)
 
         # 2. CTE для частоты товаров
         item_counts_cte = (
@@ -86,32 +167,44 @@ class PurchaseUnitRepository(Repository[PurchaseUnit]):
             .cte("item_counts")
         )
 
-        # 3. CTE для расчета матрицы Lift (база знаний)
+        # 3. Apriori-отсечение: товар в покупке встречается не больше одного
+        # раза, поэтому pair_cnt <= min(cnt_a, cnt_b) и товары, купленные реже
+        # min_pair_count раз, не дадут ни одной пары — убираем их до self-join
+        frequent_units_cte = (
+            select(
+                self.model.id.label("id"),
+                self.model.purchase_id.label("purchase_id"),
+                self.model.item_id.label("item_id"),
+                item_counts_cte.c.total_cnt.label("total_cnt"),
+            )
+            .join(item_counts_cte, item_counts_cte.c.item_id == self.model.item_id)
+            .where(item_counts_cte.c.total_cnt >= min_pair_count)
+            .cte("frequent_units")
+        )
+
+        # 4. CTE для расчета матрицы Lift (база знаний)
         # Это решает проблему "misuse of aggregate function"
-        pu1, pu2 = aliased(self.model), aliased(self.model)
-        ic1, ic2 = aliased(item_counts_cte), aliased(item_counts_cte)
+        pu1, pu2 = aliased(frequent_units_cte), aliased(frequent_units_cte)
 
         knowledge_base_cte = (
             select(
-                pu1.item_id.label("id_a"),
-                pu2.item_id.label("id_b"),
+                pu1.c.item_id.label("id_a"),
+                pu2.c.item_id.label("id_b"),
                 (
-                    cast(func.count(pu1.id) * total_transactions, Float)
-                    / (ic1.c.total_cnt * ic2.c.total_cnt)
+                    cast(func.count(pu1.c.id) * total_transactions, Float)
+                    / (pu1.c.total_cnt * pu2.c.total_cnt)
                 ).label("lift_value"),
             )
-            .join(pu2, pu1.purchase_id == pu2.purchase_id)
-            .join(ic1, ic1.c.item_id == pu1.item_id)
-            .join(ic2, ic2.c.item_id == pu2.item_id)
+            .join(pu2, pu1.c.purchase_id == pu2.c.purchase_id)
             .where(
-                pu1.item_id != pu2.item_id
+                pu1.c.item_id != pu2.c.item_id
             )  # Нам нужны оба направления (A->B и B->A)  # noqa: E501
-            .group_by(pu1.item_id, pu2.item_id, ic1.c.total_cnt, ic2.c.total_cnt)
-            .having(func.count(pu1.id) >= min_pair_count)
+            .group_by(pu1.c.item_id, pu2.c.item_id, pu1.c.total_cnt, pu2.c.total_cnt)
+            .having(func.count(pu1.c.id) >= min_pair_count)
             .cte("knowledge_base")
         )
 
-        # 4. Финальный выбор: сопоставляем историю пользователя с базой знаний
+        # 5. Финальный выбор: сопоставляем историю пользователя с базой знаний
         kb = aliased(knowledge_base_cte)
         item_info = aliased(Item)
 
@@ -128,8 +221,244 @@ class PurchaseUnitRepository(Repository[PurchaseUnit]):
             .where(kb.c.id_b.not_in(user_bought_ids))
             .group_by(item_info.id, item_info.name)
             .order_by(func.max(kb.c.lift_value).desc())
-            .limit(10)
+            .limit(limit)
         )
 
         result = await self.session.execute(final_stmt)
         return result.mappings().all()
+
+
+class UserItemHistoryRepository(Repository[UserItemHistory]):
+    model = UserItemHistory
+
+    async def increment(
+        self, user_id: int, item_ids: Iterable[int], purchased_at: datetime
+    ) -> None:
+        """
+        Учесть заказ пользователя: +1 к purchase_cnt каждого товара заказа.
+        :param user_id:
+        :param item_ids: различные товары заказа
+        :param purchased_at:
+        :return:
+        """
+        rows = [
+            {
+                "user_id": user_id,
+                "item_id": item_id,
+                "purchase_cnt": 1,
+                "last_purchased_at": purchased_at,
+            }
+            for item_id in sorted(set(item_ids))
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = self.upsert_stmt().values(rows[start : start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.user_id, self.model.item_id],
+                set_={
+                    "purchase_cnt": self.model.purchase_cnt
+                    + stmt.excluded.purchase_cnt,
+                    "last_purchased_at": stmt.excluded.last_purchased_at,
+                },
+            )
+            await self.session.execute(stmt)
+
+    async def rebuild(self) -> None:
+        """
+        Пересчитать историю с нуля по purchase_units.
+        :return:
+        """
+        await self.session.execute(delete(self.model))
+        stmt = insert(self.model).from_select(
+            ["user_id", "item_id", "purchase_cnt", "last_purchased_at"],
+            select(
+                Purchase.user_id,
+                PurchaseUnit.item_id,
+                func.count(func.distinct(Purchase.id)),
+                func.max(Purchase.created_at),
+            )
+            .join(Purchase, Purchase.id == PurchaseUnit.purchase_id)
+            .group_by(Purchase.user_id, PurchaseUnit.item_id),
+        )
+        await self.session.execute(stmt)
+
+    async def get_user_item_ids(
+        self, user_id: int, limit: int | None = None
+    ) -> list[int]:
+        """
+        Получить id товаров, купленных пользователем: всех или limit
+        последних по last_purchased_at.
+        :param user_id:
+        :param limit:
+        :return:
+        """
+        stmt = select(self.model.item_id).where(self.model.user_id == user_id)
+        if limit is not None:
+            stmt = stmt.order_by(self.model.last_purchased_at.desc()).limit(limit)
+        result = await self.session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_user_ids_by_items(self, item_ids: Sequence[int]) -> list[int]:
+        """
+        Получить пользователей, покупавших хотя бы один из товаров item_ids
+        (по индексу user_item_history.item_id).
+        :param item_ids:
+        :return:
+        """
+        if not item_ids:
+            return []
+        stmt = (
+            select(self.model.user_id)
+            .where(self.model.item_id.in_(item_ids))
+            .distinct()
+        )
+        result = await self.session.execute(stmt)
+        return list(result.scalars().all())
+
+    async def get_user_item_pairs(self) -> list[tuple[int, int]]:
+        """
+        Получить историю покупок всех пользователей парами (user_id, item_id).
+        :return:
+        """
+        stmt = select(self.model.user_id, self.model.item_id)
+        result = await self.session.execute(stmt)
+        return [(user_id, item_id) for user_id, item_id in result.all()]
+
+
+class PurchaseCounterRepository(Repository[PurchaseCounter]):
+    model = PurchaseCounter
+
+    async def increment(self, purchase_id: int, weight: float = 1.0) -> None:
+        """
+        Учесть покупку в шарде purchase_id % PURCHASE_COUNTER_SHARDS.
+        :param purchase_id:
+        :param weight: вес покупки в затухающем счетчике
+        :return:
+        """
+        shard = purchase_id % settings.PURCHASE_COUNTER_SHARDS
+        stmt = self.upsert_stmt().values(
+            shard=shard, purchase_cnt=1, decayed_cnt=weight
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.shard],
+            set_={
+                "purchase_cnt": self.model.purchase_cnt + stmt.excluded.purchase_cnt,
+                "decayed_cnt": self.model.decayed_cnt + stmt.excluded.decayed_cnt,
+            },
+        )
+        await self.session.execute(stmt)
+
+    async def get_total(self) -> int:
+        """
+        Общее число покупок: сумма по шардам.
+        :return:
+        """
+        stmt = select(func.sum(self.model.purchase_cnt))
+        return (await self.session.execute(stmt)).scalar() or 0
+
+    async def get_count_purchases(self) -> int:
+        """
+        Получить общее количество покупок (не меньше 1 — делитель в Lift).
+        :return:
+        """
+        return await self.get_total() or 1
+
+    async def get_decayed_total(self) -> float:
+        """
+        Затухающее число покупок: сумма по шардам.
+        :return:
+        """
+        stmt = select(func.sum(self.model.decayed_cnt))
+        return (await self.session.execute(stmt)).scalar() or 0.0
+
+    async def reset(self, total: int) -> None:
+        """
+        Записать общее число покупок в нулевой шард, обнулив остальные.
+        Затухающее число покупок не меняется.
+        :param total:
+        :return:
+        """
+        await self.session.execute(update(self.model).values(purchase_cnt=0))
+        stmt = self.upsert_stmt().values(shard=0, purchase_cnt=total)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.shard],
+            set_={"purchase_cnt": stmt.excluded.purchase_cnt},
+        )
+        await self.session.execute(stmt)
+
+    async def reset_decayed(self, total: float) -> None:
+        """
+        Записать затухающее число покупок в нулевой шард, обнулив остальные.
+        :param total:
+        :return:
+        """
+        await self.session.execute(update(self.model).values(decayed_cnt=0.0))
+        stmt = self.upsert_stmt().values(shard=0, purchase_cnt=0, decayed_cnt=total)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.shard],
+            set_={"decayed_cnt": stmt.excluded.decayed_cnt},
+        )
+        await self.session.execute(stmt)
+
+    async def decay(self, factor: float) -> None:
+        """
+        Умножить затухающее число покупок на factor.
+        :param factor:
+        :return:
+        """
+        await self.session.execute(
+            update(self.model).values(decayed_cnt=self.model.decayed_cnt * factor)
+        )
+
+
+class UserPurchaseCountRepository(Repository[UserPurchaseCount]):
+    model = UserPurchaseCount
+
+    async def increment(self, user_id: int) -> None:
+        """
+        Учесть покупку пользователя.
+        :param user_id:
+        :return:
+        """
+        stmt = self.upsert_stmt().values(user_id=user_id, purchase_cnt=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.user_id],
+            set_={"purchase_cnt": self.model.purchase_cnt + stmt.excluded.purchase_cnt},
+        )
+        await self.session.execute(stmt)
+
+    async def get_count(self, user_id: int) -> int:
+        """
+        Получить число покупок пользователя по первичному ключу.
+        :param user_id:
+        :return:
+        """
+        stmt = select(self.model.purchase_cnt).where(self.model.user_id == user_id)
+        return (await self.session.execute(stmt)).scalar() or 0
+
+    async def get_counts(self) -> dict[int, int]:
+        """
+        Получить все счетчики пользователей.
+        :return: {user_id: purchase_cnt}
+        """
+        result = await self.session.execute(
+            select(self.model.user_id, self.model.purchase_cnt)
+        )
+        return {user_id: cnt for user_id, cnt in result.all()}
+
+    async def set_counts(self, counts: Mapping[int, int]) -> None:
+        """
+        Перезаписать счетчики пользователей из counts.
+        :param counts: {user_id: purchase_cnt}
+        :return:
+        """
+        rows = [
+            {"user_id": user_id, "purchase_cnt": cnt}
+            for user_id, cnt in sorted(counts.items())
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = self.upsert_stmt().values(rows[start : start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.user_id],
+                set_={"purchase_cnt": stmt.excluded.purchase_cnt},
+            )
+            await self.session.execute(stmt)
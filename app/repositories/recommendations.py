@@ -1,9 +1,17 @@
-from typing import Any
+from datetime import datetime
+from typing import Any, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import delete, func, select
 
-from app.models.recommendations import Recommendation
-from app.repositories.base_repository import Repository
+from app.models import Item
+from app.models.cooccurrence import ItemCount
+from app.models.recommendations import (
+    PopularItem,
+    Recommendation,
+    RecommendationState,
+)
+from app.repositories.base_repository import UPSERT_CHUNK_SIZE, Repository
+from app.repositories.purchases import user_history_cte
 
 
 class RecommendationRepository(Repository[Recommendation]):
@@ -11,10 +19,193 @@ class RecommendationRepository(Repository[Recommendation]):
 
     async def fetch_one(self, **filter_by: Any) -> Recommendation | None:
         """
-        Получить рекомендацию по фильтрам (например, user_id).
+        Получить рекомендацию по фильтрам (например, user_id и rank).
         :param filter_by:
         :return:
         """
         stmt = select(self.model).filter_by(**filter_by)
         res = await self.session.execute(stmt)
         return res.scalar_one_or_none()
+
+    async def get_recommendations(
+        self, user_id: int, limit: int | None = None, offset: int = 0
+    ) -> Sequence[Recommendation]:
+        """
+        Получить страницу ранжированного списка рекомендаций пользователя.
+        :param user_id:
+        :param limit:
+        :param offset:
+        :return:
+        """
+        stmt = (
+            select(self.model)
+            .where(self.model.user_id == user_id)
+            .order_by(self.model.rank)
+            .offset(offset)
+            .limit(limit)
+        )
+        res = await self.session.execute(stmt)
+        return res.scalars().all()
+
+    async def get_recommendations_for_users(
+        self, user_ids: Sequence[int], limit: int | None = None
+    ) -> Sequence[Recommendation]:
+        """
+        Получить первые limit рекомендаций сразу для нескольких пользователей
+        одним запросом по индексу (user_id, rank).
+        :param user_ids:
+        :param limit: сколько позиций на пользователя (None — все)
+        :return: рекомендации в порядке (user_id, rank)
+        """
+        stmt = (
+            select(self.model)
+            .where(self.model.user_id.in_(user_ids))
+            .order_by(self.model.user_id, self.model.rank)
+        )
+        if limit is not None:
+            stmt = stmt.where(self.model.rank <= limit)
+        res = await self.session.execute(stmt)
+        return res.scalars().all()
+
+    async def bulk_upsert(self, rows: list[dict], generated_at: datetime) -> None:
+        """
+        Записать ранжированные рекомендации пачками INSERT ... ON CONFLICT
+        (user_id, rank). Хвост старого списка, не перезаписанный в этом
+        прогоне, удаляется по generated_at.
+        :param rows: [{"user_id": ..., "item_id": ..., "rank": ..., "score": ...}]
+        :param generated_at: метка времени текущего прогона
+        :return:
+        """
+        rows = [{**row, "generated_at": generated_at} for row in rows]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start : start + UPSERT_CHUNK_SIZE]
+            stmt = self.upsert_stmt().values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.user_id, self.model.rank],
+                set_={
+                    "item_id": stmt.excluded.item_id,
+                    "score": stmt.excluded.score,
+                    "source": stmt.excluded.source,
+                    "generated_at": stmt.excluded.generated_at,
+                },
+            )
+            await self.session.execute(stmt)
+            await self.session.execute(
+                delete(self.model).where(
+                    self.model.user_id.in_({row["user_id"] for row in chunk}),
+                    self.model.generated_at < generated_at,
+                )
+            )
+
+    async def delete_users(self, user_ids: Sequence[int]) -> None:
+        """
+        Удалить рекомендации пользователей, для которых нечего предложить.
+        :param user_ids:
+        :return:
+        """
+        for start in range(0, len(user_ids), UPSERT_CHUNK_SIZE):
+            await self.session.execute(
+                delete(self.model).where(
+                    self.model.user_id.in_(user_ids[start : start + UPSERT_CHUNK_SIZE])
+                )
+            )
+
+
+class RecommendationStateRepository(Repository[RecommendationState]):
+    model = RecommendationState
+
+    async def bulk_upsert(self, rows: list[dict]) -> None:
+        """
+        Записать водяные знаки генерации пачками INSERT ... ON CONFLICT user_id.
+        :param rows: [{"user_id": ..., "min_pair_count": ...,
+                       "purchase_watermark": ..., "generated_at": ...}]
+        :return:
+        """
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = self.upsert_stmt().values(rows[start : start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.model.user_id],
+                set_={
+                    "min_pair_count": stmt.excluded.min_pair_count,
+                    "purchase_watermark": stmt.excluded.purchase_watermark,
+                    "generated_at": stmt.excluded.generated_at,
+                },
+            )
+            await self.session.execute(stmt)
+
+    async def delete_users(self, user_ids: Sequence[int]) -> None:
+        """
+        Удалить водяные знаки пользователей: следующая генерация
+        пересчитает их рекомендации безусловно.
+        :param user_ids:
+        :return:
+        """
+        for start in range(0, len(user_ids), UPSERT_CHUNK_SIZE):
+            await self.session.execute(
+                delete(self.model).where(
+                    self.model.user_id.in_(user_ids[start : start + UPSERT_CHUNK_SIZE])
+                )
+            )
+
+
+class PopularItemRepository(Repository[PopularItem]):
+    model = PopularItem
+
+    async def get_item_stats(self) -> list[tuple[int, int | None, int]]:
+        """
+        Сколько раз куплен каждый доступный к заказу товар (по item_counts).
+        :return: тройки (item_id, category_id, total_cnt)
+        """
+        stmt = (
+            select(ItemCount.item_id, Item.category_id, ItemCount.total_cnt)
+            .join(Item, Item.id == ItemCount.item_id)
+            .where(Item.is_active, Item.stock > 0)
+        )
+        result = await self.session.execute(stmt)
+        return [
+            (item_id, category_id, cnt) for item_id, category_id, cnt in result.all()
+        ]
+
+    async def get_popular(
+        self,
+        category_ids: Sequence[int] | None,
+        exclude_item_ids: Sequence[int] = (),
+        limit: int = 10,
+        user_id: int | None = None,
+    ) -> list[tuple[int, int]]:
+        """
+        Самые покупаемые товары категорий category_ids (None — в целом)
+        без товаров exclude_item_ids и, если задан user_id, без купленных
+        пользователем (подзапросом по user_item_history).
+        :param category_ids:
+        :param exclude_item_ids:
+        :param limit:
+        :param user_id:
+        :return: пары (item_id, purchase_cnt) по убыванию purchase_cnt
+        """
+        purchase_cnt = func.max(self.model.purchase_cnt)
+        stmt = select(self.model.item_id, purchase_cnt)
+        if category_ids is None:
+            stmt = stmt.where(self.model.category_id.is_(None))
+        else:
+            stmt = stmt.where(self.model.category_id.in_(category_ids))
+        if exclude_item_ids:
+            stmt = stmt.where(self.model.item_id.not_in(exclude_item_ids))
+        if user_id is not None:
+            history = user_history_cte(user_id)
+            stmt = stmt.where(self.model.item_id.not_in(select(history.c.item_id)))
+        stmt = (
+            stmt.group_by(self.model.item_id)
+            .order_by(purchase_cnt.desc(), self.model.item_id)
+            .limit(limit)
+        )
+        result = await self.session.execute(stmt)
+        return [(item_id, cnt) for item_id, cnt in result.all()]
+
+    async def get_refreshed_at(self) -> datetime | None:
+        """
+        Когда последний раз пересчитывались популярные товары.
+        :return:
+        """
+        stmt = select(func.max(self.model.refreshed_at))
+        return (await self.session.execute(stmt)).scalar()
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Response, status
+from fastapi import APIRouter, Query, Response, status
 
 from app.dependencies.dependencies import UOWDep, UserDep
-from app.schemas.carts import Cart, CartUnitCreate, CartUnitRead, CartUnitUpdate
+from app.schemas.carts import (
+    Cart,
+    CartRecommendation,
+    CartUnitCreate,
+    CartUnitRead,
+    CartUnitUpdate,
+)
 from app.services.carts import CartService
 from app.utils.logger import logger
 
@@ -21,6 +27,20 @@ async def get_cart(
     return result
 
 
+@router.get("/recommendations", response_model=list[CartRecommendation])
+async def get_cart_recommendations(
+    uow: UOWDep,
+    current_user: UserDep,
+    limit: int = Query(5, ge=1, le=50),
+):
+    """
+    Получить товары, которые часто покупают вместе с содержимым корзины.
+    """
+    logger.info(f"Рекомендации к корзине пользователя {current_user.id}.")
+    result = await CartService.get_cart_recommendations(uow, current_user, limit)
+    return result
+
+
 @router.post("/units", response_model=CartUnitRead, status_code=status.HTTP_201_CREATED)
 async def add_item_to_cart(payload: CartUnitCreate, uow: UOWDep, current_user: UserDep):
     """
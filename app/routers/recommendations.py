@@ -1,7 +1,13 @@
-from fastapi import APIRouter, Query
+from typing import Literal
+
+from fastapi import APIRouter, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 
 from app.dependencies.dependencies import UOWDep
-from app.schemas.recommendations import RecommendationCreate
+from app.schemas.recommendations import (
+    RecommendationBatchRequest,
+    RecommendationCreate,
+)
 from app.services.recommendations import RecommendationService
 from app.utils.logger import logger
 
@@ -12,15 +18,57 @@ router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 async def get_recommendations(
     uow: UOWDep,
     user_id: int = Query(..., gt=0),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    expand: Literal["item"] | None = Query(None),
 ):
     """
-    Получить рекомендации для пользователя по id.
+    Получить ранжированные рекомендации для пользователя по id.
+    expand=item добавляет к каждой рекомендации данные товара.
     """
     logger.info(f"Получение рекомендаций для пользователя {user_id}")
-    result = await RecommendationService.get_recommendations(uow, user_id)
+    result = await RecommendationService.get_recommendations(
+        uow, user_id, limit, offset
+    )
+    if expand == "item":
+        return {
+            "recommendations": await RecommendationService.expand_items(uow, result)
+        }
     return {"recommendations": result}
 
 
+@router.post("/batch")
+async def get_recommendations_batch(uow: UOWDep, batch: RecommendationBatchRequest):
+    """
+    Получить рекомендации сразу для многих пользователей (NDJSON-поток).
+    """
+    logger.info(f"Пакетная выдача рекомендаций для {len(batch.user_ids)} пользователей")
+    return StreamingResponse(
+        RecommendationService.stream_recommendations(uow, batch.user_ids, batch.limit),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/live")
+async def get_live_recommendations(
+    uow: UOWDep,
+    background_tasks: BackgroundTasks,
+    user_id: int = Query(..., gt=0),
+    min_pair_count: int = Query(5, gt=0),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Посчитать рекомендации для пользователя сразу, без очереди задач.
+    """
+    logger.info(f"Live-рекомендации для пользователя {user_id}")
+    result, source = await RecommendationService.get_live_recommendations(
+        uow, user_id, min_pair_count, limit
+    )
+    if RecommendationService.neighbor_index_needs_load():
+        background_tasks.add_task(RecommendationService.load_neighbor_index, uow)
+    return {"recommendations": result, "source": source}
+
+
 @router.post("/generate")
 async def generate_recommendations(recommendation: RecommendationCreate):
     """
@@ -29,15 +77,8 @@ async def generate_recommendations(recommendation: RecommendationCreate):
     logger.info(
         f"Старт генерации рекомендаций для пользователя {recommendation.user_id}"
     )
-    from app.utils.celery_tasks import generate_recommendations_task
-
-    logger.info("Импорт задачи выполнен успешно")
-    task = generate_recommendations_task.delay(
+    result = await RecommendationService.enqueue_generation(
         recommendation.user_id, recommendation.min_pair_count
     )
-    logger.info(f"Успех! ID: {task.id}")
-    return {
-        "result": "recommendation generation started",
-        "task_id": task.id,
-        "status": "queued",
-    }
+    logger.info(f"Успех! ID: {result['task_id']}")
+    return result
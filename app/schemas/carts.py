@@ -38,3 +38,11 @@ class Cart(BaseModel):
     total_price: Decimal = Field(
         ..., ge=0, description="Общая стоимость товаров", examples=[Decimal("250.00")]
     )
+
+
+class CartRecommendation(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    item_id: int = Field(..., description="ID товара")
+    name: str = Field(..., description="Название товара")
+    score: float = Field(..., description="Значение Lift")
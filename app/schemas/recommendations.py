@@ -1,12 +1,37 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel, ConfigDict, Field
 
+from app.schemas.items import ItemRead
+
 
 class Recommendation(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
-    id: int = Field(..., description="ID рекомендации")
+    id: int | None = Field(None, description="ID рекомендации (нет у популярных)")
     user_id: int = Field(..., description="ID пользователя")
     item_id: int = Field(..., description="ID товара")
+    rank: int = Field(..., ge=1, description="Позиция в списке рекомендаций")
+    score: float = Field(
+        ..., description="Значение Lift (для source=popular — число покупок)"
+    )
+    source: Literal["lift", "popular"] = Field(
+        "lift", description="По совместным покупкам или популярные товары"
+    )
+    generated_at: datetime = Field(..., description="Когда рекомендация посчитана")
+
+
+class RecommendationWithItem(Recommendation):
+    item: ItemRead | None = Field(None, description="Информация о товаре")
+
+
+class LiveRecommendation(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    item_id: int = Field(..., description="ID товара")
+    rank: int = Field(..., ge=1, description="Позиция в списке рекомендаций")
+    score: float = Field(..., description="Значение Lift")
 
 
 class RecommendationCreate(BaseModel):
@@ -14,3 +39,12 @@ class RecommendationCreate(BaseModel):
     min_pair_count: int = Field(
         default=5, gt=0, description="Минимальное количество совместных покупок"
     )
+
+
+class RecommendationBatchRequest(BaseModel):
+    user_ids: list[int] = Field(
+        ..., min_length=1, max_length=50_000, description="ID пользователей"
+    )
+    limit: int = Field(
+        default=10, ge=1, le=100, description="Сколько рекомендаций на пользователя"
+    )
@@ -1,8 +1,15 @@
 from decimal import Decimal
 
+from app.core.config import settings
 from app.errors.carts_exceptions import CartUnitNotFoundError
 from app.errors.items_exceptions import ItemNotFoundError
-from app.schemas.carts import Cart, CartUnitCreate, CartUnitRead, CartUnitUpdate
+from app.schemas.carts import (
+    Cart,
+    CartRecommendation,
+    CartUnitCreate,
+    CartUnitRead,
+    CartUnitUpdate,
+)
 from app.schemas.users import UserRead
 from app.utils.unitofwork import IUnitOfWork
 
@@ -135,3 +142,35 @@ class CartService:
         async with uow:
             await uow.cart.delete_all(id=current_user.id)
             await uow.commit()
+
+    @staticmethod
+    async def get_cart_recommendations(
+        uow: IUnitOfWork, current_user: UserRead, limit: int = 5
+    ) -> list[CartRecommendation]:
+        """
+        Товары, которые часто покупают вместе с содержимым корзины.
+        Считаются по индексу соседей item_neighbors, без обращения
+        к purchase_units.
+        :param uow:
+        :param current_user:
+        :param limit:
+        :return:
+        """
+        async with uow:
+            cart_item_ids = await uow.cart.get_cart_item_ids(current_user.id)
+            recs = await uow.item_neighbor.generate_recommendations(
+                {
+                    "user_bought_ids": cart_item_ids,
+                    "min_pair_count": settings.NEIGHBORS_MIN_PAIR_COUNT,
+                    "limit": limit,
+                    "only_available": True,
+                }
+            )
+        return [
+            CartRecommendation(
+                item_id=rec["recommended_item_id"],
+                name=rec["recommended_item_name"],
+                score=rec["lift"],
+            )
+            for rec in recs
+        ]
@@ -0,0 +1,240 @@
+from datetime import datetime, timezone
+from typing import Mapping
+
+from app.core.config import settings
+from app.recommender.cooccurrence import (
+    count_baskets,
+    decay_factor,
+    merge_counts,
+    purchase_weights,
+)
+from app.recommender.neighbors import changed_items
+from app.recommender.snapshot import NeighborSnapshot, write_snapshot
+from app.utils.logger import logger
+from app.utils.unitofwork import IUnitOfWork
+
+
+def half_life_seconds() -> float:
+    return settings.DECAY_HALF_LIFE_DAYS * 24 * 60 * 60
+
+
+def elapsed_since(moment: datetime, now: datetime) -> float:
+    """
+    Секунд от moment до now (SQLite возвращает время без часового пояса — UTC).
+    :param moment:
+    :param now:
+    :return:
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (now - moment).total_seconds()
+
+
+class CooccurrenceService:
+    @staticmethod
+    async def record_purchase(
+        uow: IUnitOfWork, item_counts: Mapping[int, int], purchase_id: int
+    ) -> None:
+        """
+        Учесть покупку в счетчиках товаров, пар и покупок (в транзакции checkout).
+        Затухающие счетчики хранятся на момент decayed_at, поэтому новая покупка
+        входит с весом 2 ** (прошло / период полураспада) — тогда после
+        приведения к текущему моменту ее вес равен 1, и переписывать
+        остальные строки не нужно. decayed_at читается FOR SHARE: затухание
+        не сдвинет его, пока покупка не закоммичена.
+        :param uow:
+        :param item_counts: {item_id: сколько раз товар встретился в покупке}
+        :param purchase_id:
+        :return:
+        """
+        now = datetime.now(timezone.utc)
+        state = await uow.cooccurrence_decay.get_state()
+        weight = 1.0
+        if state is not None:
+            elapsed = elapsed_since(state.decayed_at, now)
+            weight = 1 / decay_factor(elapsed, half_life_seconds())
+        await uow.item_count.increment(item_counts, weight)
+        crossed = await uow.item_pair_count.increment(
+            item_counts, purchase_id, weight, settings.NIGHTLY_MIN_PAIR_COUNT
+        )
+        await uow.purchase_counter.increment(purchase_id, weight)
+        # Пересчет нужен покупателям товаров, у которых появилась значимая пара;
+        # изменения оценок уже значимых пар подхватывает пересборка соседей
+        if crossed:
+            await uow.dirty_item.mark(crossed, now)
+
+    @staticmethod
+    async def decay(uow: IUnitOfWork) -> float:
+        """
+        Привести затухающие счетчики к текущему моменту: умножить их
+        на 0.5 ** (прошло с decayed_at / период полураспада). Lift от общего
+        множителя не зависит — шаг нужен, чтобы веса новых покупок не росли.
+        :param uow:
+        :return: примененный множитель
+        """
+        state = await uow.cooccurrence_decay.get_state(exclusive=True)
+        if state is None:
+            return 1.0
+        now = datetime.now(timezone.utc)
+        factor = decay_factor(elapsed_since(state.decayed_at, now), half_life_seconds())
+        await uow.item_count.decay(factor)
+        await uow.item_pair_count.decay(factor)
+        await uow.purchase_counter.decay(factor)
+        await uow.cooccurrence_decay.decay(now)
+        await uow.commit()
+        logger.info(f"CooccurrenceService: счетчики затухли с множителем {factor:.6f}.")
+        return factor
+
+    @staticmethod
+    async def get_partitions(
+        uow: IUnitOfWork, partitions: int
+    ) -> tuple[int, list[tuple[int, int]]]:
+        """
+        Разбить покупки на непересекающиеся диапазоны purchase_id для map-задач.
+        Диапазоны кончаются на устоявшейся покупке (get_settled_purchase_id):
+        все покупки с меньшим id уже закоммичены и видны map-задачам.
+        :param uow:
+        :param partitions: желаемое число диапазонов
+        :return: (водяной знак — последний учтенный purchase_id, [(start, stop)])
+        """
+        watermark = await uow.purchase.get_settled_purchase_id()
+        if not watermark:
+            return 0, []
+        step = -(-watermark // max(partitions, 1))
+        bounds = [
+            (start, min(start + step, watermark + 1))
+            for start in range(1, watermark + 1, step)
+        ]
+        return watermark, bounds
+
+    @staticmethod
+    async def count_partition(
+        uow: IUnitOfWork, start_id: int, stop_id: int, reference: datetime
+    ) -> dict:
+        """
+        Map-шаг: частичные счетчики товаров и пар по покупкам [start_id, stop_id),
+        затухающие — с весами покупок на момент reference.
+        :param uow:
+        :param start_id:
+        :param stop_id:
+        :param reference: общий для всех map-задач момент затухания
+        :return:
+        """
+        baskets = await uow.purchase_unit.get_baskets(start_id, stop_id)
+        created_at = await uow.purchase.get_created_at(start_id, stop_id)
+        weights = purchase_weights(created_at, reference, half_life_seconds())
+        partial = count_baskets(baskets, weights)
+        logger.info(
+            f"CooccurrenceService: [{start_id}, {stop_id}) — {len(baskets)} позиций, "
+            f"{len(partial['pairs'])} пар."
+        )
+        return partial
+
+    @staticmethod
+    async def merge_partitions(
+        uow: IUnitOfWork, partials: list[dict], watermark: int, reference: datetime
+    ) -> int:
+        """
+        Reduce-шаг: слить частичные счетчики и заменить ими item_counts
+        и item_pair_counts. Покупки после водяного знака досчитываются здесь же,
+        под блокировкой счетчиков: checkout, уже увеличивший счетчики, к этому
+        моменту закоммичен и виден в хвосте, а новые ждут коммита замены
+        и увеличивают уже новые счетчики.
+        :param uow:
+        :param partials:
+        :param watermark:
+        :param reference: момент, к которому приведены затухающие счетчики
+        :return: количество пар в новом хранилище
+        """
+        # Порядок блокировок — как у checkout (record_purchase)
+        await uow.cooccurrence_decay.lock_exclusive()
+        await uow.item_count.lock_exclusive()
+        await uow.item_pair_count.lock_exclusive()
+        await uow.purchase_counter.lock_exclusive()
+        created_at = await uow.purchase.get_created_at(watermark + 1)
+        tail = count_baskets(
+            await uow.purchase_unit.get_baskets(watermark + 1),
+            purchase_weights(created_at, reference, half_life_seconds()),
+        )
+        item_rows, pair_rows, transactions = merge_counts([*partials, tail])
+        await uow.item_pair_count.replace_all(pair_rows)
+        await uow.item_count.replace_all(item_rows)
+        await uow.purchase_counter.reset_decayed(transactions)
+        await uow.cooccurrence_decay.reset(reference)
+        await uow.commit()
+        logger.info(
+            f"CooccurrenceService: {len(partials)} частей слиты, "
+            f"{len(item_rows)} товаров, {len(pair_rows)} пар."
+        )
+        return len(pair_rows)
+
+    @staticmethod
+    async def refresh_knowledge_base(uow: IUnitOfWork) -> None:
+        """
+        Обновить материализованную базу знаний Lift для движка matview
+        и сохранить водяной знак обновления для генерации. Если рекомендации
+        генерирует движок matview, товары, у которых изменился top-N
+        партнеров, отмечаются в dirty_items; при первом обновлении сравнивать
+        не с чем, и водяные знаки пользователей и так устарели.
+        :param uow:
+        :return:
+        """
+        built_at = datetime.now(timezone.utc)
+        watermark = await uow.purchase.get_settled_purchase_id()
+        previous = await uow.model_watermark.get_watermark("matview")
+        track = settings.RECOMMENDATION_ENGINE == "matview" and previous > 0
+        ranking_args = (settings.NIGHTLY_MIN_PAIR_COUNT, settings.RECOMMENDATIONS_TOP_N)
+        old_rows = (
+            await uow.lift_knowledge_base.get_rankings(*ranking_args) if track else []
+        )
+        await uow.lift_knowledge_base.refresh()
+        await uow.model_watermark.set_watermark("matview", watermark, built_at)
+        if track:
+            rows = await uow.lift_knowledge_base.get_rankings(*ranking_args)
+            dirty = changed_items(old_rows, rows)
+            await uow.dirty_item.mark(list(dirty), built_at)
+            logger.info(
+                f"CooccurrenceService: ранжирование изменилось у {len(dirty)} товаров."
+            )
+        await uow.commit()
+        logger.info("CooccurrenceService: база знаний Lift обновлена.")
+
+    @staticmethod
+    async def refresh_neighbors(uow: IUnitOfWork) -> None:
+        """
+        Пересобрать индекс top-K соседей товаров по текущим счетчикам
+        и, если задан MODEL_SNAPSHOT_DIR, опубликовать его mmap-снимок.
+        Если рекомендации генерирует движок neighbors, товары, у которых
+        изменился список соседей, отмечаются в dirty_items, а водяной знак
+        сборки сохраняется для генерации.
+        :param uow:
+        :return:
+        """
+        built_at = datetime.now(timezone.utc)
+        watermark = await uow.purchase.get_settled_purchase_id()
+        total_transactions = await uow.purchase_counter.get_count_purchases()
+        old_rows = await uow.item_neighbor.get_neighbors()
+        await uow.item_neighbor.rebuild(
+            total_transactions,
+            settings.NEIGHBORS_MIN_PAIR_COUNT,
+            settings.NEIGHBORS_TOP_K,
+        )
+        rows = await uow.item_neighbor.get_neighbors()
+        await uow.model_watermark.set_watermark("neighbors", watermark, built_at)
+        if settings.RECOMMENDATION_ENGINE == "neighbors":
+            dirty = changed_items(old_rows, rows)
+            await uow.dirty_item.mark(list(dirty), built_at)
+            logger.info(
+                f"CooccurrenceService: соседи изменились у {len(dirty)} товаров."
+            )
+        await uow.commit()
+        if settings.MODEL_SNAPSHOT_DIR:
+            path = write_snapshot(
+                settings.MODEL_SNAPSHOT_DIR,
+                NeighborSnapshot.from_rows(rows, purchase_watermark=watermark),
+            )
+            logger.info(f"CooccurrenceService: снимок индекса соседей — {path}.")
+        logger.info(
+            f"CooccurrenceService: индекс соседей пересобран "
+            f"(top-{settings.NEIGHBORS_TOP_K})."
+        )
@@ -1,10 +1,14 @@
+from collections import Counter
+from datetime import datetime
 from decimal import Decimal
+from typing import Mapping
 
 from app.errors.carts_exceptions import CartUnitNotFoundError, NotEnoughItemsError
 from app.errors.items_exceptions import ItemHasNoPriceError, ItemNotFoundError
 from app.errors.purchases_exceptions import PurchaseNotFoundError
 from app.schemas.purchases import Purchase, PurchaseList
 from app.schemas.users import UserRead
+from app.services.cooccurrence import CooccurrenceService
 from app.utils.logger import logger
 from app.utils.unitofwork import IUnitOfWork
 
@@ -34,6 +38,7 @@ class PurchaseService:
             purchase = await uow.purchase.add_one(data)
 
             total_amount = Decimal("0")
+            item_counts: Counter[int] = Counter()
 
             for cart_unit in cart_units:
                 item = cart_unit.item
@@ -58,6 +63,12 @@ class PurchaseService:
                 purchase_unit = await uow.purchase_unit.add_one(data)
                 purchase.purchase_units.append(purchase_unit)
                 item.stock -= cart_unit.quantity
+                item_counts[cart_unit.item_id] += 1
+
+            # Агрегаты для рекомендаций обновляются в той же транзакции
+            await PurchaseService.record_aggregates(
+                uow, current_user.id, purchase.id, purchase.created_at, item_counts
+            )
 
             purchase.total_amount = total_amount
             data_update = {
@@ -79,6 +90,28 @@ class PurchaseService:
 
             return Purchase.model_validate(created_purchase)
 
+    @staticmethod
+    async def record_aggregates(
+        uow: IUnitOfWork,
+        user_id: int,
+        purchase_id: int,
+        purchased_at: datetime,
+        item_counts: Mapping[int, int],
+    ) -> None:
+        """
+        Обновить агрегаты покупки в транзакции checkout: счетчики товаров,
+        пар и покупок, историю и число покупок пользователя.
+        :param uow:
+        :param user_id:
+        :param purchase_id:
+        :param purchased_at: Purchase.created_at
+        :param item_counts: {item_id: сколько раз товар встретился в покупке}
+        :return:
+        """
+        await CooccurrenceService.record_purchase(uow, item_counts, purchase_id)
+        await uow.user_item_history.increment(user_id, item_counts, purchased_at)
+        await uow.user_purchase_count.increment(user_id)
+
     @staticmethod
     async def get_list_purchases(
         uow: IUnitOfWork, current_user: UserRead, page: int, page_size: int
@@ -99,13 +132,45 @@ class PurchaseService:
             purchases = await uow.purchase.get_purchases(
                 current_user_id=current_user.id, page=page, page_size=page_size
             )
-            total = await uow.purchase.get_count_user_purchases(current_user.id)
+            total = await uow.user_purchase_count.get_count(current_user.id)
             purchases = [Purchase.model_validate(purchase) for purchase in purchases]
             purchase_list = PurchaseList(
-                purchases=purchases, total=total[0], page=page, page_size=page_size
+                purchases=purchases, total=total, page=page, page_size=page_size
             )
         return purchase_list
 
+    @staticmethod
+    async def reconcile_counters(uow: IUnitOfWork) -> int:
+        """
+        Сверить счетчики покупок с таблицей purchases и исправить расхождения.
+        Счетчики блокируются от записи до чтения (в порядке checkout):
+        оформившие заказ к этому моменту закоммичены и видны в purchases,
+        остальные ждут конца сверки и увеличат уже исправленные счетчики.
+        :param uow:
+        :return: сколько счетчиков исправлено
+        """
+        async with uow:
+            await uow.purchase_counter.lock_exclusive()
+            await uow.user_purchase_count.lock_exclusive()
+            actual = await uow.purchase.get_user_purchase_counts()
+            stored = await uow.user_purchase_count.get_counts()
+            drift = {
+                user_id: actual.get(user_id, 0)
+                for user_id in actual.keys() | stored.keys()
+                if actual.get(user_id, 0) != stored.get(user_id)
+            }
+            await uow.user_purchase_count.set_counts(drift)
+
+            total = sum(actual.values())
+            fixed = len(drift)
+            if await uow.purchase_counter.get_total() != total:
+                await uow.purchase_counter.reset(total)
+                fixed += 1
+            await uow.commit()
+        if fixed:
+            logger.warning(f"PurchaseService: исправлено {fixed} счетчиков покупок.")
+        return fixed
+
     @staticmethod
     async def get_purchase(
         uow: IUnitOfWork, current_user: UserRead, purchase_id: int
@@ -1,41 +1,780 @@
-from app.schemas.recommendations import Recommendation
+import asyncio
+import json
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import AsyncIterator, ClassVar
+
+import numpy as np
+
+from app.core.config import settings
+from app.recommender.minhash import MinHashLSH
+from app.recommender.neighbors import NeighborIndex
+from app.recommender.popularity import fallback_levels, popularity_rows
+from app.recommender.snapshot import NeighborSnapshot, current_snapshot_path
+from app.recommender.sparse import CsrMatrix, SparseCooccurrenceEngine
+from app.schemas.items import ItemRead
+from app.schemas.recommendations import (
+    LiveRecommendation,
+    Recommendation,
+    RecommendationWithItem,
+)
+from app.utils.cache import (
+    CacheBackend,
+    TieredCache,
+    coordination_backend,
+    recommendations_cache,
+)
 from app.utils.logger import logger
 from app.utils.unitofwork import IUnitOfWork
 
+# Сколько пользователей выбирать одним запросом в пакетной выдаче
+BATCH_CHUNK_SIZE = 1000
+
+
+def ranked_rows(user_id: int, recommendations, source: str = "lift") -> list[dict]:
+    """
+    Превратить отсортированных по Lift кандидатов в строки recommendations.
+    :param user_id:
+    :param recommendations:
+    :param source: lift или popular
+    :return:
+    """
+    return [
+        {
+            "user_id": user_id,
+            "item_id": rec["recommended_item_id"],
+            "rank": rank,
+            "score": rec["lift"],
+            "source": source,
+        }
+        for rank, rec in enumerate(recommendations, start=1)
+    ]
+
 
 class RecommendationService:
-    @staticmethod
-    async def generate_recommendations(
-        uow: IUnitOfWork, user_id: int, min_pair_count: int
+    # Read-through кеш готовых списков рекомендаций по user_id
+    cache: ClassVar[TieredCache] = recommendations_cache
+    # Ключи дедупликации задач генерации
+    locks: ClassVar[CacheBackend] = coordination_backend
+    # Загруженный sparse-движок и момент загрузки (time.monotonic)
+    _sparse_engine: ClassVar[tuple[float, SparseCooccurrenceEngine] | None] = None
+    # Кандидаты MinHash/LSH для загруженного sparse-движка
+    _lsh_candidates: ClassVar[tuple[SparseCooccurrenceEngine, CsrMatrix] | None] = None
+    # Загруженный индекс соседей, момент загрузки и флаг идущей загрузки
+    _neighbor_index: ClassVar[tuple[float, NeighborIndex | NeighborSnapshot] | None] = (
+        None
+    )
+    _neighbor_index_loading: ClassVar[bool] = False
+
+    @classmethod
+    async def get_sparse_engine(cls, uow: IUnitOfWork) -> SparseCooccurrenceEngine:
+        """
+        Вернуть sparse-движок, загрузив purchase_units в память,
+        если движок еще не загружен или устарел.
+        :param uow:
+        :return:
+        """
+        now = time.monotonic()
+        if (
+            cls._sparse_engine is None
+            or now - cls._sparse_engine[0] > settings.SPARSE_ENGINE_TTL_SECONDS
+        ):
+            purchase_watermark = await uow.purchase.get_settled_purchase_id()
+            baskets = np.array(await uow.purchase_unit.get_baskets(), dtype=np.int64)
+            baskets = baskets.reshape(-1, 2)
+            total_transactions = await uow.purchase_counter.get_count_purchases()
+            engine = SparseCooccurrenceEngine(
+                baskets[:, 0], baskets[:, 1], total_transactions, purchase_watermark
+            )
+            logger.info(
+                f"RecommendationService: sparse-движок загружен, "
+                f"{len(baskets)} позиций, {engine.n_items} товаров."
+            )
+            cls._sparse_engine = (now, engine)
+        return cls._sparse_engine[1]
+
+    @classmethod
+    def invalidate_sparse_engine(cls) -> None:
+        """
+        Сбросить загруженный sparse-движок (перечитается при следующем вызове).
+        :return:
+        """
+        cls._sparse_engine = None
+        cls._lsh_candidates = None
+
+    @classmethod
+    def get_lsh_candidates(cls, engine: SparseCooccurrenceEngine) -> CsrMatrix:
+        """
+        Вернуть кандидатов в пары MinHash/LSH, построив их заново,
+        если sparse-движок перезагружен.
+        :param engine:
+        :return:
+        """
+        if cls._lsh_candidates is None or cls._lsh_candidates[0] is not engine:
+            lsh = MinHashLSH(
+                engine.item_baskets,
+                bands=settings.LSH_BANDS,
+                rows_per_band=settings.LSH_ROWS_PER_BAND,
+                max_bucket_size=settings.LSH_MAX_BUCKET_SIZE,
+            )
+            candidates = lsh.candidates()
+            logger.info(
+                f"RecommendationService: LSH — "
+                f"{len(candidates.indices)} пар-кандидатов."
+            )
+            cls._lsh_candidates = (engine, candidates)
+        return cls._lsh_candidates[1]
+
+    @classmethod
+    def neighbor_index_needs_load(cls) -> bool:
+        """
+        Нужно ли (пере)загрузить индекс соседей: он не загружен или устарел
+        (опубликован новый снимок), и загрузка еще не идет.
+        :return:
+        """
+        if cls._neighbor_index_loading:
+            return False
+        if settings.MODEL_SNAPSHOT_DIR:
+            index = cls._neighbor_index[1] if cls._neighbor_index else None
+            path = current_snapshot_path(settings.MODEL_SNAPSHOT_DIR)
+            if path is not None:
+                return not isinstance(index, NeighborSnapshot) or index.path != path
+        return (
+            cls._neighbor_index is None
+            or time.monotonic() - cls._neighbor_index[0]
+            > settings.NEIGHBOR_INDEX_TTL_SECONDS
+        )
+
+    @classmethod
+    async def load_neighbor_index(cls, uow: IUnitOfWork) -> None:
+        """
+        Загрузить индекс соседей: открыть актуальный mmap-снимок
+        из MODEL_SNAPSHOT_DIR, а без него — прочитать item_neighbors в память
+        процесса. Запускается фоновой задачей после ответа, чтобы не тратить
+        бюджет времени запроса. Новый индекс подменяет старый одним
+        присваиванием — запросы видят либо старый, либо новый целиком.
+        :param uow:
+        :return:
+        """
+        if cls._neighbor_index_loading:
+            return
+        cls._neighbor_index_loading = True
+        try:
+            index: NeighborIndex | NeighborSnapshot | None = None
+            if settings.MODEL_SNAPSHOT_DIR:
+                index = NeighborSnapshot.open(settings.MODEL_SNAPSHOT_DIR)
+            if index is None:
+                async with uow:
+                    rows = await uow.item_neighbor.get_neighbors()
+                index = NeighborIndex(rows)
+            cls._neighbor_index = (time.monotonic(), index)
+            logger.info(
+                f"RecommendationService: индекс соседей загружен, {len(index)} товаров."
+            )
+        finally:
+            cls._neighbor_index_loading = False
+
+    @classmethod
+    def current_neighbor_snapshot(cls) -> NeighborSnapshot | None:
+        """
+        Актуальный mmap-снимок индекса соседей из MODEL_SNAPSHOT_DIR:
+        открывается заново, только если опубликован новый (открытие — mmap,
+        без чтения данных). Так API и воркеры считают по одной копии индекса.
+        :return: None, если каталог снимков не задан или снимков еще нет
+        """
+        if not settings.MODEL_SNAPSHOT_DIR:
+            return None
+        if cls.neighbor_index_needs_load():
+            snapshot = NeighborSnapshot.open(settings.MODEL_SNAPSHOT_DIR)
+            if snapshot is not None:
+                cls._neighbor_index = (time.monotonic(), snapshot)
+        index = cls._neighbor_index[1] if cls._neighbor_index else None
+        return index if isinstance(index, NeighborSnapshot) else None
+
+    @classmethod
+    def invalidate_neighbor_index(cls) -> None:
+        """
+        Сбросить загруженный индекс соседей.
+        :return:
+        """
+        cls._neighbor_index = None
+        cls._neighbor_index_loading = False
+
+    @classmethod
+    async def compute_recommendations(
+        cls, uow: IUnitOfWork, user_id: int, min_pair_count: int
     ):
-        total_transactions = await uow.purchase.get_count_purchases()
-        recommendations = await uow.purchase_unit.generate_recommendations(
+        """
+        Посчитать рекомендации движком из settings.RECOMMENDATION_ENGINE.
+        :param uow:
+        :param user_id:
+        :param min_pair_count:
+        :return:
+        """
+        if settings.RECOMMENDATION_ENGINE in ("sparse", "lsh"):
+            engine = await cls.get_sparse_engine(uow)
+            candidates = None
+            if settings.RECOMMENDATION_ENGINE == "lsh":
+                candidates = cls.get_lsh_candidates(engine)
+            user_bought_ids = await uow.user_item_history.get_user_item_ids(user_id)
+            return engine.recommend(
+                user_bought_ids,
+                min_pair_count,
+                limit=settings.RECOMMENDATIONS_TOP_N,
+                candidates=candidates,
+            )
+
+        if settings.RECOMMENDATION_ENGINE == "matview":
+            return await uow.lift_knowledge_base.generate_recommendations(
+                {
+                    "user_id": user_id,
+                    "min_pair_count": min_pair_count,
+                    "limit": settings.RECOMMENDATIONS_TOP_N,
+                }
+            )
+
+        if settings.RECOMMENDATION_ENGINE == "neighbors":
+            snapshot = cls.current_neighbor_snapshot()
+            if snapshot is not None:
+                user_bought_ids = await uow.user_item_history.get_user_item_ids(user_id)
+                return snapshot.recommend(
+                    user_bought_ids, min_pair_count, settings.RECOMMENDATIONS_TOP_N
+                )
+            return await uow.item_neighbor.generate_recommendations(
+                {
+                    "user_id": user_id,
+                    "min_pair_count": min_pair_count,
+                    "limit": settings.RECOMMENDATIONS_TOP_N,
+                }
+            )
+
+        total_transactions: float = await uow.purchase_counter.get_count_purchases()
+        if settings.RECOMMENDATION_ENGINE == "sql":
+            return await uow.purchase_unit.generate_recommendations(
+                {
+                    "user_id": user_id,
+                    "total_transactions": total_transactions,
+                    "min_pair_count": min_pair_count,
+                    "limit": settings.RECOMMENDATIONS_TOP_N,
+                }
+            )
+        decayed = settings.RECOMMENDATION_ENGINE == "decayed"
+        if decayed:
+            total_transactions = await uow.purchase_counter.get_decayed_total()
+        return await uow.item_pair_count.generate_recommendations(
             {
                 "user_id": user_id,
                 "total_transactions": total_transactions,
                 "min_pair_count": min_pair_count,
+                "limit": settings.RECOMMENDATIONS_TOP_N,
+                "decayed": decayed,
             }
         )
+
+    @staticmethod
+    async def inputs_changed(
+        uow: IUnitOfWork, user_id: int, min_pair_count: int
+    ) -> bool:
+        """
+        Изменились ли входные данные с последней генерации: новые покупки
+        пользователя или новые совместные покупки (pair_cnt >= min_pair_count)
+        с товарами из его истории. Изменение одних лишь счетчиков товаров
+        значимым не считается.
+        :param uow:
+        :param user_id:
+        :param min_pair_count:
+        :return:
+        """
+        state = await uow.recommendation_state.fetch_one(user_id=user_id)
+        if state is None or state.min_pair_count != min_pair_count:
+            return True
+        if await uow.purchase.get_last_purchase_id(user_id) > state.purchase_watermark:
+            return True
+        last_pair_purchase_id = await uow.item_pair_count.get_last_purchase_id(
+            user_id, min_pair_count
+        )
+        return last_pair_purchase_id > state.purchase_watermark
+
+    @classmethod
+    async def generate_recommendations(
+        cls, uow: IUnitOfWork, user_id: int, min_pair_count: int
+    ) -> bool:
+        """
+        Пересчитать и сохранить рекомендации пользователя, если с прошлой
+        генерации изменились входные данные.
+        :param uow:
+        :param user_id:
+        :param min_pair_count:
+        :return: был ли выполнен пересчет
+        """
+        if not await cls.inputs_changed(uow, user_id, min_pair_count):
+            logger.info(f"RecommendationService: данные {user_id} не изменились.")
+            return False
+
+        generated_at = datetime.now(timezone.utc)
+        if settings.RECOMMENDATION_ENGINE in ("sparse", "lsh"):
+            # sparse-движок видит данные на момент своей загрузки
+            engine = await cls.get_sparse_engine(uow)
+            purchase_watermark = engine.purchase_watermark
+        elif settings.RECOMMENDATION_ENGINE == "neighbors":
+            # Индекс соседей видит данные на момент своей сборки. Водяной знак
+            # читается до расчета: более новый индекс при расчете безопасен
+            snapshot = cls.current_neighbor_snapshot()
+            if snapshot is not None:
+                purchase_watermark = snapshot.purchase_watermark
+            else:
+                purchase_watermark = await uow.model_watermark.get_watermark(
+                    "neighbors"
+                )
+        elif settings.RECOMMENDATION_ENGINE == "matview":
+            # База знаний Lift видит данные на момент своего обновления
+            purchase_watermark = await uow.model_watermark.get_watermark("matview")
+        else:
+            purchase_watermark = await uow.purchase.get_settled_purchase_id()
+        recommendations = await cls.compute_recommendations(
+            uow, user_id, min_pair_count
+        )
+        source = "lift"
+        if not recommendations:
+            recommendations = await cls.get_popular_fallback(
+                uow, user_id, settings.RECOMMENDATIONS_TOP_N
+            )
+            source = "popular"
         logger.debug(f"RecommendationService: {recommendations=}")
         if recommendations:
-            rec_dict = {
-                "user_id": user_id,
-                "item_id": recommendations[0].get("recommended_item_id"),
+            rows = ranked_rows(user_id, recommendations, source)
+            await uow.recommendation.bulk_upsert(rows, generated_at)
+            logger.debug(f"RecommendationService: {rows=}")
+        await uow.recommendation_state.bulk_upsert(
+            [
+                {
+                    "user_id": user_id,
+                    "min_pair_count": min_pair_count,
+                    "purchase_watermark": purchase_watermark,
+                    "generated_at": generated_at,
+                }
+            ]
+        )
+        await uow.commit()
+        if recommendations:
+            await cls.cache.delete(user_id)
+        return True
+
+    @staticmethod
+    async def get_popular_fallback(
+        uow: IUnitOfWork, user_id: int, limit: int
+    ) -> list[dict]:
+        """
+        Запасные рекомендации из popular_items: популярные товары категорий,
+        в которых покупал пользователь, затем их родительских категорий,
+        затем популярные в целом. Уже купленные товары не предлагаются.
+        :param uow:
+        :param user_id:
+        :param limit:
+        :return: кандидаты в формате compute_recommendations
+        """
+        levels: list[list[int] | None] = []
+        category_ids = await uow.item.get_user_category_ids(user_id)
+        if category_ids:
+            parents = await uow.category.get_parents()
+            levels.extend(fallback_levels(category_ids, parents))
+        levels.append(None)
+
+        picked: list[tuple[int, int]] = []
+        for level in levels:
+            picked.extend(
+                await uow.popular_item.get_popular(
+                    level,
+                    exclude_item_ids=[item_id for item_id, _ in picked],
+                    limit=limit - len(picked),
+                    user_id=user_id,
+                )
+            )
+            if len(picked) >= limit:
+                break
+        return [
+            {"recommended_item_id": item_id, "lift": float(cnt)}
+            for item_id, cnt in picked
+        ]
+
+    @staticmethod
+    async def refresh_popular_items(uow: IUnitOfWork) -> int:
+        """
+        Пересчитать popular_items по item_counts: top-N в целом и по каждой
+        категории вместе с дочерними.
+        :param uow:
+        :return: количество записанных строк
+        """
+        item_stats = await uow.popular_item.get_item_stats()
+        parents = await uow.category.get_parents()
+        rows = popularity_rows(item_stats, parents, settings.POPULAR_ITEMS_TOP_N)
+        await uow.popular_item.replace_all(rows)
+        await uow.commit()
+        logger.info(f"RecommendationService: популярные товары — {len(rows)} строк.")
+        return len(rows)
+
+    @staticmethod
+    def generation_keys(user_id: int, min_pair_count: int) -> tuple[str, str]:
+        """
+        Ключи блокировки поставленной задачи и отметки свежего результата.
+        :param user_id:
+        :param min_pair_count:
+        :return: (lock_key, fresh_key)
+        """
+        suffix = f"{user_id}:{min_pair_count}"
+        return f"recs:task:{suffix}", f"recs:fresh:{suffix}"
+
+    @classmethod
+    async def enqueue_generation(
+        cls, user_id: int, min_pair_count: int, force: bool = False
+    ) -> dict:
+        """
+        Поставить задачу генерации, схлопывая повторные запросы: пока задача
+        для (user_id, min_pair_count) в очереди или выполняется, возвращается
+        ее task_id; свежий готовый результат не требует новой задачи вовсе.
+        :param user_id:
+        :param min_pair_count:
+        :param force: не считать свежим недавно посчитанный результат
+        :return:
+        """
+        from app.utils.celery_tasks import generate_recommendations_task
+
+        lock_key, fresh_key = cls.generation_keys(user_id, min_pair_count)
+        fresh_task_id = None if force else await cls.locks.get(fresh_key)
+        if fresh_task_id is not None:
+            logger.info(f"RecommendationService: рекомендации {user_id} свежие.")
+            return {
+                "result": "recommendations are up to date",
+                "task_id": fresh_task_id,
+                "status": "fresh",
             }
-            recommendations_from_db = await uow.recommendation.fetch_one(
-                user_id=user_id
+
+        task_id = str(uuid.uuid4())
+        acquired = False
+        existing_task_id = None
+        # Блокировка могла истечь между SET NX и GET — тогда еще один SET NX;
+        # повторная неудача значит, что ее уже взял другой запрос
+        for _ in range(2):
+            acquired = await cls.locks.set(
+                lock_key, task_id, settings.GENERATION_LOCK_TTL_SECONDS, nx=True
             )
-            logger.debug(f"RecommendationService: {recommendations_from_db=}")
-            if recommendations_from_db:
-                await uow.recommendation.update(rec_dict, recommendations_from_db.id)
-            else:
-                await uow.recommendation.add_one(rec_dict)
-            logger.debug(f"RecommendationService: {rec_dict=}")
+            if acquired:
+                break
+            existing_task_id = await cls.locks.get(lock_key)
+            if existing_task_id is not None:
+                break
+        if not acquired:
+            logger.info(
+                f"RecommendationService: задача {existing_task_id} "
+                f"для {user_id} уже в очереди."
+            )
+            return {
+                "result": "recommendation generation already in progress",
+                "task_id": existing_task_id,
+                "status": "queued",
+            }
+
+        try:
+            task = generate_recommendations_task.apply_async(
+                args=(user_id, min_pair_count), task_id=task_id
+            )
+        except Exception:
+            # Задача не поставлена — иначе до истечения блокировки всем
+            # отдавался бы task_id, которого нет в брокере
+            await cls.locks.delete_if(lock_key, task_id)
+            raise
+        return {
+            "result": "recommendation generation started",
+            "task_id": task.id,
+            "status": "queued",
+        }
+
+    @staticmethod
+    async def collect_dirty_users(uow: IUnitOfWork) -> tuple[list[int], list[int]]:
+        """
+        Забрать товары из dirty_items и найти их покупателей по индексу
+        товар -> покупки. Водяные знаки найденных пользователей удаляются,
+        чтобы генерация не сочла их данные неизменными.
+        :param uow:
+        :return: (забранные товары, пользователи, которым нужен пересчет)
+        """
+        item_ids = await uow.dirty_item.pop(datetime.now(timezone.utc))
+        user_ids: set[int] = set()
+        for start in range(0, len(item_ids), BATCH_CHUNK_SIZE):
+            user_ids.update(
+                await uow.user_item_history.get_user_ids_by_items(
+                    item_ids[start : start + BATCH_CHUNK_SIZE]
+                )
+            )
+        users = sorted(user_ids)
+        await uow.recommendation_state.delete_users(users)
+        await uow.commit()
+        logger.info(
+            f"RecommendationService: {len(item_ids)} измененных товаров, "
+            f"{len(users)} пользователей к пересчету."
+        )
+        return item_ids, users
+
+    @classmethod
+    async def enqueue_dirty_users(cls, uow: IUnitOfWork, min_pair_count: int) -> int:
+        """
+        Поставить генерацию только для пользователей, купивших товары
+        с изменившимися совместными покупками или соседями. Если поставить
+        задачи не удалось, товары возвращаются в dirty_items до следующего
+        запуска.
+        :param uow:
+        :param min_pair_count:
+        :return: количество пользователей
+        """
+        # Водяные знаки удалены и закоммичены до постановки задач,
+        # иначе задача может счесть данные пользователя неизменными
+        item_ids, users = await cls.collect_dirty_users(uow)
+        try:
+            for user_id in users:
+                await cls.enqueue_generation(user_id, min_pair_count, force=True)
+        except Exception:
+            await uow.dirty_item.mark(item_ids, datetime.now(timezone.utc))
             await uow.commit()
+            raise
+        return len(users)
+
+    @classmethod
+    async def finish_generation(
+        cls, user_id: int, min_pair_count: int, task_id: str | None, success: bool
+    ) -> None:
+        """
+        Снять блокировку задачи (только свою: после истечения TTL ее могла
+        взять другая задача) и, при успехе, отметить результат свежим.
+        :param user_id:
+        :param min_pair_count:
+        :param task_id:
+        :param success:
+        :return:
+        """
+        lock_key, fresh_key = cls.generation_keys(user_id, min_pair_count)
+        if success and task_id:
+            await cls.locks.set(
+                fresh_key, task_id, settings.GENERATION_FRESHNESS_SECONDS
+            )
+        if task_id:
+            await cls.locks.delete_if(lock_key, task_id)
+
+    @classmethod
+    async def generate_all_recommendations(
+        cls, uow: IUnitOfWork, min_pair_count: int
+    ) -> int:
+        """
+        Пересчитать рекомендации всех пользователей: матрица Lift строится
+        один раз, результаты пишутся bulk upsert-ом. Пользователям без
+        результата, как и в generate_recommendations, пишутся популярные
+        товары, а если нет и их — старый список удаляется.
+        :param uow:
+        :param min_pair_count:
+        :return: количество пользователей с новыми рекомендациями
+        """
+        generated_at = datetime.now(timezone.utc)
+        cls.invalidate_sparse_engine()
+        engine = await cls.get_sparse_engine(uow)
+        user_items = np.array(
+            await uow.user_item_history.get_user_item_pairs(), dtype=np.int64
+        ).reshape(-1, 2)
+
+        users: list[int] = []
+        rows: list[dict] = []
+        for user_id, recs in engine.recommend_all(
+            user_items[:, 0],
+            user_items[:, 1],
+            min_pair_count,
+            limit=settings.RECOMMENDATIONS_TOP_N,
+            workers=settings.RECOMMENDATIONS_BUILD_WORKERS,
+        ):
+            users.append(user_id)
+            rows.extend(ranked_rows(user_id, recs))
+        all_users = [int(user_id) for user_id in np.unique(user_items[:, 0])]
+        empty: list[int] = []
+        for user_id in sorted(set(all_users) - set(users)):
+            popular = await cls.get_popular_fallback(
+                uow, user_id, settings.RECOMMENDATIONS_TOP_N
+            )
+            if popular:
+                rows.extend(ranked_rows(user_id, popular, "popular"))
+            else:
+                empty.append(user_id)
+        await uow.recommendation.bulk_upsert(rows, generated_at)
+        await uow.recommendation.delete_users(empty)
+        await uow.recommendation_state.bulk_upsert(
+            [
+                {
+                    "user_id": user_id,
+                    "min_pair_count": min_pair_count,
+                    "purchase_watermark": engine.purchase_watermark,
+                    "generated_at": generated_at,
+                }
+                for user_id in all_users
+            ]
+        )
+        await uow.commit()
+        await cls.cache.delete(*all_users)
+        logger.info(f"RecommendationService: обновлено {len(users)} пользователей.")
+        return len(users)
+
+    @classmethod
+    async def get_live_recommendations(
+        cls, uow: IUnitOfWork, user_id: int, min_pair_count: int, limit: int = 10
+    ) -> tuple[list[LiveRecommendation], str]:
+        """
+        Посчитать рекомендации сразу, по индексу соседей в памяти процесса,
+        уложившись в LIVE_RECOMMENDATIONS_TIMEOUT_MS. Сливаются списки
+        не больше LIVE_RECOMMENDATIONS_MAX_HISTORY последних товаров, а сам
+        расчет идет в пуле потоков, чтобы бюджет ограничивал и его, а не только
+        чтение истории. Если индекс не загружен или бюджет превышен — отдаются
+        сохраненные рекомендации.
+        :param uow:
+        :param user_id:
+        :param min_pair_count:
+        :param limit:
+        :return: (рекомендации, источник: "live" или "stored")
+        """
+        if cls._neighbor_index is not None:
+            index = cls._neighbor_index[1]
+
+            async def score() -> list[dict]:
+                async with uow:
+                    user_bought_ids = await uow.user_item_history.get_user_item_ids(
+                        user_id, limit=settings.LIVE_RECOMMENDATIONS_MAX_HISTORY
+                    )
+                # Синхронный расчет в корутине wait_for прервать не может
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, index.recommend, user_bought_ids, min_pair_count, limit
+                )
+
+            try:
+                recs = await asyncio.wait_for(
+                    score(), timeout=settings.LIVE_RECOMMENDATIONS_TIMEOUT_MS / 1000
+                )
+                return [
+                    LiveRecommendation.model_validate(row)
+                    for row in ranked_rows(user_id, recs)
+                ], "live"
+            except TimeoutError:
+                logger.warning(
+                    f"RecommendationService: live-рекомендации {user_id} "
+                    f"не уложились в бюджет, отдаем сохраненные."
+                )
+
+        stored = await cls.get_recommendations(uow, user_id, limit)
+        return [LiveRecommendation.model_validate(rec) for rec in stored], "stored"
+
+    @classmethod
+    async def get_recommendations(
+        cls, uow: IUnitOfWork, user_id: int, limit: int = 10, offset: int = 0
+    ) -> list[Recommendation]:
+        """
+        Получить страницу рекомендаций пользователя. Весь список читается
+        из кеша, а при промахе — из БД с записью в кеш. Пользователю без
+        сохраненных рекомендаций отдаются популярные товары (source=popular).
+        :param uow:
+        :param user_id:
+        :param limit:
+        :param offset:
+        :return:
+        """
+
+        async def load() -> list:
+            async with uow:
+                recs = await uow.recommendation.get_recommendations(user_id=user_id)
+                logger.debug(f"RecommendationService: {recs=}")
+                loaded = [
+                    Recommendation.model_validate(rec).model_dump(mode="json")
+                    for rec in recs
+                ]
+                if not loaded:
+                    loaded = await cls.get_popular_recommendations(uow, user_id)
+            return loaded
+
+        cached = await cls.cache.get_or_load(user_id, load)
+        return [
+            Recommendation.model_validate(rec)
+            for rec in cached[offset : offset + limit]
+        ]
+
+    @staticmethod
+    async def get_popular_recommendations(uow: IUnitOfWork, user_id: int) -> list:
+        """
+        Популярные в целом товары в виде рекомендаций пользователя
+        (без запросов по его истории).
+        :param uow:
+        :param user_id:
+        :return: рекомендации, сериализованные для кеша
+        """
+        popular = await uow.popular_item.get_popular(
+            None, limit=settings.RECOMMENDATIONS_TOP_N
+        )
+        if not popular:
+            return []
+        refreshed_at = await uow.popular_item.get_refreshed_at()
+        return [
+            Recommendation(
+                id=None,
+                user_id=user_id,
+                item_id=item_id,
+                rank=rank,
+                score=cnt,
+                source="popular",
+                generated_at=refreshed_at or datetime.now(timezone.utc),
+            ).model_dump(mode="json")
+            for rank, (item_id, cnt) in enumerate(popular, start=1)
+        ]
+
+    @staticmethod
+    async def expand_items(
+        uow: IUnitOfWork, recommendations: list[Recommendation]
+    ) -> list[RecommendationWithItem]:
+        """
+        Добавить к рекомендациям данные товаров, загрузив их одним IN-запросом.
+        :param uow:
+        :param recommendations:
+        :return:
+        """
+        async with uow:
+            items = await uow.item.get_items_by_ids(
+                list({rec.item_id for rec in recommendations})
+            )
+            items_by_id = {item.id: ItemRead.model_validate(item) for item in items}
+        return [
+            RecommendationWithItem(
+                **rec.model_dump(), item=items_by_id.get(rec.item_id)
+            )
+            for rec in recommendations
+        ]
 
     @staticmethod
-    async def get_recommendations(uow: IUnitOfWork, user_id: int):
+    async def stream_recommendations(
+        uow: IUnitOfWork, user_ids: list[int], limit: int = 10
+    ) -> AsyncIterator[str]:
+        """
+        Пакетная выдача рекомендаций в формате NDJSON: строка на пользователя
+        в порядке запроса. Пользователи выбираются пачками по BATCH_CHUNK_SIZE,
+        одним запросом на пачку; кеш не используется.
+        :param uow:
+        :param user_ids:
+        :param limit:
+        :return:
+        """
+        user_ids = list(dict.fromkeys(user_ids))
         async with uow:
-            recs = await uow.recommendation.fetch_one(user_id=user_id)
-            logger.debug(f"RecommendationService: {recs=}")
-            return Recommendation.model_validate(recs) if recs else None
+            for start in range(0, len(user_ids), BATCH_CHUNK_SIZE):
+                chunk = user_ids[start : start + BATCH_CHUNK_SIZE]
+                recs = await uow.recommendation.get_recommendations_for_users(
+                    chunk, limit
+                )
+                by_user: defaultdict[int, list[dict]] = defaultdict(list)
+                for rec in recs:
+                    by_user[rec.user_id].append(
+                        Recommendation.model_validate(rec).model_dump(mode="json")
+                    )
+                for user_id in chunk:
+                    line = {"user_id": user_id, "recommendations": by_user[user_id]}
+                    yield json.dumps(line) + "\n"
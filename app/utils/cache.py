@@ -0,0 +1,333 @@
+import asyncio
+import json
+import time
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from app.core.config import settings
+from app.utils.logger import logger
+
+# Сравнение и удаление одной командой: ключ мог уже перейти к другому владельцу
+DELETE_IF_EQUALS_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class CacheBackend(ABC):
+    """
+    Удаленное key-value хранилище строк с TTL (Redis или его замена в тестах).
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> str | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int, nx: bool = False) -> bool: ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None: ...
+
+    @abstractmethod
+    async def delete_if(self, key: str, value: str) -> bool:
+        """
+        Атомарно удалить key, только если в нем записано value.
+        :param key:
+        :param value:
+        :return: был ли ключ удален
+        """
+
+    @abstractmethod
+    async def aclose(self) -> None:
+        """
+        Закрыть соединения текущего event loop (если они есть).
+        :return:
+        """
+
+
+class InMemoryBackend(CacheBackend):
+    """
+    Локальная замена Redis: словарь с TTL в памяти процесса.
+    """
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, str]] = {}
+
+    async def get(self, key: str) -> str | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str, ttl: int, nx: bool = False) -> bool:
+        if nx and await self.get(key) is not None:
+            return False
+        self._data[key] = (time.monotonic() + ttl, value)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def delete_if(self, key: str, value: str) -> bool:
+        if await self.get(key) != value:
+            return False
+        del self._data[key]
+        return True
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisBackend(CacheBackend):
+    """
+    Redis по settings.REDIS_URL. Клиент привязан к event loop, поэтому
+    у каждого цикла свой: у API, у каждого потока воркера (а без постоянного
+    цикла воркера — у каждой задачи). Клиент закрывается через aclose()
+    в конце жизни цикла (см. close_remote_backends).
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def _client(self):
+        from redis.asyncio import Redis
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = Redis.from_url(self.url, decode_responses=True)
+            self._clients[loop] = client
+        return client
+
+    @staticmethod
+    async def _close(client) -> None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Cache: ошибка закрытия клиента Redis: {e}")
+
+    async def get(self, key: str) -> str | None:
+        return await (await self._client()).get(key)
+
+    async def set(self, key: str, value: str, ttl: int, nx: bool = False) -> bool:
+        return bool(await (await self._client()).set(key, value, ex=ttl, nx=nx))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await (await self._client()).delete(*keys)
+
+    async def delete_if(self, key: str, value: str) -> bool:
+        client = await self._client()
+        return bool(await client.eval(DELETE_IF_EQUALS_SCRIPT, 1, key, value))
+
+    async def aclose(self) -> None:
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await self._close(client)
+
+
+class LRUCache:
+    """
+    In-process LRU с TTL: самые давно не читанные записи вытесняются
+    при превышении maxsize.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class TieredCache:
+    """
+    Read-through кеш из двух уровней: LRU в памяти процесса и необязательный
+    удаленный backend (Redis), общий для всех процессов. Значения хранятся
+    в удаленном уровне как JSON под ключом с версией: delete() меняет версию,
+    поэтому запись, прочитанная из БД до инвалидации, попадает под старую
+    версию и никому не отдается. Ошибки удаленного уровня не ломают запрос —
+    он просто считается промахом.
+    """
+
+    def __init__(
+        self,
+        local: LRUCache,
+        remote: CacheBackend | None = None,
+        ttl: int = 300,
+        prefix: str = "",
+    ):
+        self.local = local
+        self.remote = remote
+        self.ttl = ttl
+        self.prefix = prefix
+        # Счетчик инвалидаций процесса: загрузка, во время которой был
+        # delete(), не прогревает локальный уровень
+        self._generation = 0
+
+    def key(self, key: Any) -> str:
+        return f"{self.prefix}{key}"
+
+    async def _version(self, full_key: str) -> str | None:
+        """
+        Текущая версия записи в удаленном уровне ("0", пока не было delete).
+        :param full_key:
+        :return: None, если удаленного уровня нет или он недоступен
+        """
+        if self.remote is None:
+            return None
+        try:
+            return await self.remote.get(f"{full_key}:version") or "0"
+        except Exception as e:
+            logger.warning(f"Cache: ошибка чтения версии {full_key}: {e}")
+            return None
+
+    async def _get_remote(self, full_key: str, version: str) -> Any | None:
+        assert self.remote is not None
+        try:
+            raw = await self.remote.get(f"{full_key}:{version}")
+        except Exception as e:
+            logger.warning(f"Cache: ошибка чтения {full_key}: {e}")
+            return None
+        return None if raw is None else json.loads(raw)
+
+    async def _set_remote(
+        self, full_key: str, version: str, value: Any, nx: bool = False
+    ) -> None:
+        assert self.remote is not None
+        try:
+            await self.remote.set(
+                f"{full_key}:{version}", json.dumps(value), self.ttl, nx=nx
+            )
+        except Exception as e:
+            logger.warning(f"Cache: ошибка записи {full_key}: {e}")
+
+    async def get(self, key: Any) -> Any | None:
+        full_key = self.key(key)
+        value = self.local.get(full_key)
+        if value is not None:
+            return value
+        version = await self._version(full_key)
+        if version is None:
+            return None
+        value = await self._get_remote(full_key, version)
+        if value is not None:
+            self.local.set(full_key, value)
+        return value
+
+    async def get_or_load(self, key: Any, load: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Прочитать значение, а при промахе загрузить его через load()
+        и записать в кеш — только если запись не инвалидировали за время
+        загрузки (версия запоминается до вызова load).
+        :param key:
+        :param load:
+        :return:
+        """
+        full_key = self.key(key)
+        value = self.local.get(full_key)
+        if value is not None:
+            return value
+        generation = self._generation
+        version = await self._version(full_key)
+        if version is not None:
+            value = await self._get_remote(full_key, version)
+        if value is None:
+            value = await load()
+            if version is not None:
+                await self._set_remote(full_key, version, value, nx=True)
+        if generation == self._generation:
+            self.local.set(full_key, value)
+        return value
+
+    async def set(self, key: Any, value: Any) -> None:
+        full_key = self.key(key)
+        self.local.set(full_key, value)
+        version = await self._version(full_key)
+        if version is not None:
+            await self._set_remote(full_key, version, value)
+
+    async def delete(self, *keys: Any) -> None:
+        full_keys = [self.key(key) for key in keys]
+        self._generation += 1
+        self.local.delete(*full_keys)
+        if self.remote is None:
+            return
+        # Версия живет дольше любой записи под ней
+        version = uuid.uuid4().hex
+        try:
+            for full_key in full_keys:
+                await self.remote.set(f"{full_key}:version", version, 2 * self.ttl)
+        except Exception as e:
+            logger.warning(f"Cache: ошибка удаления {full_keys}: {e}")
+
+
+def get_remote_backend() -> CacheBackend | None:
+    """
+    Удаленный уровень кеша: Redis, если он настроен и мы не в тестах.
+    :return:
+    """
+    if settings.REDIS_URL and settings.MODE != "TEST":
+        return RedisBackend(settings.REDIS_URL)
+    return None
+
+
+# Общее для API и воркеров хранилище служебных ключей (дедупликация задач):
+# Redis, а без него — память процесса
+coordination_backend: CacheBackend = get_remote_backend() or InMemoryBackend()
+
+recommendations_cache = TieredCache(
+    local=LRUCache(
+        maxsize=settings.RECOMMENDATIONS_CACHE_SIZE,
+        ttl=settings.RECOMMENDATIONS_CACHE_LOCAL_TTL_SECONDS,
+    ),
+    remote=get_remote_backend(),
+    ttl=settings.RECOMMENDATIONS_CACHE_TTL_SECONDS,
+    prefix="recs:",
+)
+
+
+async def close_remote_backends() -> None:
+    """
+    Закрыть клиенты удаленных хранилищ текущего event loop — вызывается
+    перед завершением цикла (asyncio.run задачи, остановка воркера).
+    :return:
+    """
+    for backend in (coordination_backend, recommendations_cache.remote):
+        if backend is not None:
+            await backend.aclose()
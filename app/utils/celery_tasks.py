@@ -1,14 +1,18 @@
-import asyncio
+from datetime import datetime, timezone
 
 import sentry_sdk
-from celery import Celery
-from celery.signals import worker_process_init
+from celery import Celery, chord, group
+from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 from sentry_sdk.integrations.celery import CeleryIntegration
 
 from app.core.config import settings
-from app.db.database import engine
+from app.db import database
+from app.services.cooccurrence import CooccurrenceService
+from app.services.purchases import PurchaseService
 from app.services.recommendations import RecommendationService
 from app.utils.logger import logger
+from app.utils.worker_loop import run_async, start_worker_loop, stop_worker_loop
 
 
 @worker_process_init.connect
@@ -26,29 +30,249 @@ def init_sentry(**kwargs):
 
 
 @worker_process_init.connect
-def reset_db_connections(**kwargs):
-    engine.pool.dispose()
+def init_worker_loop(**kwargs):
+    if database.IS_WORKER and settings.CELERY_PERSISTENT_LOOP:
+        start_worker_loop()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_worker_loop(**kwargs):
+    stop_worker_loop()
 
 
 celery_app = Celery("tasks", broker=settings.REDIS_URL, backend=settings.REDIS_URL)
 
 celery_app.conf.worker_send_task_events = True
 
+celery_app.conf.beat_schedule = {
+    "nightly-recommendations-refresh": {
+        "task": "generate_all_recommendations_task",
+        "schedule": crontab(hour=3, minute=0),
+        "args": (settings.NIGHTLY_MIN_PAIR_COUNT,),
+    },
+    "hourly-dirty-users-regeneration": {
+        "task": "regenerate_dirty_users_task",
+        "schedule": crontab(minute=50),
+        "args": (settings.NIGHTLY_MIN_PAIR_COUNT,),
+    },
+    "nightly-purchase-counters-reconcile": {
+        "task": "reconcile_purchase_counters_task",
+        "schedule": crontab(hour=4, minute=0),
+    },
+    "hourly-popular-items-refresh": {
+        "task": "refresh_popular_items_task",
+        "schedule": crontab(minute=45),
+    },
+    "hourly-cooccurrence-decay": {
+        "task": "decay_cooccurrence_task",
+        "schedule": crontab(minute=15),
+    },
+}
+
+# Базу знаний Lift читает только движок matview
+if settings.RECOMMENDATION_ENGINE == "matview":
+    celery_app.conf.beat_schedule["nightly-lift-knowledge-base-refresh"] = {
+        "task": "refresh_lift_knowledge_base_task",
+        "schedule": crontab(hour=2, minute=0),
+    }
+
+# Индекс соседей читают движок neighbors и mmap-снимок live-рекомендаций
+if settings.RECOMMENDATION_ENGINE == "neighbors" or settings.MODEL_SNAPSHOT_DIR:
+    celery_app.conf.beat_schedule["nightly-item-neighbors-refresh"] = {
+        "task": "refresh_item_neighbors_task",
+        "schedule": crontab(hour=2, minute=30),
+    }
 
-@celery_app.task(name="generate_recommendations_task")
-def generate_recommendations_task(user_id: int, min_pair_count: int):
+
+@celery_app.task(bind=True, name="generate_recommendations_task")
+def generate_recommendations_task(self, user_id: int, min_pair_count: int):
     logger.info(f"Starting recommendation task for user {user_id}")
 
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        success = False
+        try:
+            async with UnitOfWork() as uow:
+                await RecommendationService.generate_recommendations(
+                    uow, user_id, min_pair_count
+                )
+            success = True
+        finally:
+            await RecommendationService.finish_generation(
+                user_id, min_pair_count, self.request.id, success
+            )
+
+    try:
+        run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="generate_all_recommendations_task")
+def generate_all_recommendations_task(min_pair_count: int):
+    logger.info("Starting bulk recommendation task for all users")
+
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            return await RecommendationService.generate_all_recommendations(
+                uow, min_pair_count
+            )
+
+    try:
+        return run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="regenerate_dirty_users_task")
+def regenerate_dirty_users_task(min_pair_count: int):
+    logger.info("Starting targeted regeneration for dirty users")
+
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            return await RecommendationService.enqueue_dirty_users(uow, min_pair_count)
+
+    try:
+        return run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="count_cooccurrence_partition_task")
+def count_cooccurrence_partition_task(start_id: int, stop_id: int, reference: str):
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            return await CooccurrenceService.count_partition(
+                uow, start_id, stop_id, datetime.fromisoformat(reference)
+            )
+
+    return run_async(run_process())
+
+
+@celery_app.task(name="merge_cooccurrence_task")
+def merge_cooccurrence_task(partials: list[dict], watermark: int, reference: str):
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            return await CooccurrenceService.merge_partitions(
+                uow, partials, watermark, datetime.fromisoformat(reference)
+            )
+
+    try:
+        return run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="rebuild_cooccurrence_task")
+def rebuild_cooccurrence_task(partitions: int | None = None):
+    """
+    Пересчитать item_counts и item_pair_counts map-reduce-ом: chord из
+    map-задач по диапазонам purchase_id и reduce-задачи, сливающей результаты.
+    """
+    logger.info("Starting co-occurrence rebuild")
+
     async def run_process():
         from app.utils.unitofwork import UnitOfWork
 
         async with UnitOfWork() as uow:
-            await RecommendationService.generate_recommendations(
-                uow, user_id, min_pair_count
+            return await CooccurrenceService.get_partitions(
+                uow, partitions or settings.COOCCURRENCE_MAP_PARTITIONS
             )
 
+    watermark, bounds = run_async(run_process())
+    # Один момент затухания на все map-задачи — веса частей согласованы
+    reference = datetime.now(timezone.utc).isoformat()
+    header = group(
+        count_cooccurrence_partition_task.s(start_id, stop_id, reference)
+        for start_id, stop_id in bounds
+    )
+    result = chord(header)(merge_cooccurrence_task.s(watermark, reference))
+    return result.id
+
+
+@celery_app.task(name="decay_cooccurrence_task")
+def decay_cooccurrence_task():
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            return await CooccurrenceService.decay(uow)
+
+    try:
+        return run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="refresh_lift_knowledge_base_task")
+def refresh_lift_knowledge_base_task():
+    logger.info("Starting lift knowledge base refresh")
+
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            await CooccurrenceService.refresh_knowledge_base(uow)
+
+    try:
+        run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="refresh_item_neighbors_task")
+def refresh_item_neighbors_task():
+    logger.info("Starting item neighbors refresh")
+
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            await CooccurrenceService.refresh_neighbors(uow)
+
+    try:
+        run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="refresh_popular_items_task")
+def refresh_popular_items_task():
+    logger.info("Starting popular items refresh")
+
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        async with UnitOfWork() as uow:
+            return await RecommendationService.refresh_popular_items(uow)
+
+    try:
+        return run_async(run_process())
+    except Exception as e:
+        logger.error(f"Task Error: {e}")
+
+
+@celery_app.task(name="reconcile_purchase_counters_task")
+def reconcile_purchase_counters_task():
+    logger.info("Starting purchase counters reconciliation")
+
+    async def run_process():
+        from app.utils.unitofwork import UnitOfWork
+
+        return await PurchaseService.reconcile_counters(UnitOfWork())
+
     try:
-        asyncio.run(run_process())
+        return run_async(run_process())
     except Exception as e:
         logger.error(f"Task Error: {e}")
 
@@ -57,4 +281,5 @@ def generate_recommendations_task(user_id: int, min_pair_count: int):
 # uv run celery -A app.utils.celery_tasks.celery_app worker --loglevel=debug -P eventlet
 # uv run celery -A app.utils.celery_tasks.celery_app worker --loglevel=info -P solo
 # uv run celery -A app.utils.celery_tasks.celery_app flower
+# uv run celery -A app.utils.celery_tasks.celery_app beat --loglevel=info
 # Метрики будут здесь: http://localhost:5555/metrics
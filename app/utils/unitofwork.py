@@ -2,12 +2,31 @@ from abc import ABC, abstractmethod
 
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.db.database import async_session_maker
+from app.db.database import get_session_maker
 from app.repositories.carts import CartRepository
 from app.repositories.categories import CategoryRepository
+from app.repositories.cooccurrence import (
+    CooccurrenceDecayRepository,
+    DirtyItemRepository,
+    ItemCountRepository,
+    ItemNeighborRepository,
+    ItemPairCountRepository,
+    LiftKnowledgeBaseRepository,
+    ModelWatermarkRepository,
+)
 from app.repositories.items import ItemRepository
-from app.repositories.purchases import PurchaseRepository, PurchaseUnitRepository
-from app.repositories.recommendations import RecommendationRepository
+from app.repositories.purchases import (
+    PurchaseCounterRepository,
+    PurchaseRepository,
+    PurchaseUnitRepository,
+    UserItemHistoryRepository,
+    UserPurchaseCountRepository,
+)
+from app.repositories.recommendations import (
+    PopularItemRepository,
+    RecommendationRepository,
+    RecommendationStateRepository,
+)
 from app.repositories.users import UserRepository
 from app.utils.logger import logger
 
@@ -20,7 +39,19 @@ class IUnitOfWork(ABC):
     cart: CartRepository
     purchase: PurchaseRepository
     purchase_unit: PurchaseUnitRepository
+    user_item_history: UserItemHistoryRepository
+    purchase_counter: PurchaseCounterRepository
+    user_purchase_count: UserPurchaseCountRepository
     recommendation: RecommendationRepository
+    recommendation_state: RecommendationStateRepository
+    popular_item: PopularItemRepository
+    item_count: ItemCountRepository
+    item_pair_count: ItemPairCountRepository
+    item_neighbor: ItemNeighborRepository
+    lift_knowledge_base: LiftKnowledgeBaseRepository
+    cooccurrence_decay: CooccurrenceDecayRepository
+    dirty_item: DirtyItemRepository
+    model_watermark: ModelWatermarkRepository
 
     @abstractmethod
     def __init__(self): ...
@@ -48,7 +79,7 @@ class UnitOfWork(IUnitOfWork):
     session: AsyncSession | None
 
     def __init__(self):
-        self.session_factory: async_sessionmaker[AsyncSession] = async_session_maker
+        self.session_factory: async_sessionmaker[AsyncSession] = get_session_maker()
         self.session = None
 
     async def __aenter__(self) -> "UnitOfWork":
@@ -61,7 +92,19 @@ class UnitOfWork(IUnitOfWork):
             self.cart = CartRepository(self.session)
             self.purchase = PurchaseRepository(self.session)
             self.purchase_unit = PurchaseUnitRepository(self.session)
+            self.user_item_history = UserItemHistoryRepository(self.session)
+            self.purchase_counter = PurchaseCounterRepository(self.session)
+            self.user_purchase_count = UserPurchaseCountRepository(self.session)
             self.recommendation = RecommendationRepository(self.session)
+            self.recommendation_state = RecommendationStateRepository(self.session)
+            self.popular_item = PopularItemRepository(self.session)
+            self.item_count = ItemCountRepository(self.session)
+            self.item_pair_count = ItemPairCountRepository(self.session)
+            self.item_neighbor = ItemNeighborRepository(self.session)
+            self.lift_knowledge_base = LiftKnowledgeBaseRepository(self.session)
+            self.cooccurrence_decay = CooccurrenceDecayRepository(self.session)
+            self.dirty_item = DirtyItemRepository(self.session)
+            self.model_watermark = ModelWatermarkRepository(self.session)
 
         return self
 
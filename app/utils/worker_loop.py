@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.db import database
+from app.utils.cache import close_remote_backends
+from app.utils.logger import logger
+
+T = TypeVar("T")
+
+# Постоянный event loop потока воркера: у пула threads задачи идут
+# параллельно в разных потоках, и общий цикл они делить не могут
+_local = threading.local()
+# Циклы всех потоков процесса и их движки — для закрытия при остановке
+_loops: dict[asyncio.AbstractEventLoop, AsyncEngine] = {}
+_loops_lock = threading.Lock()
+
+
+def start_worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Запустить постоянный event loop текущего потока и пул соединений к БД,
+    переиспользуемые всеми задачами этого потока.
+    :return:
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    engine = database.bind_thread_engine()
+    _local.loop = loop
+    with _loops_lock:
+        _loops[loop] = engine
+    logger.info("Worker: event loop и пул соединений запущены.")
+    return loop
+
+
+def stop_worker_loop() -> None:
+    """
+    Закрыть клиенты Redis, пулы соединений и event loop-ы всех потоков
+    процесса. Вызывается при остановке воркера, когда задачи не выполняются.
+    :return:
+    """
+    with _loops_lock:
+        loops = list(_loops.items())
+        _loops.clear()
+    for loop, engine in loops:
+        try:
+            loop.run_until_complete(close_remote_backends())
+            loop.run_until_complete(engine.dispose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+    _local.__dict__.pop("loop", None)
+    database.unbind_thread_engine()
+    asyncio.set_event_loop(None)
+    if loops:
+        logger.info("Worker: event loop и пул соединений закрыты.")
+
+
+async def _run_once(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Выполнить корутину в одноразовом цикле asyncio.run и закрыть клиенты
+    Redis этого цикла до его завершения.
+    :param coro:
+    :return:
+    """
+    try:
+        return await coro
+    finally:
+        await close_remote_backends()
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Выполнить корутину задачи в постоянном event loop текущего потока
+    воркера. Вне воркера (или при CELERY_PERSISTENT_LOOP=False) —
+    через asyncio.run.
+    :param coro:
+    :return:
+    """
+    loop: asyncio.AbstractEventLoop | None = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed():
+        if not (database.IS_WORKER and settings.CELERY_PERSISTENT_LOOP):
+            return asyncio.run(_run_once(coro))
+        # Пулы solo и threads не шлют worker_process_init — цикл потока
+        # запускается при его первой задаче
+        loop = start_worker_loop()
+    return loop.run_until_complete(coro)
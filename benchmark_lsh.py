@@ -0,0 +1,129 @@
+"""
+Бенчмарк MinHash/LSH против точного SQL-пути.
+
+Для выборки пользователей сравнивает PurchaseUnitRepository.generate_recommendations
+(self-join purchase_units) с sparse-движком, который считает Lift только для
+кандидатов LSH, при разных настройках полос. Печатает время и полноту
+(recall@N — доля точных рекомендаций, найденных приближенно).
+
+    python benchmark_lsh.py --users 200 --min-pair-count 2 --config 16x8 --config 32x4
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.recommender.minhash import MinHashLSH
+from app.recommender.sparse import SparseCooccurrenceEngine
+from app.repositories.purchases import (
+    PurchaseCounterRepository,
+    PurchaseUnitRepository,
+    UserItemHistoryRepository,
+)
+
+engine = create_async_engine(settings.DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=engine)
+
+
+def parse_config(value: str) -> tuple[int, int]:
+    bands, rows_per_band = value.lower().split("x")
+    return int(bands), int(rows_per_band)
+
+
+async def run_benchmark(
+    num_users: int, min_pair_count: int, limit: int, configs: list[tuple[int, int]]
+):
+    async with AsyncSessionLocal() as session:
+        purchase_counter = PurchaseCounterRepository(session)
+        purchase_units = PurchaseUnitRepository(session)
+        history = UserItemHistoryRepository(session)
+
+        total_transactions = await purchase_counter.get_count_purchases()
+        baskets = np.array(await purchase_units.get_baskets(), dtype=np.int64)
+        baskets = baskets.reshape(-1, 2)
+        sparse = SparseCooccurrenceEngine(
+            baskets[:, 0], baskets[:, 1], total_transactions
+        )
+        user_ids = sorted(
+            {user_id for user_id, _ in await history.get_user_item_pairs()}
+        )
+        user_ids = random.sample(user_ids, min(num_users, len(user_ids)))
+        print(
+            f"{len(baskets)} позиций, {sparse.n_items} товаров, "
+            f"{len(user_ids)} пользователей, min_pair_count={min_pair_count}"
+        )
+
+        exact: dict[int, set[int]] = {}
+        histories: dict[int, list[int]] = {}
+        start = time.perf_counter()
+        for user_id in user_ids:
+            recs = await purchase_units.generate_recommendations(
+                {
+                    "user_id": user_id,
+                    "total_transactions": total_transactions,
+                    "min_pair_count": min_pair_count,
+                    "limit": limit,
+                }
+            )
+            exact[user_id] = {rec["recommended_item_id"] for rec in recs}
+        sql_time = time.perf_counter() - start
+        for user_id in user_ids:
+            histories[user_id] = await history.get_user_item_ids(user_id)
+        print(f"{'SQL (точно)':<16} {sql_time * 1000 / len(user_ids):>10.2f} мс/польз.")
+
+    print(
+        f"{'полосы x строки':<16} {'мс/польз.':>10} {'построение, с':>14} "
+        f"{'кандидатов':>12} {'recall@' + str(limit):>10}"
+    )
+    for bands, rows_per_band in configs:
+        start = time.perf_counter()
+        candidates = MinHashLSH(
+            sparse.item_baskets, bands=bands, rows_per_band=rows_per_band
+        ).candidates()
+        build_time = time.perf_counter() - start
+
+        found = expected = 0
+        start = time.perf_counter()
+        for user_id in user_ids:
+            recs = sparse.recommend(
+                histories[user_id], min_pair_count, limit, candidates=candidates
+            )
+            found += len(exact[user_id] & {r["recommended_item_id"] for r in recs})
+            expected += len(exact[user_id])
+        lsh_time = time.perf_counter() - start
+
+        recall = found / expected if expected else 1.0
+        print(
+            f"{f'{bands}x{rows_per_band}':<16} "
+            f"{lsh_time * 1000 / len(user_ids):>10.2f} {build_time:>14.2f} "
+            f"{len(candidates.indices):>12} {recall:>10.3f}"
+        )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--min-pair-count", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=settings.RECOMMENDATIONS_TOP_N)
+    parser.add_argument(
+        "--config",
+        type=parse_config,
+        action="append",
+        help="полосы x строки в полосе, например 32x4 (можно несколько раз)",
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(
+            args.users,
+            args.min_pair_count,
+            args.limit,
+            args.config or [(16, 8), (32, 4), (64, 2)],
+        )
+    )
@@ -1,6 +1,6 @@
 import asyncio
 import random
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 import faker_commerce
@@ -10,6 +10,22 @@ from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from app.core.config import settings
 from app.models import Category, Item, Purchase, PurchaseUnit, User
+from app.recommender.popularity import popularity_rows
+from app.repositories.categories import CategoryRepository
+from app.repositories.cooccurrence import (
+    CooccurrenceDecayRepository,
+    ItemCountRepository,
+    ItemNeighborRepository,
+    ItemPairCountRepository,
+    LiftKnowledgeBaseRepository,
+)
+from app.repositories.purchases import (
+    PurchaseCounterRepository,
+    PurchaseRepository,
+    UserItemHistoryRepository,
+    UserPurchaseCountRepository,
+)
+from app.repositories.recommendations import PopularItemRepository
 from app.utils.security import get_password_hash
 
 DATABASE_URL = settings.DATABASE_URL
@@ -67,7 +83,22 @@ async def seed_data():
             # 1. Очистка и сброс ID
             print("Очистка базы и сброс счетчиков ID...")
             # Порядок в списке важен: от дочерних к родительским
-            tables = ["purchase_units", "purchases", "items", "categories", "users"]
+            tables = [
+                "popular_items",
+                "item_neighbors",
+                "purchase_counters",
+                "user_purchase_counts",
+                "user_item_history",
+                "dirty_items",
+                "cooccurrence_decay",
+                "item_pair_counts",
+                "item_counts",
+                "purchase_units",
+                "purchases",
+                "items",
+                "categories",
+                "users",
+            ]
             for table in tables:
                 await session.execute(
                     text(f"TRUNCATE TABLE {table} RESTART IDENTITY CASCADE;")
@@ -128,6 +159,32 @@ async def seed_data():
 
             # 6. Заказы
             await seed_purchases(session, users, items)
+            await session.flush()
+
+            # 7. Агрегаты совместных покупок для рекомендаций
+            await UserItemHistoryRepository(session).rebuild()
+            await PurchaseCounterRepository(session).reset(NUM_PURCHASES)
+            await PurchaseCounterRepository(session).reset_decayed(NUM_PURCHASES)
+            await UserPurchaseCountRepository(session).set_counts(
+                await PurchaseRepository(session).get_user_purchase_counts()
+            )
+            await ItemCountRepository(session).rebuild()
+            await ItemPairCountRepository(session).rebuild()
+            await CooccurrenceDecayRepository(session).reset(datetime.now(timezone.utc))
+            await ItemNeighborRepository(session).rebuild(
+                NUM_PURCHASES,
+                settings.NEIGHBORS_MIN_PAIR_COUNT,
+                settings.NEIGHBORS_TOP_K,
+            )
+            await LiftKnowledgeBaseRepository(session).refresh()
+            popular_items = PopularItemRepository(session)
+            await popular_items.replace_all(
+                popularity_rows(
+                    await popular_items.get_item_stats(),
+                    await CategoryRepository(session).get_parents(),
+                    settings.POPULAR_ITEMS_TOP_N,
+                )
+            )
 
             await session.commit()
             print(
@@ -1,5 +1,7 @@
 import pytest
 
+from app.models import Item, ItemNeighbor
+
 
 @pytest.mark.asyncio
 async def test_cart_workflow(client, setup_cart_db, cart_auth_headers):
@@ -60,3 +62,73 @@ async def test_cart_unauthorized(client):
     # Проверка защиты
     r = await client.get("/cart/")
     assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_cart_recommendations(
+    client, session_factory, setup_cart_db, cart_auth_headers
+):
+    """Часто покупаемые вместе с корзиной товары — из индекса соседей."""
+    phone, laptop = setup_cart_db["item1"], setup_cart_db["item2"]
+    async with session_factory() as session:
+        case = Item(
+            name="Case",
+            price=10,
+            category_id=phone.category_id,
+            stock=5,
+            description="-",
+        )
+        charger = Item(
+            name="Charger",
+            price=20,
+            category_id=phone.category_id,
+            stock=0,
+            description="-",
+        )
+        session.add_all([case, charger])
+        await session.flush()
+        session.add_all(
+            [
+                ItemNeighbor(
+                    item_id=phone.id, neighbor_id=charger.id, rank=1, lift=3, pair_cnt=4
+                ),
+                ItemNeighbor(
+                    item_id=phone.id, neighbor_id=case.id, rank=2, lift=2, pair_cnt=4
+                ),
+                ItemNeighbor(
+                    item_id=phone.id,
+                    neighbor_id=laptop.id,
+                    rank=3,
+                    lift=1.5,
+                    pair_cnt=4,
+                ),
+                ItemNeighbor(
+                    item_id=laptop.id,
+                    neighbor_id=phone.id,
+                    rank=1,
+                    lift=1.5,
+                    pair_cnt=4,
+                ),
+            ]
+        )
+        await session.commit()
+
+    await client.post(
+        "/cart/units",
+        json={"item_id": phone.id, "quantity": 1},
+        headers=cart_auth_headers,
+    )
+    response = await client.get("/cart/recommendations", headers=cart_auth_headers)
+    assert response.status_code == 200
+    # Charger закончился на складе
+    assert [r["name"] for r in response.json()] == ["Case", "Laptop"]
+
+    await client.post(
+        "/cart/units",
+        json={"item_id": laptop.id, "quantity": 1},
+        headers=cart_auth_headers,
+    )
+    response = await client.get(
+        "/cart/recommendations", params={"limit": 1}, headers=cart_auth_headers
+    )
+    assert response.json() == [{"item_id": case.id, "name": "Case", "score": 2.0}]
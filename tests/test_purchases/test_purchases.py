@@ -1,7 +1,11 @@
 import pytest
-from sqlalchemy import select
+from sqlalchemy import func, select
 
+from app.models.cooccurrence import ItemCount, ItemPairCount
 from app.models.items import Item
+from app.models.purchases import Purchase, UserItemHistory
+from app.services.purchases import PurchaseService
+from app.utils.unitofwork import UnitOfWork
 
 
 @pytest.mark.asyncio
@@ -120,3 +124,104 @@ async def test_get_purchase_by_id(client, setup_purchase_data, purchase_auth_hea
     response = await client.get(f"/purchases/{p_id}", headers=purchase_auth_headers)
     assert response.status_code == 200
     assert response.json()["id"] == p_id
+
+
+@pytest.mark.asyncio
+async def test_checkout_updates_cooccurrence_counts(
+    client, setup_purchase_data, purchase_auth_headers, session_factory
+):
+    """Checkout в той же транзакции обновляет item_counts и item_pair_counts."""
+    item1 = setup_purchase_data["item1"]
+    item2 = setup_purchase_data["item2"]
+
+    for _ in range(2):
+        for item in (item1, item2):
+            await client.post(
+                "/cart/units",
+                json={"item_id": item.id, "quantity": 1},
+                headers=purchase_auth_headers,
+            )
+        response = await client.get(
+            "/purchases/checkout", headers=purchase_auth_headers
+        )
+        assert response.status_code == 200
+
+    async with session_factory() as session:
+        counts = (await session.execute(select(ItemCount))).scalars().all()
+        pairs = (await session.execute(select(ItemPairCount))).scalars().all()
+
+    assert {c.item_id: c.total_cnt for c in counts} == {item1.id: 2, item2.id: 2}
+    assert {(p.id_a, p.id_b): p.pair_cnt for p in pairs} == {
+        (item1.id, item2.id): 2,
+        (item2.id, item1.id): 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_checkout_updates_user_item_history(
+    client, setup_purchase_data, purchase_auth_headers, session_factory
+):
+    """Checkout считает заказы с товаром, а не единицы товара."""
+    item1 = setup_purchase_data["item1"]
+    item2 = setup_purchase_data["item2"]
+
+    for items in ((item1, item2), (item1,)):
+        for item in items:
+            await client.post(
+                "/cart/units",
+                json={"item_id": item.id, "quantity": 2},
+                headers=purchase_auth_headers,
+            )
+        response = await client.get(
+            "/purchases/checkout", headers=purchase_auth_headers
+        )
+        assert response.status_code == 200
+
+    async with session_factory() as session:
+        history = (await session.execute(select(UserItemHistory))).scalars().all()
+        last_created_at = (
+            await session.execute(select(func.max(Purchase.created_at)))
+        ).scalar()
+
+    assert {h.item_id: h.purchase_cnt for h in history} == {item1.id: 2, item2.id: 1}
+    assert len({h.user_id for h in history}) == 1
+    # Время покупки берется из заказа, а не из часов приложения
+    last = {h.item_id: h.last_purchased_at for h in history}
+    assert last[item1.id].replace(tzinfo=None) == last_created_at.replace(tzinfo=None)
+
+
+@pytest.mark.asyncio
+async def test_purchase_counters_and_reconcile(
+    client, setup_purchase_data, purchase_auth_headers, session_factory
+):
+    """Счетчики покупок обновляются при checkout, сверка исправляет расхождение."""
+    item1 = setup_purchase_data["item1"]
+    for _ in range(2):
+        await client.post(
+            "/cart/units",
+            json={"item_id": item1.id, "quantity": 1},
+            headers=purchase_auth_headers,
+        )
+        response = await client.get(
+            "/purchases/checkout", headers=purchase_auth_headers
+        )
+        assert response.status_code == 200
+
+    response = await client.get("/purchases/", headers=purchase_auth_headers)
+    assert response.json()["total"] == 2
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        assert await uow.purchase_counter.get_total() == 2
+        # Расхождение: потерянное обновление и лишний шард
+        user_id = (await uow.user_purchase_count.find_all())[0].user_id
+        await uow.user_purchase_count.set_counts({user_id: 5})
+        await uow.purchase_counter.increment(purchase_id=1000)
+        await uow.commit()
+
+    assert await PurchaseService.reconcile_counters(uow) == 2
+    assert await PurchaseService.reconcile_counters(uow) == 0
+    async with uow:
+        assert await uow.purchase_counter.get_total() == 2
+        assert await uow.user_purchase_count.get_count(user_id) == 2
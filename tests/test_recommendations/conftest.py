@@ -1,24 +1,72 @@
+from datetime import datetime, timezone
 from unittest.mock import MagicMock
 
 import pytest
 import pytest_asyncio
 
 from app.models import Category, Item, Purchase, PurchaseUnit, User
+from app.repositories.cooccurrence import (
+    CooccurrenceDecayRepository,
+    ItemCountRepository,
+    ItemNeighborRepository,
+    ItemPairCountRepository,
+    LiftKnowledgeBaseRepository,
+)
+from app.repositories.purchases import (
+    PurchaseCounterRepository,
+    UserItemHistoryRepository,
+)
+from app.services.purchases import PurchaseService
+from app.services.recommendations import RecommendationService
+from app.utils.cache import InMemoryBackend, LRUCache, TieredCache
 from app.utils.security import get_password_hash
+from app.utils.unitofwork import UnitOfWork
+
+
+@pytest.fixture(autouse=True)
+def reset_sparse_engine():
+    """sparse-движок и индекс соседей живут в процессе — сбрасываем между тестами."""
+    RecommendationService.invalidate_sparse_engine()
+    RecommendationService.invalidate_neighbor_index()
+    yield
+    RecommendationService.invalidate_sparse_engine()
+    RecommendationService.invalidate_neighbor_index()
+
+
+@pytest.fixture(autouse=True)
+def recommendations_cache(mocker):
+    """Свежий кеш на каждый тест; InMemoryBackend заменяет Redis."""
+    cache = TieredCache(
+        local=LRUCache(maxsize=100, ttl=60), remote=InMemoryBackend(), prefix="recs:"
+    )
+    mocker.patch.object(RecommendationService, "cache", cache)
+    return cache
 
 
 @pytest.fixture
 def mock_recommendation_task(mocker):
     """Изолируем Celery."""
-    mock_task = MagicMock()
-    mock_task.id = "fake-task-id-123"
-    # Путь должен совпадать с тем, где импортируется задача в роуте
+
+    def apply_async(args=None, task_id=None, **kwargs):
+        mock_task = MagicMock()
+        mock_task.id = task_id
+        return mock_task
+
+    # Путь должен совпадать с тем, где импортируется задача в сервисе
     return mocker.patch(
-        "app.utils.celery_tasks.generate_recommendations_task.delay",
-        return_value=mock_task,
+        "app.utils.celery_tasks.generate_recommendations_task.apply_async",
+        side_effect=apply_async,
     )
 
 
+@pytest.fixture(autouse=True)
+def generation_locks(mocker):
+    """Ключи дедупликации генерации — в памяти, свежие на каждый тест."""
+    backend = InMemoryBackend()
+    mocker.patch.object(RecommendationService, "locks", backend)
+    return backend
+
+
 @pytest_asyncio.fixture
 async def setup_complex_purchases(session_factory):
     """
@@ -98,6 +146,68 @@ async def setup_complex_purchases(session_factory):
                 total_price=100,
             )
         )
+        await session.flush()
+
+        # Агрегаты совместных покупок (в проде обновляются при checkout)
+        await UserItemHistoryRepository(session).rebuild()
+        await PurchaseCounterRepository(session).reset(2)
+        await PurchaseCounterRepository(session).reset_decayed(2)
+        await ItemCountRepository(session).rebuild()
+        await ItemPairCountRepository(session).rebuild()
+        await CooccurrenceDecayRepository(session).reset(datetime.now(timezone.utc))
+        await ItemNeighborRepository(session).rebuild(
+            total_transactions=2, min_pair_count=1, top_k=50
+        )
+        await LiftKnowledgeBaseRepository(session).refresh()
 
         await session.commit()
         return {"user_id": u1.id, "target_item_id": ib.id}
+
+
+@pytest_asyncio.fixture
+async def add_purchase(session_factory):
+    """Оформить покупку напрямую, обновив агрегаты тем же методом, что и checkout."""
+
+    async def _add_purchase(user_id: int, item_names: list[str]) -> int:
+        uow = UnitOfWork()
+        uow.session_factory = session_factory
+        async with uow:
+            items = []
+            for name in item_names:
+                item = await uow.item.fetch_one(name=name)
+                if item is None:
+                    item = await uow.item.add_one(
+                        {
+                            "name": name,
+                            "price": 100,
+                            "category_id": 1,
+                            "stock": 10,
+                            "description": f"{name} description",
+                        }
+                    )
+                items.append(item)
+
+            purchase = await uow.purchase.add_one(
+                {"user_id": user_id, "status": "completed", "total_amount": 100}
+            )
+            for item in items:
+                await uow.purchase_unit.add_one(
+                    {
+                        "purchase_id": purchase.id,
+                        "item_id": item.id,
+                        "quantity": 1,
+                        "unit_price": 100,
+                        "total_price": 100,
+                    }
+                )
+            await PurchaseService.record_aggregates(
+                uow,
+                user_id,
+                purchase.id,
+                purchase.created_at,
+                {item.id: 1 for item in items},
+            )
+            await uow.commit()
+            return purchase.id
+
+    return _add_purchase
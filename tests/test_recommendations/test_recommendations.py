@@ -1,8 +1,25 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
 import pytest
-from sqlalchemy import select
+from sqlalchemy import delete, event, select
 
-from app.models import Recommendation
+from app.core.config import settings
+from app.models import (
+    Item,
+    ItemCount,
+    ItemNeighbor,
+    ItemPairCount,
+    Purchase,
+    Recommendation,
+)
+from app.recommender.neighbors import NeighborIndex
+from app.repositories.purchases import PurchaseCounterRepository
+from app.services.cooccurrence import CooccurrenceService
 from app.services.recommendations import RecommendationService
+from app.utils.cache import InMemoryBackend, LRUCache, TieredCache
 from app.utils.unitofwork import UnitOfWork
 
 
@@ -13,9 +30,85 @@ async def test_generate_recommendations_api(client, mock_recommendation_task):
         "/recommendations/generate", json={"user_id": 1, "min_pair_count": 1}
     )
     assert resp.status_code == 200
-    assert resp.json()["task_id"] == "fake-task-id-123"
+    assert (
+        resp.json()["task_id"] == mock_recommendation_task.call_args.kwargs["task_id"]
+    )
+    mock_recommendation_task.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_generate_recommendations_coalesced(client, mock_recommendation_task):
+    """Повторные запросы, пока задача в очереди, получают тот же task_id."""
+    payload = {"user_id": 1, "min_pair_count": 1}
+    first = (await client.post("/recommendations/generate", json=payload)).json()
+    second = (await client.post("/recommendations/generate", json=payload)).json()
+    other = (
+        await client.post(
+            "/recommendations/generate", json={"user_id": 1, "min_pair_count": 2}
+        )
+    ).json()
+
+    assert second["task_id"] == first["task_id"]
+    assert second["status"] == "queued"
+    assert other["task_id"] != first["task_id"]
+    assert mock_recommendation_task.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_recommendations_fresh_result(client, mock_recommendation_task):
+    """Завершенная задача снимает блокировку; свежий результат не ставит новую."""
+    payload = {"user_id": 1, "min_pair_count": 1}
+    first = (await client.post("/recommendations/generate", json=payload)).json()
+
+    await RecommendationService.finish_generation(1, 1, first["task_id"], True)
+    fresh = (await client.post("/recommendations/generate", json=payload)).json()
+    assert fresh == {
+        "result": "recommendations are up to date",
+        "task_id": first["task_id"],
+        "status": "fresh",
+    }
     mock_recommendation_task.assert_called_once()
 
+    # Упавшая задача только снимает блокировку — следующий запрос ставит новую
+    payload = {"user_id": 1, "min_pair_count": 2}
+    queued = (await client.post("/recommendations/generate", json=payload)).json()
+    # Чужая задача (например, после истечения TTL) блокировку не снимает
+    await RecommendationService.finish_generation(1, 2, "other-task", False)
+    again = (await client.post("/recommendations/generate", json=payload)).json()
+    assert again["task_id"] == queued["task_id"]
+    await RecommendationService.finish_generation(1, 2, queued["task_id"], False)
+    await client.post("/recommendations/generate", json=payload)
+    assert mock_recommendation_task.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_generate_recommendations_broker_error(
+    client, mock_recommendation_task, generation_locks
+):
+    """Ошибка брокера снимает блокировку — следующий запрос ставит задачу."""
+    mock_recommendation_task.side_effect = ConnectionError("broker is down")
+    with pytest.raises(ConnectionError):
+        await RecommendationService.enqueue_generation(1, 1)
+    lock_key, _ = RecommendationService.generation_keys(1, 1)
+    assert await generation_locks.get(lock_key) is None
+
+
+@pytest.mark.asyncio
+async def test_generate_recommendations_lock_expired_between_calls(
+    mock_recommendation_task, generation_locks, mocker
+):
+    """Блокировка, истекшая между SET NX и GET, не перезаписывается безусловно."""
+    # Первый SET NX проигрывает, GET уже ничего не видит, а повторный SET NX
+    # проигрывает другому запросу, успевшему взять блокировку
+    mocker.patch.object(generation_locks, "set", side_effect=[False, False])
+    mocker.patch.object(generation_locks, "get", return_value=None)
+
+    result = await RecommendationService.enqueue_generation(1, 1)
+
+    assert result["status"] == "queued"
+    assert mock_recommendation_task.call_count == 0
+    assert all(call.kwargs.get("nx") for call in generation_locks.set.call_args_list)
+
 
 @pytest.mark.asyncio
 async def test_recommendation_logic_integration(
@@ -137,3 +230,959 @@ async def test_generate_recommendations_schema_validation(
     """Проверка валидации Pydantic-схемы RecommendationCreate в POST /generate"""
     response = await client.post("/recommendations/generate", json=payload)
     assert response.status_code == expected_status
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "engine", ["sql", "aggregate", "sparse", "neighbors", "lsh", "decayed", "matview"]
+)
+async def test_recommendation_engines_agree(
+    session_factory, setup_complex_purchases, mocker, engine
+):
+    """Все движки дают одинаковую рекомендацию на одних и тех же данных."""
+    mocker.patch.object(settings, "RECOMMENDATION_ENGINE", engine)
+    # Одна строка в полосе LSH — все пересекающиеся товары становятся кандидатами
+    mocker.patch.object(settings, "LSH_ROWS_PER_BAND", 1)
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    user_id = setup_complex_purchases["user_id"]
+
+    async with uow:
+        await RecommendationService.generate_recommendations(
+            uow, user_id=user_id, min_pair_count=1
+        )
+
+    async with session_factory() as session:
+        res = await session.execute(select(Recommendation).filter_by(user_id=user_id))
+        rec = res.scalar_one()
+        assert rec.item_id == setup_complex_purchases["target_item_id"]
+
+
+@pytest.mark.asyncio
+async def test_generate_all_recommendations(session_factory, setup_complex_purchases):
+    """Bulk-пересчет пишет рекомендации всем пользователям одним upsert-ом."""
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    user_id = setup_complex_purchases["user_id"]
+
+    async with session_factory() as session:
+        session.add(Recommendation(user_id=user_id, item_id=999))
+        session.add(Recommendation(user_id=2, item_id=999))
+        await session.commit()
+
+    async with uow:
+        updated = await RecommendationService.generate_all_recommendations(
+            uow, min_pair_count=1
+        )
+
+    # User 2 купил оба товара — рекомендовать ему нечего, старый список удален
+    assert updated == 1
+    async with session_factory() as session:
+        res = await session.execute(select(Recommendation))
+        recs = res.scalars().all()
+        assert [(r.user_id, r.item_id) for r in recs] == [
+            (user_id, setup_complex_purchases["target_item_id"])
+        ]
+
+
+@pytest.mark.asyncio
+async def test_generate_all_recommendations_popular_fallback(
+    session_factory, add_purchase
+):
+    """Bulk-пересчет пишет популярные товары пользователям без значимых пар."""
+    await add_purchase(1, ["Item A", "Item B"])
+    await add_purchase(2, ["Item A", "Item B"])
+    await add_purchase(3, ["Item C"])
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await RecommendationService.refresh_popular_items(uow)
+        await RecommendationService.generate_all_recommendations(uow, min_pair_count=1)
+        assert await uow.recommendation_state.fetch_one(user_id=3) is not None
+
+    async with session_factory() as session:
+        res = await session.execute(select(Recommendation).filter_by(user_id=3))
+        recs = res.scalars().all()
+    assert {r.source for r in recs} == {"popular"}
+    assert len(recs) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_recommendations_ranked_page(client, session_factory):
+    """GET /recommendations/ отдает ранжированный список с limit/offset."""
+    async with session_factory() as session:
+        session.add_all(
+            [
+                Recommendation(
+                    user_id=7, item_id=100 + rank, rank=rank, score=10 - rank
+                )
+                for rank in range(1, 6)
+            ]
+        )
+        await session.commit()
+
+    response = await client.get(
+        "/recommendations/", params={"user_id": 7, "limit": 2, "offset": 1}
+    )
+    assert response.status_code == 200
+    recs = response.json()["recommendations"]
+    assert [(r["rank"], r["item_id"]) for r in recs] == [(2, 102), (3, 103)]
+
+    response = await client.get("/recommendations/", params={"user_id": 8})
+    assert response.json()["recommendations"] == []
+
+
+@pytest.mark.asyncio
+async def test_generate_recommendations_drops_stale_tail(
+    session_factory, setup_complex_purchases
+):
+    """Новый список короче старого — лишние позиции удаляются."""
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    user_id = setup_complex_purchases["user_id"]
+
+    async with session_factory() as session:
+        session.add_all(
+            [
+                Recommendation(user_id=user_id, item_id=900 + rank, rank=rank)
+                for rank in range(1, 4)
+            ]
+        )
+        await session.commit()
+
+    async with uow:
+        await RecommendationService.generate_recommendations(
+            uow, user_id=user_id, min_pair_count=1
+        )
+
+    async with session_factory() as session:
+        res = await session.execute(select(Recommendation).filter_by(user_id=user_id))
+        recs = res.scalars().all()
+        assert [(r.rank, r.item_id) for r in recs] == [
+            (1, setup_complex_purchases["target_item_id"])
+        ]
+        assert recs[0].score > 0
+
+
+@pytest.mark.asyncio
+async def test_get_recommendations_read_through_cache(
+    client, session_factory, setup_complex_purchases, recommendations_cache
+):
+    """Повторный GET читается из кеша, генерация инвалидирует запись."""
+    user_id = setup_complex_purchases["user_id"]
+    params = {"user_id": user_id}
+
+    assert (await client.get("/recommendations/", params=params)).json() == {
+        "recommendations": []
+    }
+    # Пустой список тоже закеширован и виден другим процессам через remote
+    assert await recommendations_cache.remote.get(f"recs:{user_id}:0") == "[]"
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await RecommendationService.generate_recommendations(
+            uow, user_id=user_id, min_pair_count=1
+        )
+    assert await recommendations_cache.get(user_id) is None
+
+    recs = (await client.get("/recommendations/", params=params)).json()
+    assert [r["item_id"] for r in recs["recommendations"]] == [
+        setup_complex_purchases["target_item_id"]
+    ]
+
+    # Удаляем строки в обход сервиса — ответ все еще из кеша
+    async with session_factory() as session:
+        await session.execute(delete(Recommendation))
+        await session.commit()
+    cached = (await client.get("/recommendations/", params=params)).json()
+    assert cached == recs
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_lru_and_remote():
+    remote = InMemoryBackend()
+    cache = TieredCache(local=LRUCache(maxsize=2, ttl=60), remote=remote)
+
+    await cache.set("a", [1])
+    await cache.set("b", [2])
+    await cache.get("a")
+    await cache.set("c", [3])  # вытесняет давно не читанный "b"
+    assert cache.local.get("b") is None
+    assert cache.local.get("a") == [1]
+
+    # Промах локального уровня добирается из remote и прогревает LRU
+    assert await cache.get("b") == [2]
+    assert cache.local.get("b") == [2]
+
+    await cache.delete("a")
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_skips_stale_load():
+    """Данные, загруженные до инвалидации, не попадают в кеш."""
+    cache = TieredCache(local=LRUCache(maxsize=10, ttl=60), remote=InMemoryBackend())
+
+    async def stale_load():
+        await cache.delete("a")  # генерация закончилась во время чтения БД
+        return ["stale"]
+
+    assert await cache.get_or_load("a", stale_load) == ["stale"]
+    assert await cache.get("a") is None
+
+    async def load():
+        return ["fresh"]
+
+    assert await cache.get_or_load("a", load) == ["fresh"]
+    assert await cache.get("a") == ["fresh"]
+
+
+@pytest.mark.asyncio
+async def test_generate_recommendations_skips_unchanged_inputs(
+    session_factory, setup_complex_purchases, add_purchase, mocker
+):
+    """Без новых покупок и значимых пар повторная генерация не выполняется."""
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    user_id = setup_complex_purchases["user_id"]
+    compute = mocker.spy(RecommendationService, "compute_recommendations")
+
+    async def generate(min_pair_count=1):
+        async with uow:
+            return await RecommendationService.generate_recommendations(
+                uow, user_id=user_id, min_pair_count=min_pair_count
+            )
+
+    assert await generate() is True
+    assert await generate() is False
+    assert compute.call_count == 1
+
+    # Другой порог — другие входные данные
+    assert await generate(min_pair_count=2) is True
+    assert await generate(min_pair_count=1) is True
+
+    # Чужая покупка, не задевающая историю пользователя, — не повод
+    await add_purchase(user_id + 1, ["Item B", "Item C"])
+    assert await generate() is False
+
+    # Новая пара с товаром из истории пользователя — пересчет
+    await add_purchase(user_id + 1, ["Item A", "Item C"])
+    assert await generate() is True
+
+    # Покупки моложе задержки водяного знака могут обгонять незакоммиченные
+    # с меньшим id — пока они не устоялись, генерация не пропускается
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 3600)
+    await add_purchase(user_id + 1, ["Item A", "Item D"])
+    assert await generate() is True
+    assert await generate() is True
+
+
+def test_worker_loop_reused_across_tasks(monkeypatch):
+    from app.db import database
+    from app.utils import worker_loop
+
+    monkeypatch.setattr(database, "IS_WORKER", True)
+    monkeypatch.setattr(settings, "CELERY_PERSISTENT_LOOP", True)
+
+    async def task():
+        return asyncio.get_running_loop(), database.get_session_maker().kw["bind"]
+
+    try:
+        first_loop, first_engine = worker_loop.run_async(task())
+        second_loop, second_engine = worker_loop.run_async(task())
+        assert first_loop is second_loop
+        assert first_engine is second_engine
+        assert UnitOfWork().session_factory.kw["bind"] is first_engine
+    finally:
+        worker_loop.stop_worker_loop()
+    assert first_loop.is_closed()
+    assert database.get_session_maker() is database.async_session_maker
+
+
+def test_worker_loop_per_thread(monkeypatch):
+    """Задачи пула threads выполняются параллельно, каждая в цикле своего потока."""
+    import threading
+
+    from app.db import database
+    from app.utils import worker_loop
+
+    monkeypatch.setattr(database, "IS_WORKER", True)
+    monkeypatch.setattr(settings, "CELERY_PERSISTENT_LOOP", True)
+    barrier = threading.Barrier(2)
+    results: dict[str, tuple] = {}
+    errors: list[BaseException] = []
+
+    async def where():
+        return asyncio.get_running_loop(), database.get_session_maker().kw["bind"]
+
+    async def task():
+        # Оба потока одновременно внутри своих циклов
+        await asyncio.get_running_loop().run_in_executor(None, barrier.wait, 5)
+        return await where()
+
+    def run(name: str) -> None:
+        try:
+            results[name] = (
+                worker_loop.run_async(task()),
+                worker_loop.run_async(where()),
+            )
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("a", "b")]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+    finally:
+        worker_loop.stop_worker_loop()
+    assert not errors
+    (loop_a, engine_a), again_a = results["a"]
+    (loop_b, engine_b), again_b = results["b"]
+    assert loop_a is not loop_b
+    assert engine_a is not engine_b
+    assert again_a == (loop_a, engine_a)
+    assert loop_a.is_closed() and loop_b.is_closed()
+
+
+@pytest.mark.asyncio
+async def test_cooccurrence_map_reduce_matches_rebuild(
+    session_factory, setup_complex_purchases, add_purchase, mocker
+):
+    """Map-reduce по диапазонам purchase_id дает те же счетчики, что и rebuild."""
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    user_id = setup_complex_purchases["user_id"]
+    await add_purchase(user_id, ["Item A", "Item B", "Item B", "Item C"])
+
+    async def snapshot():
+        async with session_factory() as session:
+            items = (await session.execute(select(ItemCount))).scalars().all()
+            pairs = (await session.execute(select(ItemPairCount))).scalars().all()
+            return (
+                sorted((i.item_id, i.total_cnt) for i in items),
+                sorted((p.id_a, p.id_b, p.pair_cnt, p.last_purchase_id) for p in pairs),
+            )
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    reference = datetime.now(timezone.utc)
+    async with uow:
+        watermark, bounds = await CooccurrenceService.get_partitions(uow, 2)
+        partials = [
+            await CooccurrenceService.count_partition(uow, start_id, stop_id, reference)
+            for start_id, stop_id in bounds
+        ]
+    assert len(bounds) == 2
+
+    # Покупка после разбиения досчитывается reduce-шагом
+    await add_purchase(user_id, ["Item C", "Item D"])
+    async with uow:
+        await CooccurrenceService.merge_partitions(uow, partials, watermark, reference)
+    merged = await snapshot()
+
+    async with uow:
+        await uow.item_count.rebuild()
+        await uow.item_pair_count.rebuild()
+        await uow.commit()
+    assert merged == await snapshot()
+
+
+@pytest.mark.asyncio
+async def test_cooccurrence_rebuild_decays_old_purchases(
+    session_factory, setup_complex_purchases, mocker
+):
+    """Полный пересчет взвешивает покупки по возрасту: два периода — вес 1/4."""
+    mocker.patch.object(settings, "DECAY_HALF_LIFE_DAYS", 90)
+    reference = datetime.now(timezone.utc)
+    async with session_factory() as session:
+        # Покупка со связкой A + B сделана два периода полураспада назад
+        purchase = (
+            (await session.execute(select(Purchase).order_by(Purchase.id)))
+            .scalars()
+            .first()
+        )
+        purchase.created_at = reference - timedelta(days=180)
+        await session.commit()
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        watermark, bounds = await CooccurrenceService.get_partitions(uow, 2)
+        partials = [
+            await CooccurrenceService.count_partition(uow, start_id, stop_id, reference)
+            for start_id, stop_id in bounds
+        ]
+        await CooccurrenceService.merge_partitions(uow, partials, watermark, reference)
+
+    async with session_factory() as session:
+        counts = {
+            i.item_id: (i.total_cnt, i.decayed_cnt)
+            for i in (await session.execute(select(ItemCount))).scalars()
+        }
+        pair = (await session.execute(select(ItemPairCount))).scalars().first()
+        decayed_total = await PurchaseCounterRepository(session).get_decayed_total()
+    item_a, item_b = sorted(counts)
+    assert counts[item_a] == (2, pytest.approx(1.25, rel=1e-3))
+    assert counts[item_b] == (1, pytest.approx(0.25, rel=1e-3))
+    assert pair.pair_cnt == 1
+    assert pair.decayed_pair_cnt == pytest.approx(0.25, rel=1e-3)
+    assert decayed_total == pytest.approx(1.25, rel=1e-3)
+
+
+@pytest.mark.asyncio
+async def test_cooccurrence_decay_incremental(
+    session_factory, setup_complex_purchases, mocker
+):
+    """Новая покупка входит с весом 2 ** (прошло / период), затухание его гасит."""
+    mocker.patch.object(settings, "DECAY_HALF_LIFE_DAYS", 90)
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        # Счетчики приведены к моменту период полураспада назад
+        decayed_at = datetime.now(timezone.utc) - timedelta(days=90)
+        await uow.cooccurrence_decay.reset(decayed_at)
+        item_a = min(c.item_id for c in await uow.item_count.find_all())
+        await CooccurrenceService.record_purchase(uow, {item_a: 1}, purchase_id=3)
+        await uow.commit()
+
+        recorded = await uow.item_count.fetch_one(item_id=item_a)
+        assert recorded is not None
+        assert recorded.decayed_cnt == pytest.approx(4, rel=1e-3)
+        factor = await CooccurrenceService.decay(uow)
+
+    assert factor == pytest.approx(0.5, rel=1e-3)
+    async with session_factory() as session:
+        item = await session.get(ItemCount, item_a)
+        decayed_total = await PurchaseCounterRepository(session).get_decayed_total()
+    # Две старые покупки по 1/2 и свежая с весом 1
+    assert item.total_cnt == 3
+    assert item.decayed_cnt == pytest.approx(2, rel=1e-3)
+    assert decayed_total == pytest.approx(2, rel=1e-3)
+
+
+@pytest.mark.asyncio
+async def test_popular_fallback(client, session_factory, setup_complex_purchases):
+    """Без истории или значимых пар отдаются популярные товары."""
+    user_id = setup_complex_purchases["user_id"]
+    target_item_id = setup_complex_purchases["target_item_id"]
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        assert await RecommendationService.refresh_popular_items(uow) > 0
+
+    # Новый пользователь — популярные в целом, без генерации
+    response = await client.get("/recommendations/", params={"user_id": 999})
+    recs = response.json()["recommendations"]
+    assert [(r["item_id"], r["source"], r["id"]) for r in recs] == [
+        (target_item_id - 1, "popular", None),
+        (target_item_id, "popular", None),
+    ]
+
+    # Ни одна пара не проходит порог — популярные из категорий покупок,
+    # кроме уже купленных
+    async with uow:
+        await RecommendationService.generate_recommendations(
+            uow, user_id=user_id, min_pair_count=5
+        )
+    async with session_factory() as session:
+        res = await session.execute(select(Recommendation).filter_by(user_id=user_id))
+        rec = res.scalar_one()
+    assert (rec.item_id, rec.source, rec.score) == (target_item_id, "popular", 1.0)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_dirty_users(
+    session_factory,
+    setup_complex_purchases,
+    add_purchase,
+    mock_recommendation_task,
+    mocker,
+):
+    """Пересчет ставится только покупателям товаров с изменившимися парами."""
+    mocker.patch.object(settings, "NIGHTLY_MIN_PAIR_COUNT", 2)
+    user_id = setup_complex_purchases["user_id"]
+    await add_purchase(3, ["Item C", "Item D"])
+    await add_purchase(4, ["Item D", "Item E"])
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await RecommendationService.generate_recommendations(
+            uow, user_id=user_id, min_pair_count=1
+        )
+        # Соседи A и B не изменились, у C, D и E появились новые
+        mocker.patch.object(settings, "RECOMMENDATION_ENGINE", "neighbors")
+        await CooccurrenceService.refresh_neighbors(uow)
+        await add_purchase(5, ["Item C"])
+        item_ids, users = await RecommendationService.collect_dirty_users(uow)
+        assert await uow.dirty_item.find_all() == []
+        assert await uow.recommendation_state.fetch_one(user_id=user_id) is not None
+    assert users == [3, 4, 5]
+
+    await add_purchase(6, ["Item A", "Item B"])
+    async with uow:
+        assert await RecommendationService.enqueue_dirty_users(uow, 1) == 3
+        assert await uow.recommendation_state.fetch_one(user_id=user_id) is None
+    enqueued = sorted(
+        call.kwargs["args"][0] for call in mock_recommendation_task.call_args_list
+    )
+    assert enqueued == [1, 2, 6]
+
+    # Пара A-B уже значима: новая покупка не отмечает товары
+    await add_purchase(7, ["Item A", "Item B"])
+    async with uow:
+        assert await uow.dirty_item.find_all() == []
+
+
+@pytest.mark.asyncio
+async def test_refresh_neighbors_marks_only_for_neighbors_engine(
+    session_factory, add_purchase, mocker
+):
+    """Индекс соседей, который не читает движок генерации, пересчет не ставит."""
+    mocker.patch.object(settings, "NIGHTLY_MIN_PAIR_COUNT", 2)
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    await add_purchase(1, ["Item A", "Item B"])
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+        assert await uow.dirty_item.find_all() == []
+        assert await uow.model_watermark.get_watermark("neighbors") > 0
+
+        mocker.patch.object(settings, "RECOMMENDATION_ENGINE", "neighbors")
+        await uow.item_neighbor.replace_all([])
+        await CooccurrenceService.refresh_neighbors(uow)
+        assert len(await uow.dirty_item.find_all()) == 2
+
+
+@pytest.mark.asyncio
+async def test_enqueue_dirty_users_failure(
+    session_factory, setup_complex_purchases, add_purchase, mocker
+):
+    """Если задачи не поставились, товары возвращаются в dirty_items."""
+    mocker.patch.object(settings, "NIGHTLY_MIN_PAIR_COUNT", 2)
+    mocker.patch.object(
+        RecommendationService,
+        "enqueue_generation",
+        side_effect=ConnectionError("broker is down"),
+    )
+    await add_purchase(3, ["Item A", "Item B"])
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        with pytest.raises(ConnectionError):
+            await RecommendationService.enqueue_dirty_users(uow, 1)
+        dirty = await uow.dirty_item.find_all()
+    assert len(dirty) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("engine", ["sql", "aggregate", "neighbors", "matview"])
+async def test_history_query_size_constant(
+    session_factory, add_purchase, mocker, engine
+):
+    """История пользователя не попадает в запрос списком id."""
+    mocker.patch.object(settings, "RECOMMENDATION_ENGINE", engine)
+    await add_purchase(1, ["Item A"])
+    await add_purchase(2, [f"Item {i}" for i in range(30)])
+
+    statements: list[tuple[str, int]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, len(parameters)))
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    sync_engine = session_factory.kw["bind"].sync_engine
+    event.listen(sync_engine, "before_cursor_execute", capture)
+    try:
+        sizes = []
+        for user_id in (1, 2):
+            statements.clear()
+            async with uow:
+                await RecommendationService.compute_recommendations(uow, user_id, 1)
+            sizes.append(statements[-1])
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", capture)
+    assert sizes[0] == sizes[1]
+
+
+@pytest.mark.asyncio
+async def test_popular_fallback_history_in_sql(session_factory, add_purchase):
+    """Запасные рекомендации исключают историю подзапросом, а не списком id."""
+    await add_purchase(1, ["Item A"])
+    await add_purchase(2, [f"Item {i}" for i in range(30)])
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await RecommendationService.refresh_popular_items(uow)
+
+    statements: list[tuple[str, int]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, len(parameters)))
+
+    sync_engine = session_factory.kw["bind"].sync_engine
+    event.listen(sync_engine, "before_cursor_execute", capture)
+    try:
+        async with uow:
+            picked = await RecommendationService.get_popular_fallback(uow, 2, 5)
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", capture)
+    assert [p["recommended_item_id"] for p in picked] == [1]
+    assert max(size for _, size in statements) < 30
+
+
+@pytest.mark.asyncio
+async def test_item_neighbors_keep_top_k(session_factory, add_purchase, mocker):
+    """Индекс соседей хранит не больше K партнеров на товар, лучших по Lift."""
+    mocker.patch.object(settings, "NEIGHBORS_TOP_K", 2)
+    await add_purchase(1, ["Hub", "Rare"])
+    await add_purchase(1, ["Hub", "Common"])
+    await add_purchase(1, ["Hub", "Middle"])
+    await add_purchase(1, ["Common", "Middle"])
+    await add_purchase(1, ["Common"])
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+
+    async with session_factory() as session:
+        hub_id = (await session.execute(select(Item.id).filter_by(name="Hub"))).scalar()
+        res = await session.execute(
+            select(Item.name)
+            .join(ItemNeighbor, ItemNeighbor.neighbor_id == Item.id)
+            .where(ItemNeighbor.item_id == hub_id)
+            .order_by(ItemNeighbor.rank)
+        )
+        # Lift(Hub, Rare) > Lift(Hub, Middle) > Lift(Hub, Common)
+        assert res.scalars().all() == ["Rare", "Middle"]
+
+
+@pytest.mark.asyncio
+async def test_neighbors_engine_uses_index_watermark(
+    session_factory, setup_complex_purchases, add_purchase, mocker
+):
+    """Движок neighbors сохраняет водяной знак сборки индекса, а не max(id)."""
+    mocker.patch.object(settings, "RECOMMENDATION_ENGINE", "neighbors")
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    user_id = setup_complex_purchases["user_id"]
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+
+    async def generate():
+        async with uow:
+            generated = await RecommendationService.generate_recommendations(
+                uow, user_id=user_id, min_pair_count=1
+            )
+            state = await uow.recommendation_state.fetch_one(user_id=user_id)
+            assert state is not None
+            return generated, state.purchase_watermark
+
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+        built = await uow.model_watermark.get_watermark("neighbors")
+    assert built > 0
+
+    # Покупка после сборки индекса в выдачу еще не попала
+    await add_purchase(user_id + 1, ["Item A", "Item C"])
+    assert await generate() == (True, built)
+    assert await generate() == (True, built)
+
+    # После пересборки индекса — пересчет с новым водяным знаком
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+    generated, watermark = await generate()
+    assert generated and watermark > built
+    assert (await generate())[0] is False
+
+
+@pytest.mark.asyncio
+async def test_matview_engine_uses_refresh_watermark(
+    session_factory, setup_complex_purchases, add_purchase, mocker
+):
+    """Движок matview сохраняет водяной знак обновления базы знаний Lift."""
+    mocker.patch.object(settings, "RECOMMENDATION_ENGINE", "matview")
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    mocker.patch.object(settings, "NIGHTLY_MIN_PAIR_COUNT", 1)
+    user_id = setup_complex_purchases["user_id"]
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+
+    async def generate():
+        async with uow:
+            generated = await RecommendationService.generate_recommendations(
+                uow, user_id=user_id, min_pair_count=1
+            )
+            state = await uow.recommendation_state.fetch_one(user_id=user_id)
+            assert state is not None
+            return generated, state.purchase_watermark
+
+    async with uow:
+        await CooccurrenceService.refresh_knowledge_base(uow)
+        built = await uow.model_watermark.get_watermark("matview")
+        # Первое обновление сравнивать не с чем — товары не отмечаются
+        assert await uow.dirty_item.find_all() == []
+    assert built > 0
+
+    # Покупка после обновления в базу знаний еще не попала
+    await add_purchase(user_id + 1, ["Item A", "Item C"])
+    async with uow:
+        await uow.dirty_item.pop(datetime.now(timezone.utc))
+        await uow.commit()
+    assert await generate() == (True, built)
+
+    # Обновление отмечает товары с изменившимся ранжированием партнеров
+    # и сдвигает водяной знак
+    async with uow:
+        await CooccurrenceService.refresh_knowledge_base(uow)
+        dirty = {d.item_id for d in await uow.dirty_item.find_all()}
+    assert len(dirty) == 2
+    generated, watermark = await generate()
+    assert generated and watermark > built
+    assert (await generate())[0] is False
+
+
+@pytest.mark.asyncio
+async def test_refresh_knowledge_base_marks_only_for_matview_engine(
+    session_factory, setup_complex_purchases, add_purchase, mocker
+):
+    """Обновление базы знаний не ставит пересчет, если ее не читает движок."""
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    mocker.patch.object(settings, "NIGHTLY_MIN_PAIR_COUNT", 1)
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await CooccurrenceService.refresh_knowledge_base(uow)
+    await add_purchase(3, ["Item A", "Item C"])
+    async with uow:
+        await uow.dirty_item.pop(datetime.now(timezone.utc))
+        await uow.commit()
+        await CooccurrenceService.refresh_knowledge_base(uow)
+        assert await uow.dirty_item.find_all() == []
+
+
+@pytest.mark.asyncio
+async def test_live_recommendations(
+    client, session_factory, setup_complex_purchases, mocker
+):
+    """Без индекса отдаются сохраненные рекомендации, затем — посчитанные сразу."""
+    # Бюджет с запасом: здесь проверяется источник, а не скорость
+    mocker.patch.object(settings, "LIVE_RECOMMENDATIONS_TIMEOUT_MS", 5000)
+    user_id = setup_complex_purchases["user_id"]
+    target_item_id = setup_complex_purchases["target_item_id"]
+    async with session_factory() as session:
+        session.add(Recommendation(user_id=user_id, item_id=999, rank=1, score=1.0))
+        await session.commit()
+
+    params = {"user_id": user_id, "min_pair_count": 1}
+    response = await client.get("/recommendations/live", params=params)
+    assert response.status_code == 200
+    assert response.json()["source"] == "stored"
+    assert response.json()["recommendations"][0]["item_id"] == 999
+
+    # Индекс загружен фоновой задачей предыдущего запроса
+    response = await client.get("/recommendations/live", params=params)
+    data = response.json()
+    assert data["source"] == "live"
+    assert data["recommendations"] == [
+        {"item_id": target_item_id, "rank": 1, "score": pytest.approx(1.0)}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_live_recommendations_latency_budget(
+    client, session_factory, setup_complex_purchases, mocker
+):
+    """Превышение бюджета времени — возврат к сохраненным рекомендациям."""
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    await RecommendationService.load_neighbor_index(uow)
+    mocker.patch.object(settings, "LIVE_RECOMMENDATIONS_TIMEOUT_MS", 0)
+
+    response = await client.get(
+        "/recommendations/live",
+        params={"user_id": setup_complex_purchases["user_id"], "min_pair_count": 1},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"recommendations": [], "source": "stored"}
+
+
+@pytest.mark.asyncio
+async def test_live_recommendations_slow_scoring(
+    client, session_factory, setup_complex_purchases, mocker
+):
+    """Бюджет времени ограничивает и сам расчет по индексу."""
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    await RecommendationService.load_neighbor_index(uow)
+    mocker.patch.object(settings, "LIVE_RECOMMENDATIONS_TIMEOUT_MS", 50)
+
+    def slow_recommend(*args):
+        time.sleep(0.5)
+        return []
+
+    mocker.patch.object(NeighborIndex, "recommend", side_effect=slow_recommend)
+
+    started = time.monotonic()
+    response = await client.get(
+        "/recommendations/live",
+        params={"user_id": setup_complex_purchases["user_id"], "min_pair_count": 1},
+    )
+    assert response.json()["source"] == "stored"
+    assert time.monotonic() - started < 0.4
+
+
+@pytest.mark.asyncio
+async def test_get_recommendations_batch(client, session_factory, mocker):
+    """POST /recommendations/batch отдает NDJSON-строку на каждого пользователя."""
+    mocker.patch("app.services.recommendations.BATCH_CHUNK_SIZE", 2)
+    async with session_factory() as session:
+        session.add_all(
+            [
+                Recommendation(user_id=1, item_id=10, rank=1, score=3.0),
+                Recommendation(user_id=1, item_id=11, rank=2, score=2.0),
+                Recommendation(user_id=2, item_id=12, rank=1, score=1.0),
+            ]
+        )
+        await session.commit()
+
+    response = await client.post(
+        "/recommendations/batch", json={"user_ids": [2, 1, 3, 1], "limit": 1}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [
+        (line["user_id"], [r["item_id"] for r in line["recommendations"]])
+        for line in lines
+    ] == [(2, [12]), (1, [10]), (3, [])]
+
+
+@pytest.mark.asyncio
+async def test_get_recommendations_expand_item(
+    client, session_factory, setup_complex_purchases
+):
+    """expand=item встраивает данные товаров в ответ."""
+    user_id = setup_complex_purchases["user_id"]
+    target_item_id = setup_complex_purchases["target_item_id"]
+    async with session_factory() as session:
+        session.add_all(
+            [
+                Recommendation(user_id=user_id, item_id=target_item_id, rank=1),
+                Recommendation(user_id=user_id, item_id=999, rank=2),
+            ]
+        )
+        await session.commit()
+
+    response = await client.get(
+        "/recommendations/", params={"user_id": user_id, "expand": "item"}
+    )
+    assert response.status_code == 200
+    recs = response.json()["recommendations"]
+    assert recs[0]["item"]["id"] == target_item_id
+    assert recs[0]["item"]["name"] == "Item B"
+    # Товар удален из каталога
+    assert recs[1]["item"] is None
+
+    response = await client.get(
+        "/recommendations/", params={"user_id": user_id, "expand": "category"}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_sql_engine_pruning_matches_aggregate(
+    session_factory, add_purchase, mocker
+):
+    """Отсечение редких товаров и база знаний Lift не меняют результат."""
+    for items in (
+        ["A", "B", "C"],
+        ["A", "B"],
+        ["B", "C", "D"],
+        ["A", "D"],
+        ["A", "B", "Rare"],
+        ["C", "D"],
+    ):
+        await add_purchase(1, items)
+    user_id = 2
+    await add_purchase(user_id, ["A"])
+
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await CooccurrenceService.refresh_knowledge_base(uow)
+    results = {}
+    for engine in ("sql", "aggregate", "matview"):
+        mocker.patch.object(settings, "RECOMMENDATION_ENGINE", engine)
+        async with uow:
+            recs = await RecommendationService.compute_recommendations(
+                uow, user_id, min_pair_count=2
+            )
+        results[engine] = [(rec["recommended_item_id"], rec["lift"]) for rec in recs]
+    assert results["sql"]
+    assert results["sql"] == pytest.approx(results["aggregate"])
+    assert results["sql"] == pytest.approx(results["matview"])
+
+
+@pytest.mark.asyncio
+async def test_live_recommendations_from_snapshot(
+    client, session_factory, setup_complex_purchases, mocker, tmp_path
+):
+    """Пересборка индекса публикует mmap-снимок, API подхватывает новую версию."""
+    mocker.patch.object(settings, "MODEL_SNAPSHOT_DIR", str(tmp_path))
+    mocker.patch.object(settings, "LIVE_RECOMMENDATIONS_TIMEOUT_MS", 5000)
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+
+    assert RecommendationService.neighbor_index_needs_load()
+    await RecommendationService.load_neighbor_index(uow)
+    assert not RecommendationService.neighbor_index_needs_load()
+
+    response = await client.get(
+        "/recommendations/live",
+        params={"user_id": setup_complex_purchases["user_id"], "min_pair_count": 1},
+    )
+    assert response.json()["source"] == "live"
+    assert (
+        response.json()["recommendations"][0]["item_id"]
+        == (setup_complex_purchases["target_item_id"])
+    )
+
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+    assert RecommendationService.neighbor_index_needs_load()
+
+
+@pytest.mark.asyncio
+async def test_neighbors_engine_reads_snapshot(
+    session_factory, setup_complex_purchases, mocker, tmp_path
+):
+    """Генерация в воркере считает по mmap-снимку, а не по item_neighbors."""
+    mocker.patch.object(settings, "MODEL_SNAPSHOT_DIR", str(tmp_path))
+    mocker.patch.object(settings, "RECOMMENDATION_ENGINE", "neighbors")
+    mocker.patch.object(settings, "PURCHASE_WATERMARK_LAG_SECONDS", 0)
+    user_id = setup_complex_purchases["user_id"]
+    uow = UnitOfWork()
+    uow.session_factory = session_factory
+    async with uow:
+        await CooccurrenceService.refresh_neighbors(uow)
+        built = await uow.model_watermark.get_watermark("neighbors")
+
+    async with session_factory() as session:
+        await session.execute(delete(ItemNeighbor))
+        await session.commit()
+
+    async with uow:
+        assert await RecommendationService.generate_recommendations(uow, user_id, 1)
+        state = await uow.recommendation_state.fetch_one(user_id=user_id)
+        recs = await uow.recommendation.get_recommendations(user_id=user_id)
+    assert state is not None and state.purchase_watermark == built
+    assert [rec.item_id for rec in recs] == [setup_complex_purchases["target_item_id"]]
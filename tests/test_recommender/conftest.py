@@ -0,0 +1,37 @@
+from collections import Counter
+from itertools import permutations
+
+import numpy as np
+import pytest
+
+from app.recommender.sparse import SparseCooccurrenceEngine
+
+# purchase_id -> товары в покупке
+BASKETS = {
+    1: [10, 20, 30],
+    2: [10, 20],
+    3: [20, 30, 40],
+    4: [10, 40],
+    5: [50],
+}
+
+
+def brute_force_lift(baskets, history, min_pair_count, total):
+    """Эталон: тот же расчет, что делает SQL-путь, на чистом Python."""
+    item_cnt = Counter(i for items in baskets.values() for i in items)
+    pair_cnt = Counter(
+        pair for items in baskets.values() for pair in permutations(items, 2)
+    )
+    best: dict[int, float] = {}
+    for (a, b), cnt in pair_cnt.items():
+        if a in history and b not in history and cnt >= min_pair_count:
+            lift = cnt * total / (item_cnt[a] * item_cnt[b])
+            best[b] = max(best.get(b, lift), lift)
+    return best
+
+
+@pytest.fixture
+def engine():
+    purchase_ids = np.array([p for p, items in BASKETS.items() for _ in items])
+    item_ids = np.array([i for items in BASKETS.values() for i in items])
+    return SparseCooccurrenceEngine(purchase_ids, item_ids, len(BASKETS))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from app.recommender.minhash import MERSENNE_PRIME, MinHashLSH, minhash_signatures
+from app.recommender.sparse import CsrMatrix
+
+from .conftest import BASKETS, brute_force_lift
+
+
+def test_minhash_estimates_jaccard():
+    # item 0: покупки 0..99, item 1: 50..149 (Жаккар 1/3), item 2 — без покупок
+    items = np.r_[np.zeros(100, dtype=np.int64), np.ones(100, dtype=np.int64)]
+    baskets = np.r_[np.arange(100), np.arange(50, 150)]
+    item_baskets = CsrMatrix.from_coo(items, baskets, (3, 150))
+
+    signatures = minhash_signatures(item_baskets, num_perm=512)
+
+    assert np.mean(signatures[:, 0] == signatures[:, 1]) == pytest.approx(
+        1 / 3, abs=0.07
+    )
+    assert (signatures[:, 2] == MERSENNE_PRIME).all()
+
+
+def test_lsh_full_recall_matches_exact(engine):
+    """При одной строке в полосе все пересекающиеся товары — кандидаты."""
+    candidates = MinHashLSH(engine.item_baskets, bands=64, rows_per_band=1).candidates()
+    dense = np.zeros((engine.n_items, engine.n_items), dtype=bool)
+    rows = np.repeat(np.arange(engine.n_items), np.diff(candidates.indptr))
+    dense[rows, candidates.indices] = True
+    assert not dense.diagonal().any()
+    assert (dense == dense.T).all()
+
+    for history, min_pair_count in [([10], 1), ([10, 30], 1), ([20], 2)]:
+        expected = brute_force_lift(BASKETS, set(history), min_pair_count, len(BASKETS))
+        result = engine.recommend(history, min_pair_count, candidates=candidates)
+        assert {r["recommended_item_id"]: r["lift"] for r in result} == pytest.approx(
+            expected
+        )
+
+
+def test_lsh_bucket_size_limit(engine):
+    lsh = MinHashLSH(engine.item_baskets, bands=64, rows_per_band=1, max_bucket_size=1)
+    assert len(lsh.candidates().indices) == 0
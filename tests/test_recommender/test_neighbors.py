@@ -0,0 +1,32 @@
+from app.recommender.neighbors import NeighborIndex, changed_items
+
+
+def test_neighbor_index_merges_lists():
+    """max(lift) по спискам товаров истории, без уже купленных и редких пар."""
+    index = NeighborIndex(
+        [
+            (1, 2, 3.0, 5),
+            (1, 3, 2.0, 5),
+            (1, 4, 1.5, 1),
+            (2, 1, 3.0, 5),
+            (2, 3, 2.5, 5),
+            (2, 5, 0.5, 5),
+        ]
+    )
+
+    assert index.recommend([1, 2], min_pair_count=2) == [
+        {"recommended_item_id": 3, "lift": 2.5},
+        {"recommended_item_id": 5, "lift": 0.5},
+    ]
+    assert index.recommend([1], min_pair_count=1, limit=2) == [
+        {"recommended_item_id": 2, "lift": 3.0},
+        {"recommended_item_id": 3, "lift": 2.0},
+    ]
+    assert index.recommend([42], min_pair_count=1) == []
+
+
+def test_changed_items_detects_reordering():
+    """Изменился состав или порядок соседей — товар отмечается."""
+    old = [(1, 2, 3.0, 5), (1, 3, 2.0, 5), (2, 1, 3.0, 5), (4, 1, 1.0, 1)]
+    new = [(1, 3, 4.0, 6), (1, 2, 3.5, 6), (2, 1, 3.5, 5), (5, 1, 1.0, 1)]
+    assert changed_items(old, new) == {1, 4, 5}
@@ -0,0 +1,37 @@
+from app.recommender.popularity import (
+    category_ancestors,
+    fallback_levels,
+    popularity_rows,
+)
+
+# 1 — корень, 2 и 3 — его дочерние категории, 4 — отдельный корень
+PARENTS = {1: None, 2: 1, 3: 1, 4: None}
+
+
+def test_category_ancestors():
+    assert category_ancestors(2, PARENTS) == [2, 1]
+    assert category_ancestors(4, PARENTS) == [4]
+    assert category_ancestors(None, PARENTS) == []
+
+
+def test_popularity_rows_roll_up_to_parents():
+    stats = [(10, 2, 5), (11, 3, 7), (12, 2, 1), (13, 4, 3)]
+
+    rows = popularity_rows(stats, PARENTS, top_n=2)
+    by_scope: dict = {}
+    for row in rows:
+        by_scope.setdefault(row["category_id"], []).append(
+            (row["rank"], row["item_id"], row["purchase_cnt"])
+        )
+
+    assert by_scope[None] == [(1, 11, 7), (2, 10, 5)]
+    assert by_scope[1] == [(1, 11, 7), (2, 10, 5)]
+    assert by_scope[2] == [(1, 10, 5), (2, 12, 1)]
+    assert by_scope[3] == [(1, 11, 7)]
+    assert by_scope[4] == [(1, 13, 3)]
+
+
+def test_fallback_levels():
+    assert fallback_levels([2, 3, 2], PARENTS) == [[2, 3], [1]]
+    assert fallback_levels([1, 2], PARENTS) == [[1, 2]]
+    assert fallback_levels([], PARENTS) == []
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.recommender.neighbors import NeighborIndex
+from app.recommender.snapshot import (
+    NeighborSnapshot,
+    current_snapshot_path,
+    write_snapshot,
+)
+
+ROWS = [
+    (1, 2, 3.0, 5),
+    (1, 3, 2.0, 5),
+    (1, 4, 1.5, 1),
+    (2, 1, 3.0, 5),
+    (2, 3, 2.5, 5),
+    (2, 5, 0.5, 5),
+    (7, 1, 4.0, 2),
+]
+
+
+@pytest.mark.parametrize(
+    "history, min_pair_count",
+    [([1], 1), ([1, 2], 2), ([7, 2], 1), ([42], 1), ([], 1)],
+)
+def test_snapshot_matches_neighbor_index(tmp_path, history, min_pair_count):
+    write_snapshot(
+        str(tmp_path), NeighborSnapshot.from_rows(ROWS, purchase_watermark=42)
+    )
+    snapshot = NeighborSnapshot.open(str(tmp_path))
+
+    assert snapshot is not None
+    assert isinstance(snapshot.neighbor_ids, np.memmap)
+    assert snapshot.purchase_watermark == 42
+    assert snapshot.recommend(history, min_pair_count) == pytest.approx(
+        NeighborIndex(ROWS).recommend(history, min_pair_count)
+    )
+
+
+def test_write_snapshot_swaps_current_atomically(tmp_path):
+    directory = str(tmp_path)
+    assert NeighborSnapshot.open(directory) is None
+
+    first = write_snapshot(directory, NeighborSnapshot.from_rows(ROWS), keep=2)
+    opened = NeighborSnapshot.open(directory)
+    assert opened is not None
+    second = write_snapshot(directory, NeighborSnapshot.from_rows(ROWS[:1]), keep=2)
+    third = write_snapshot(directory, NeighborSnapshot.from_rows(ROWS[:2]), keep=2)
+
+    assert current_snapshot_path(directory) == third
+    latest = NeighborSnapshot.open(directory)
+    assert latest is not None and len(latest.neighbor_ids) == 2
+    # Старые снимки чистятся, но уже открытый продолжает читаться
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+    assert opened.recommend([1], 1)[0]["recommended_item_id"] == 2
+    assert not [entry for entry in os.listdir(directory) if entry.startswith(".tmp")]
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from app.recommender.sparse import CsrMatrix, csr_matmul
+
+from .conftest import BASKETS, brute_force_lift
+
+
+def test_csr_gather_and_transpose():
+    m = CsrMatrix.from_coo(np.array([0, 2, 0, 1]), np.array([3, 1, 0, 2]), (3, 4))
+    assert m.indptr.tolist() == [0, 2, 3, 4]
+    assert m.indices.tolist() == [0, 3, 2, 1]
+
+    pos, owners = m.gather(np.array([2, 0]))
+    assert m.indices[pos].tolist() == [1, 0, 3]
+    assert owners.tolist() == [0, 1, 1]
+
+    t = m.transpose()
+    assert t.shape == (4, 3)
+    assert t.indices[t.indptr[0] : t.indptr[1]].tolist() == [0]
+    assert t.indices[t.indptr[3] : t.indptr[4]].tolist() == [0]
+
+
+@pytest.mark.parametrize(
+    "history, min_pair_count",
+    [
+        ([10], 1),
+        ([10, 30], 1),
+        ([20], 2),
+        ([20, 40], 2),
+        ([10, 30], 3),
+        ([50], 1),
+        ([999], 1),
+    ],
+)
+def test_sparse_engine_matches_brute_force(engine, history, min_pair_count):
+    expected = brute_force_lift(BASKETS, set(history), min_pair_count, len(BASKETS))
+    result = engine.recommend(history, min_pair_count)
+
+    assert {r["recommended_item_id"]: r["lift"] for r in result} == pytest.approx(
+        expected
+    )
+    lifts = [r["lift"] for r in result]
+    assert lifts == sorted(lifts, reverse=True)
+
+
+def test_csr_matmul_max_semiring():
+    a = CsrMatrix.from_coo(np.array([0, 0, 1]), np.array([0, 1, 1]), (2, 2))
+    b = CsrMatrix.from_coo(
+        np.array([0, 0, 1]),
+        np.array([0, 1, 1]),
+        (2, 2),
+        np.array([2.0, 5.0, 3.0]),
+    )
+    dense = np.zeros((2, 2))
+    for reduce, expected in [
+        (np.add, [[2.0, 8.0], [0.0, 3.0]]),
+        (np.maximum, [[2.0, 5.0], [0.0, 3.0]]),
+    ]:
+        c = csr_matmul(a, b, reduce=reduce)
+        dense[:] = 0
+        rows = np.repeat(np.arange(2), np.diff(c.indptr))
+        dense[rows, c.indices] = c.data
+        assert dense.tolist() == expected
+
+
+def test_recommend_all_matches_per_user(engine):
+    histories = {1: [10], 2: [10, 30], 3: [20], 4: [50]}
+    user_ids = np.array([u for u, items in histories.items() for _ in items])
+    item_ids = np.array([i for items in histories.values() for i in items])
+
+    for min_pair_count in (1, 2):
+        bulk = dict(
+            engine.recommend_all(user_ids, item_ids, min_pair_count, chunk_size=2)
+        )
+        for user_id, history in histories.items():
+            assert bulk.get(user_id, []) == pytest.approx(
+                engine.recommend(history, min_pair_count)
+            )
+
+
+def test_lift_matrix_process_pool_matches_serial(engine):
+    serial = engine.lift_matrix(1, chunk_size=2)
+    parallel = engine.lift_matrix(1, chunk_size=2, workers=2)
+
+    assert parallel.indptr.tolist() == serial.indptr.tolist()
+    assert parallel.indices.tolist() == serial.indices.tolist()
+    assert parallel.data == pytest.approx(serial.data)